@@ -1,17 +1,24 @@
 """
 Módulo principal que contiene los agentes y utilidades para el análisis de documentos.
+
+Los agentes se importan de forma perezosa: `import src` o `from src.state import DocState`
+no cargan torch, sentence-transformers, BERTopic, langchain ni abren conexiones a Milvus.
+Cada nombre de `__all__` se resuelve la primera vez que se accede a él.
 """
+import importlib
 
-from .state import DocState
-from .agent_loader import run_loader
-from .agent_metadata import run_metadata
-from .agent_summarizer import run_summarizer
-from .agent_keywords import run_keywords
-from .agent_topics import run_topics
-from .agent_structure import run_structure
-from .agent_insights import run_insights
-from .indexer_agent import run_indexer
-from .vectorizer_agent import run_vectorizer
+_LAZY_ATTRS = {
+    'DocState': '.state',
+    'run_loader': '.agent_loader',
+    'run_metadata': '.agent_metadata',
+    'run_summarizer': '.agent_summarizer',
+    'run_keywords': '.agent_keywords',
+    'run_topics': '.agent_topics',
+    'run_structure': '.agent_structure',
+    'run_insights': '.agent_insights',
+    'run_indexer': '.vector_store',
+    'run_vectorizer': '.vectorizer_agent',
+}
 
 __all__ = [
     'DocState',
@@ -24,4 +31,17 @@ __all__ = [
     'run_insights',
     'run_indexer',
     'run_vectorizer'
-] 
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # las siguientes consultas no pasan por __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -3,7 +3,7 @@ import json
 import logging
 from typing import Dict, Any, List
 from configs.openai_config import openai_llm
-from src.state import DocState
+from src.state import DocState, ENRICHMENT_FIELDS, metadata_delta
 from langchain.schema import SystemMessage, HumanMessage
 
 def extract_insights(inputs: dict) -> dict:
@@ -60,11 +60,10 @@ def extract_insights(inputs: dict) -> dict:
             logging.error(f"[InsightAgent] Error al extraer insights: {str(e)}")
             insights = []
 
-        meta = doc.get('metadata', {})
-        meta['insights'] = insights
+        meta = {**doc.get('metadata', {}), 'insights': insights}
         enriched.append({
+            'doc_id': doc.get('doc_id'),
             'title': title,
-            'text': text,
             'metadata': meta
         })
 
@@ -72,7 +71,7 @@ def extract_insights(inputs: dict) -> dict:
     logging.info(f"[InsightAgent] Añadidos insights a {len(enriched)} documentos")
     return inputs
 
-def run_insights(state: DocState) -> DocState:
+def run_insights(state: DocState) -> Dict[str, Any]:
     """
     Enriquece cada documento con insights y observaciones relevantes.
     """
@@ -83,13 +82,5 @@ def run_insights(state: DocState) -> DocState:
 
     result = extract_insights(payload)
 
-    # Actualizar los insights en cada documento
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        insights = doc_enriquecido.get("metadata", {}).get("insights", [])
-        if "metadatos" not in state:
-            state["metadatos"] = []
-        if len(state["metadatos"]) <= idx:
-            state["metadatos"].append({})
-        state["metadatos"][idx]["insights"] = insights
-
-    return state
+    # Solo el delta por documento: el reducer de 'metadatos' lo fusiona con el resto de ramas
+    return {"metadatos": metadata_delta(result["documents"], ENRICHMENT_FIELDS["InsightAgent"])}
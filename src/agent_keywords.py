@@ -2,7 +2,7 @@ import json
 import logging
 from typing import Dict, Any, List
 from configs.openai_config import openai_llm
-from src.state import DocState
+from src.state import DocState, ENRICHMENT_FIELDS, metadata_delta
 from langchain.schema import SystemMessage, HumanMessage
 
 def extract_keywords_llm(text, title):
@@ -52,28 +52,21 @@ def extract_keywords(inputs: dict) -> dict:
         title = doc.get('title')
         text = doc.get('text', '')
         keywords = extract_keywords_llm(text, title) if text else []
-        meta = doc.get('metadata', {})
-        meta['keywords'] = keywords
+        meta = {**doc.get('metadata', {}), 'keywords': keywords}
         enriched.append({
+            'doc_id': doc.get('doc_id'),
             'title': title,
-            'text': text,
             'metadata': meta
         })
     inputs['documents'] = enriched
     logging.info(f"[KeywordAgent] Añadidas keywords a {len(enriched)} documentos")
     return inputs
 
-def run_keywords(state: DocState) -> DocState:
+def run_keywords(state: DocState) -> Dict[str, Any]:
     payload = {
         "documents": state["documents"],
         "source_stats": state["source_stats"]
     }
     result = extract_keywords(payload)
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        keywords = doc_enriquecido.get("metadata", {}).get("keywords", [])
-        if "metadatos" not in state:
-            state["metadatos"] = []
-        if len(state["metadatos"]) <= idx:
-            state["metadatos"].append({})
-        state["metadatos"][idx]["keywords"] = keywords
-    return state
+    # Solo el delta por documento: el reducer de 'metadatos' lo fusiona con el resto de ramas
+    return {"metadatos": metadata_delta(result["documents"], ENRICHMENT_FIELDS["KeywordAgent"])}
@@ -9,6 +9,7 @@ from typing import Dict, Any
 # NUEVO: para metadatos nativos
 from PyPDF2 import PdfReader
 from docx import Document as DocxDocument
+from src.document_store import DocumentHandle, get_document_store
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +24,29 @@ def clean_text(text):
     text = re.sub(r'\n+', '\n', text)  # normaliza saltos de línea
     return text.strip()
 
+def store_document(path, page_texts, metadata) -> DocumentHandle:
+    """
+    Limpia cada página por separado, las une con un espacio (igual que clean_text sobre
+    el texto completo) y registra el documento en el almacén compartido con los offsets
+    de inicio de cada página.
+    """
+    parts, page_starts, offset = [], [], 0
+    for page_text in page_texts:
+        cleaned = clean_text(page_text)
+        if not cleaned:
+            continue
+        if parts:
+            offset += 1
+        page_starts.append(offset)
+        parts.append(cleaned)
+        offset += len(cleaned)
+    return get_document_store().add(
+        title=os.path.splitext(os.path.basename(path))[0],
+        text=" ".join(parts),
+        metadata=metadata,
+        page_starts=page_starts or (0,),
+    )
+
 def extract_pdf_metadata(path):
     try:
         reader = PdfReader(path)
@@ -61,6 +85,7 @@ def extract_docx_metadata(path):
 def load_document(inputs: dict) -> dict:
     """
     Carga uno o varios documentos y devuelve {'documents': [...], 'source_stats': {...}}.
+    Cada documento es un DocumentHandle del almacén compartido (src.document_store).
     """
     fp = inputs['file_path']
     if os.path.isdir(fp):
@@ -85,23 +110,16 @@ def load_document(inputs: dict) -> dict:
                 loader = PyPDFLoader(path)
                 pages = loader.load()
                 
-                # Combinar todas las páginas en un solo documento
-                combined_text = "\n".join(page.page_content for page in pages)
-                combined_text = clean_text(combined_text)
-                
                 # Extraer metadatos del PDF
                 meta_extra = extract_pdf_metadata(path)
                 
-                # Crear un solo documento con el texto combinado
-                documents.append({
-                    'title': os.path.splitext(os.path.basename(path))[0],
-                    'text': combined_text,
-                    'metadata': {
-                        'source': path,
-                        'total_pages': len(pages),
-                        **meta_extra
-                    }
-                })
+                # Un solo documento con todas las páginas (limpiadas página a página,
+                # sin construir un texto combinado intermedio)
+                documents.append(store_document(path, (page.page_content for page in pages), {
+                    'source': path,
+                    'total_pages': len(pages),
+                    **meta_extra
+                }))
                 total_pages += len(pages)
                 
             elif ext == '.txt':
@@ -113,15 +131,10 @@ def load_document(inputs: dict) -> dict:
                     with open(path, 'r', encoding='latin-1') as f:
                         content = f.read()
                 
-                content = clean_text(content)
-                documents.append({
-                    'title': os.path.splitext(os.path.basename(path))[0],
-                    'text': content,
-                    'metadata': {
-                        'source': path,
-                        'total_pages': 1
-                    }
-                })
+                documents.append(store_document(path, [content], {
+                    'source': path,
+                    'total_pages': 1
+                }))
                 total_pages += 1
                 
             elif ext in ['.docx', '.doc']:
@@ -129,34 +142,24 @@ def load_document(inputs: dict) -> dict:
                 loader = UnstructuredWordDocumentLoader(path)
                 pages = loader.load()
                 text = "".join(p.page_content for p in pages)
-                text = clean_text(text)
                 
                 meta_extra = extract_docx_metadata(path)
-                documents.append({
-                    'title': os.path.splitext(os.path.basename(path))[0],
-                    'text': text,
-                    'metadata': {
-                        'source': path,
-                        'total_pages': len(pages),
-                        **meta_extra
-                    }
-                })
+                documents.append(store_document(path, [text], {
+                    'source': path,
+                    'total_pages': len(pages),
+                    **meta_extra
+                }))
                 total_pages += len(pages)
             
             else:
                 # Otros tipos: solo limpieza
                 loader = UnstructuredWordDocumentLoader(path)
                 pages = loader.load()
-                text = clean_text("".join(p.page_content for p in pages))
                 
-                documents.append({
-                    'title': os.path.splitext(os.path.basename(path))[0],
-                    'text': text,
-                    'metadata': {
-                        'source': path,
-                        'total_pages': len(pages)
-                    }
-                })
+                documents.append(store_document(path, ["".join(p.page_content for p in pages)], {
+                    'source': path,
+                    'total_pages': len(pages)
+                }))
                 total_pages += len(pages)
             
             logger.info(f"Archivo cargado exitosamente: {path}")
@@ -180,10 +183,7 @@ def run_loader(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     try:
         result = load_document(state)
-        state["documents"] = result["documents"]
-        state["source_stats"] = result["source_stats"]
-        state.pop("file_path", None)
-        return state
+        return {"documents": result["documents"], "source_stats": result["source_stats"]}
     except Exception as e:
         logger.error(f"Error en run_loader: {str(e)}")
         raise
\ No newline at end of file
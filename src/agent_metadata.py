@@ -1,8 +1,9 @@
 import os
 import logging
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, List, Optional
 from langdetect import detect as langdetect_detect
-from src.state import DocState
+from src.state import DocState, metadata_delta
 import re
 import hashlib
 import dateparser.search
@@ -41,6 +42,21 @@ def extract_author(text: str, meta: dict):
 def compute_hash(text: str) -> str:
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
+# Protege la comprobación y el alta de hashes del set compartido entre documentos en curso
+_known_hashes_lock = threading.Lock()
+
+def register_hashes(known_hashes: set, hashes: List[str]) -> List[bool]:
+    """
+    Comprueba y añade los hashes a `known_hashes` de forma atómica. Devuelve, para cada uno,
+    si ya se había visto (en el set o antes en la misma lista).
+    """
+    duplicates = []
+    with _known_hashes_lock:
+        for doc_hash in hashes:
+            duplicates.append(doc_hash in known_hashes)
+            known_hashes.add(doc_hash)
+    return duplicates
+
 def extract_metadata(inputs: dict, known_hashes=None) -> dict:
     """
     Toma inputs={'documents': [...], 'source_stats': {...}} y en cada documento
@@ -59,13 +75,13 @@ def extract_metadata(inputs: dict, known_hashes=None) -> dict:
         dates = extract_dates(text)
         author = extract_author(text, base_meta)
         # NUEVO: hash y duplicado
-        doc_hash = compute_hash(text)
-        is_duplicate = doc_hash in known_hashes
-        known_hashes.add(doc_hash)
+        # El id del almacén de documentos ya es el SHA256 del texto
+        doc_hash = doc.get('doc_id') or compute_hash(text)
+        is_duplicate = register_hashes(known_hashes, [doc_hash])[0]
         new_meta = {**base_meta, 'language': language, 'token_count': token_count, 'dates': dates, 'author': author, 'hash': doc_hash, 'is_duplicate': is_duplicate}
         enriched.append({
+            'doc_id': doc.get('doc_id'),
             'title': doc.get('title'),
-            'text': text,
             'metadata': new_meta
         })
 
@@ -73,7 +89,7 @@ def extract_metadata(inputs: dict, known_hashes=None) -> dict:
     logging.info(f"[MetadataAgent] Enriquecidos {len(enriched)} documentos con idioma, token_count, fechas, autor y hash")
     return inputs
 
-def run_metadata(state: DocState) -> DocState:
+def run_metadata(state: DocState) -> Dict[str, Any]:
     """
     Agente que enriquece los documentos con metadatos adicionales:
     - Detección de idioma
@@ -87,17 +103,10 @@ def run_metadata(state: DocState) -> DocState:
         "documents": state["documents"],
         "source_stats": state["source_stats"]
     }
-    # Mantén un set de hashes ya vistos en el state
-    if "known_hashes" not in state:
-        state["known_hashes"] = set()
-    result = extract_metadata(payload, known_hashes=state["known_hashes"])
-    # Actualizar los metadatos en state['metadatos']
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        meta = doc_enriquecido.get("metadata", {})
-        for key in ["language", "token_count", "dates", "author", "hash", "is_duplicate"]:
-            if "metadatos" not in state:
-                state["metadatos"] = []
-            while len(state["metadatos"]) <= idx:
-                state["metadatos"].append({})
-            state["metadatos"][idx][key] = meta.get(key)
-    return state
\ No newline at end of file
+    # Set de hashes ya vistos (compartido entre documentos en el modo por documento)
+    known_hashes = state.get("known_hashes")
+    if known_hashes is None:
+        known_hashes = set()
+    result = extract_metadata(payload, known_hashes=known_hashes)
+    fields = {key: None for key in ["language", "token_count", "dates", "author", "hash", "is_duplicate"]}
+    return {"metadatos": metadata_delta(result["documents"], fields), "known_hashes": known_hashes}
\ No newline at end of file
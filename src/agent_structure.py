@@ -2,7 +2,7 @@ import json
 import logging
 from typing import Dict, Any, List
 from configs.openai_config import openai_llm
-from src.state import DocState
+from src.state import DocState, ENRICHMENT_FIELDS, metadata_delta
 from langchain.schema import SystemMessage, HumanMessage
 import re
 
@@ -89,14 +89,14 @@ def extract_structure(inputs: dict) -> dict:
             logging.error(f"[StructureAgent] Error al extraer estructura: {str(e)}")
             structure = []
 
-        meta = doc.get('metadata', {})
+        meta = dict(doc.get('metadata', {}))
         meta['structure'] = structure
         meta['auto_index'] = auto_index
         meta['structural_patterns'] = structural_patterns
         meta['references'] = references
         enriched.append({
+            'doc_id': doc.get('doc_id'),
             'title': title,
-            'text': text,
             'metadata': meta
         })
 
@@ -105,7 +105,7 @@ def extract_structure(inputs: dict) -> dict:
     return inputs
 
 
-def run_structure(state: DocState) -> DocState:
+def run_structure(state: DocState) -> Dict[str, Any]:
     """
     Enriquece cada documento con su estructura jerárquica de secciones.
     """
@@ -116,14 +116,5 @@ def run_structure(state: DocState) -> DocState:
 
     result = extract_structure(payload)
 
-    # Actualizar la estructura en cada documento
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        meta = doc_enriquecido.get("metadata", {})
-        for key in ["structure", "auto_index", "structural_patterns", "references"]:
-            if "metadatos" not in state:
-                state["metadatos"] = []
-            if len(state["metadatos"]) <= idx:
-                state["metadatos"].append({})
-            state["metadatos"][idx][key] = meta.get(key)
-
-    return state
+    # Solo el delta por documento: el reducer de 'metadatos' lo fusiona con el resto de ramas
+    return {"metadatos": metadata_delta(result["documents"], ENRICHMENT_FIELDS["StructureAgent"])}
@@ -2,21 +2,20 @@ import json
 import logging
 from typing import Dict, Any, List
 from configs.openai_config import openai_llm
-from src.state import DocState
+from src.state import DocState, ENRICHMENT_FIELDS, metadata_delta
 from langchain.schema import SystemMessage, HumanMessage
-# NUEVO: para resumen extractivo
-try:
-    from sumy.parsers.plaintext import PlaintextParser
-    from sumy.nlp.tokenizers import Tokenizer
-    from sumy.summarizers.lsa import LsaSummarizer
-    SUMY_AVAILABLE = True
-except ImportError:
-    SUMY_AVAILABLE = False
+import importlib.util
+# NUEVO: para resumen extractivo (sumy arrastra nltk, se importa solo al usarlo)
+SUMY_AVAILABLE = importlib.util.find_spec("sumy") is not None
+if not SUMY_AVAILABLE:
     logging.warning("sumy no está instalado, solo se usará resumen abstractivo.")
 
 def extractive_summary(text, num_sentences=5, language='spanish'):
     if not SUMY_AVAILABLE:
         return None
+    from sumy.parsers.plaintext import PlaintextParser
+    from sumy.nlp.tokenizers import Tokenizer
+    from sumy.summarizers.lsa import LsaSummarizer
     parser = PlaintextParser.from_string(text, Tokenizer(language))
     summarizer = LsaSummarizer()
     summary = summarizer(parser.document, num_sentences)
@@ -67,7 +66,7 @@ def summarize(inputs: dict) -> dict:
                 'error': str(e)
             }
 
-        meta = doc.get('metadata', {})
+        meta = dict(doc.get('metadata', {}))
         summary = res.get("summary")
         key_points = res.get("key_points", [])
         recommended_actions = res.get("recommended_actions", [])
@@ -78,8 +77,8 @@ def summarize(inputs: dict) -> dict:
         meta['recommended_actions'] = recommended_actions
 
         summarized.append({
+            'doc_id': doc.get('doc_id'),
             'title': title,
-            'text': text,
             'metadata': meta
         })
 
@@ -87,7 +86,7 @@ def summarize(inputs: dict) -> dict:
     logging.info(f"[SummarizerAgent] Generados resúmenes para {len(summarized)} documentos")
     return inputs
 
-def run_summarizer(state: DocState) -> DocState:
+def run_summarizer(state: DocState) -> Dict[str, Any]:
     """
     Enriquece cada documento con resúmenes, puntos clave y acciones recomendadas.
     """
@@ -98,20 +97,5 @@ def run_summarizer(state: DocState) -> DocState:
 
     result = summarize(payload)
 
-    # Actualizar los metadatos de cada documento
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        meta_enriquecido = doc_enriquecido.get("metadata", {})
-        summary_abstract = meta_enriquecido.get("summary_abstract")
-        summary_extractive = meta_enriquecido.get("summary_extractive")
-        key_points = meta_enriquecido.get("key_points", [])
-        recommended_actions = meta_enriquecido.get("recommended_actions", [])
-        if "metadatos" not in state:
-            state["metadatos"] = []
-        while len(state["metadatos"]) <= idx:
-            state["metadatos"].append({})
-        state["metadatos"][idx]["summary_abstract"] = summary_abstract
-        state["metadatos"][idx]["summary_extractive"] = summary_extractive
-        state["metadatos"][idx]["key_points"] = key_points
-        state["metadatos"][idx]["recommended_actions"] = recommended_actions
-
-    return state
+    # Solo el delta por documento: el reducer de 'metadatos' lo fusiona con el resto de ramas
+    return {"metadatos": metadata_delta(result["documents"], ENRICHMENT_FIELDS["SummarizerAgent"])}
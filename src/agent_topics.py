@@ -1,25 +1,36 @@
 import json
 import logging
+import importlib.util
 from typing import Dict, Any, List
 from configs.openai_config import openai_llm
-from src.state import DocState
+from src.state import DocState, ENRICHMENT_FIELDS, metadata_delta
 from langchain.schema import SystemMessage, HumanMessage
-# NUEVO: BERTopic multilingüe
-try:
-    from bertopic import BERTopic
-    from sentence_transformers import SentenceTransformer
-    BERTOPIC_AVAILABLE = True
-except ImportError:
-    BERTOPIC_AVAILABLE = False
+from src.model_registry import get_model, register_embedding_model
+from src.settings import TOPIC_EMBEDDING_MODEL, EMBEDDING_BACKEND
+# NUEVO: BERTopic multilingüe (solo se comprueba que está instalado; se importa al usarlo)
+BERTOPIC_AVAILABLE = (
+    importlib.util.find_spec("bertopic") is not None
+    and importlib.util.find_spec("sentence_transformers") is not None
+)
+if not BERTOPIC_AVAILABLE:
     logging.warning("BERTopic o sentence-transformers no están instalados, solo se usará el modelo LLM para topics.")
 
 def extract_topics_bertopic(texts, language='multilingual'):
     if not BERTOPIC_AVAILABLE or len(texts) < 2:
         # No usar BERTopic si hay menos de 2 documentos
         return [[] for _ in texts], [[] for _ in texts]
-    model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-    topic_model = BERTopic(language=language, embedding_model=model, calculate_probabilities=False, verbose=False)
-    topics, _ = topic_model.fit_transform(texts)
+    from bertopic import BERTopic
+    # Modelo compartido del registro: se carga una vez por proceso, no en cada llamada.
+    # Los embeddings se calculan aquí (torch u ONNX según EMBEDDING_BACKEND) y se pasan a BERTopic.
+    model = get_model(register_embedding_model(TOPIC_EMBEDDING_MODEL))
+    embeddings = model.encode(texts, show_progress_bar=False)
+    topic_model = BERTopic(
+        language=language,
+        embedding_model=model if EMBEDDING_BACKEND == "torch" else None,
+        calculate_probabilities=False,
+        verbose=False,
+    )
+    topics, _ = topic_model.fit_transform(texts, embeddings=embeddings)
     topic_info = topic_model.get_topic_info()
     topic_labels = [[topic_info.loc[topic, 'Name']] if topic in topic_info.index else [] for topic in topics]
     # Subtemas (si hay jerarquía)
@@ -30,12 +41,33 @@ def extract_topics_bertopic(texts, language='multilingual'):
         subtopics = []
     return topic_labels, [subtopics for _ in texts]
 
+def assign_corpus_topics(documents) -> List[Dict[str, Any]]:
+    """
+    Ajusta BERTopic una sola vez sobre todos los documentos y devuelve, para cada uno,
+    {'topics': [...], 'subtopics': [...]} (listas vacías si BERTopic no está disponible).
+    """
+    texts = [doc.get('text', '') for doc in documents]
+    topics_list, subtopics_list = extract_topics_bertopic(texts, language='multilingual')
+    return [{'topics': topics, 'subtopics': subtopics} for topics, subtopics in zip(topics_list, subtopics_list)]
+
 def extract_topics(inputs: dict) -> dict:
+    """
+    Temas de cada documento con BERTopic (si hay más de un documento) y, si no salen, con el LLM.
+    Con inputs['corpus_topics'] (modo por documento) se usan las asignaciones ya calculadas
+    sobre todo el corpus en lugar de ajustar BERTopic sobre estos documentos.
+    """
     docs = inputs.get('documents', [])
     enriched = []
-    texts = [doc.get('text', '') for doc in docs]
-    # BERTopic solo si hay más de 1 documento
-    topics_list, subtopics_list = extract_topics_bertopic(texts, language='multilingual') if len(docs) > 1 else ([[] for _ in docs], [[] for _ in docs])
+    corpus_topics = inputs.get('corpus_topics')
+    if corpus_topics and len(corpus_topics) == len(docs):
+        topics_list = [assigned.get('topics', []) for assigned in corpus_topics]
+        subtopics_list = [assigned.get('subtopics', []) for assigned in corpus_topics]
+    elif len(docs) > 1:
+        texts = [doc.get('text', '') for doc in docs]
+        topics_list, subtopics_list = extract_topics_bertopic(texts, language='multilingual')
+    else:
+        # BERTopic solo si hay más de 1 documento
+        topics_list, subtopics_list = [[] for _ in docs], [[] for _ in docs]
     for i, doc in enumerate(docs):
         title = doc.get('title')
         text = doc.get('text', '')
@@ -81,29 +113,43 @@ def extract_topics(inputs: dict) -> dict:
             except Exception as e:
                 logging.error(f"[TopicAgent] Error al extraer topics: {str(e)}")
                 topics = []
-        meta = doc.get('metadata', {})
-        meta['topics'] = topics
-        meta['subtopics'] = subtopics
+        meta = {**doc.get('metadata', {}), 'topics': topics, 'subtopics': subtopics}
         enriched.append({
+            'doc_id': doc.get('doc_id'),
             'title': title,
-            'text': text,
             'metadata': meta
         })
     inputs['documents'] = enriched
     logging.info(f"[TopicAgent] Añadidos topics a {len(enriched)} documentos")
     return inputs
 
-def run_topics(state: DocState) -> DocState:
+def run_topics(state: DocState) -> Dict[str, Any]:
     payload = {
         "documents": state["documents"],
-        "source_stats": state["source_stats"]
+        "source_stats": state["source_stats"],
+        "corpus_topics": state.get("corpus_topics"),
     }
     result = extract_topics(payload)
-    for idx, doc_enriquecido in enumerate(result["documents"]):
-        if "metadata" not in state["documents"][idx]:
-            state["documents"][idx]["metadata"] = {}
-        state["documents"][idx]["metadata"]["topics"] = doc_enriquecido.get("metadata", {}).get("topics", [])
-        state["documents"][idx]["metadata"]["subtopics"] = doc_enriquecido.get("metadata", {}).get("subtopics", [])
-    return state
+    # Los temas van a 'metadatos' como los demás agentes (antes se escribían dentro de
+    # state['documents'], compartido con las otras ramas en paralelo)
+    return {"metadatos": metadata_delta(result["documents"], ENRICHMENT_FIELDS["TopicModelAgent"])}
+
+
 
 
+def run_corpus_topics(state: DocState) -> Dict[str, Any]:
+    """
+    Modo por documento: cada subgrafo ve un único documento y BERTopic necesita varios, así
+    que el modelo de temas se ajusta aquí una vez sobre todo el corpus, antes del reparto, y
+    cada documento recibe su asignación en 'corpus_topics'.
+    """
+    docs = state.get("documents", [])
+    if not BERTOPIC_AVAILABLE or len(docs) < 2:
+        logging.warning(
+            f"[TopicAgent] BERTopic no se puede ajustar sobre {len(docs)} documento(s); "
+            f"los temas saldrán solo del LLM"
+        )
+        return {}
+    corpus_topics = assign_corpus_topics(docs)
+    logging.info(f"[TopicAgent] BERTopic ajustado sobre el corpus completo ({len(docs)} documentos)")
+    return {"corpus_topics": corpus_topics}
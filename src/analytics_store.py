@@ -0,0 +1,405 @@
+"""
+Índice analítico del corpus: palabras clave, temas y entidades por documento.
+
+Los resultados de KeywordAgent, TopicModelAgent y MetadataAgent solo estaban en el JSON
+de cada fila de Milvus (y, con el TextStore, en sus detalles comprimidos), así que una
+pregunta como "contratos con la palabra clave 'cláusula penal' de 2023" obligaba a leer
+los metadatos de todas las filas. Este almacén SQLite guarda una fila por documento con
+sus campos escalares y un índice invertido (faceta, valor normalizado) -> documentos para
+los campos con varios valores, y se actualiza en la ingesta (nodos de src/vector_store.py).
+
+Responde en milisegundos:
+  - documents(filters): hashes de los documentos que cumplen los filtros
+  - facets(facet, filters): recuento de documentos por valor de una faceta
+  - search_filters(filters): filtros para la búsqueda vectorial (las columnas se pasan tal
+    cual y solo las palabras clave y temas se expanden a {"doc_hash": [...]}, acotado)
+
+Filtros: {"keyword": "cláusula penal", "topic": [...], "year": 2023, "lang": "es",
+"token_count": (1000, None)}; una lista es un OR dentro de la clave, una tupla (desde, hasta)
+un rango cerrado y las claves se combinan con AND. Las palabras clave, temas y autores se
+comparan sin mayúsculas ni tildes.
+
+Uso:
+    python -m src.analytics_store facets keyword [--filter year=2023] [--limit 20]
+    python -m src.analytics_store documents --filter "keyword=cláusula penal" --filter year=2023
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.milvus_schema import SCALAR_FIELDS_BY_NAME, flatten_metadata
+from src.settings import ANALYTICS_DIR, ANALYTICS_ENABLED, ANALYTICS_MAX_FILTER_DOCS, MILVUS_COLLECTION
+
+# Faceta -> claves de los metadatos de las que sale (listas o valores sueltos)
+TERM_FACETS: Dict[str, Tuple[str, ...]] = {
+    "keyword": ("keywords",),
+    "topic": ("topics",),
+    "subtopic": ("subtopics",),
+    "author": ("author",),
+}
+# Columnas de la tabla de documentos por las que se puede filtrar y agrupar
+COLUMNS = ("title", "source", "source_folder", "lang", "author", "year", "date_min", "date_max", "token_count")
+_NUMERIC = {"year", "date_min", "date_max", "token_count"}
+# Columnas que el almacén de vectores filtra por sí mismo con la misma semántica (columnas
+# escalares o claves derivadas de milvus_schema): no hace falta expandirlas a documentos.
+# token_count no está: en los fragmentos es el del fragmento, no el del documento.
+SCALAR_FILTER_KEYS = ("title", "source", "source_folder", "lang", "year", "date_min", "date_max")
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+_SPACES = re.compile(r"\s+")
+_IN_BATCH = 500
+
+
+def normalize_term(value: Any) -> str:
+    """
+    Forma canónica de un término para el índice: minúsculas, sin tildes ni espacios repetidos.
+    """
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+def _values(meta: Dict[str, Any], keys: Tuple[str, ...]) -> List[str]:
+    values: List[str] = []
+    for key in keys:
+        raw = meta.get(key)
+        if isinstance(raw, str):
+            raw = [raw]
+        for item in raw or []:
+            if isinstance(item, dict):
+                # Algunos agentes devuelven {"topic": ..., "score": ...}
+                item = item.get("name") or item.get("topic") or item.get("keyword")
+            if item not in (None, ""):
+                values.append(str(item).strip())
+    return values
+
+
+def document_row(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fila de la tabla de documentos a partir de los metadatos aplanados de un fragmento.
+    """
+    value = lambda name: SCALAR_FIELDS_BY_NAME[name].value(meta)  # noqa: E731
+    source = str(meta.get("source") or "")
+    date_min = value("date_min")
+    return {
+        "doc_hash": value("doc_hash"),
+        "title": value("title"),
+        "source": source,
+        "source_folder": os.path.dirname(source),
+        "lang": value("lang"),
+        "author": value("author"),
+        "year": date_min // 10000 if date_min else 0,
+        "date_min": date_min,
+        "date_max": value("date_max"),
+        "token_count": value("token_count"),
+    }
+
+
+class AnalyticsStore:
+    """
+    Documentos y facetas del corpus en un fichero SQLite (uno por colección).
+    - put_documents(metadata): añade o actualiza los documentos de unos metadatos de fragmentos
+    - delete_documents(doc_hashes)
+    - documents / count / facets / search_filters: consultas (ver el docstring del módulo)
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_hash TEXT PRIMARY KEY, title TEXT, source TEXT, source_folder TEXT, lang TEXT, author TEXT,"
+            " year INTEGER, date_min INTEGER, date_max INTEGER, token_count INTEGER, updated_at REAL)"
+        )
+        for column in ("source", "source_folder", "lang", "author", "year", "date_min"):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{column} ON documents({column})")
+        # Índice invertido: (faceta, valor normalizado) -> documentos
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " facet TEXT NOT NULL, value TEXT NOT NULL, doc_hash TEXT NOT NULL, label TEXT NOT NULL,"
+            " PRIMARY KEY (facet, value, doc_hash)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_terms_doc ON terms(doc_hash)")
+        conn.commit()
+
+    # ------------------------------------------------------------------ Escritura
+    def put_documents(self, metadata: Iterable[Dict[str, Any]]) -> int:
+        """
+        Registra los documentos de unos metadatos de fragmentos (se agrupan por hash de
+        documento). Un documento ya registrado se reescribe entero, y si su fuente tenía otro
+        documento (el fichero cambió), el antiguo se borra. Devuelve los documentos escritos.
+        """
+        docs: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        for meta in flatten_metadata(list(metadata)):
+            row = document_row(meta)
+            if row["doc_hash"] and row["doc_hash"] not in docs:
+                docs[row["doc_hash"]] = (row, meta)
+        if not docs:
+            return 0
+        now = time.time()
+        with self._conn() as conn:
+            hashes = list(docs)
+            sources = sorted({row["source"] for row, _ in docs.values() if row["source"]})
+            stale = [
+                doc_hash for (doc_hash,) in self._select_in(conn, "SELECT doc_hash FROM documents WHERE source IN", sources)
+                if doc_hash not in docs
+            ]
+            self._delete(conn, stale + hashes)
+            conn.executemany(
+                f"INSERT INTO documents VALUES ({', '.join('?' * (len(COLUMNS) + 2))})",
+                [(row["doc_hash"], *(row[c] for c in COLUMNS), now) for row, _ in docs.values()],
+            )
+            terms = []
+            for doc_hash, (_, meta) in docs.items():
+                for facet, keys in TERM_FACETS.items():
+                    for label in dict.fromkeys(_values(meta, keys)):
+                        value = normalize_term(label)
+                        if value:
+                            terms.append((facet, value, doc_hash, label))
+            conn.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?, ?, ?)", terms)
+        logging.info(f"[AnalyticsStore] {len(docs)} documentos registrados ({len(stale)} versiones antiguas borradas)")
+        return len(docs)
+
+    @staticmethod
+    def _select_in(conn: sqlite3.Connection, sql: str, values: Sequence[Any]) -> List[Tuple]:
+        rows: List[Tuple] = []
+        for start in range(0, len(values), _IN_BATCH):
+            batch = list(values[start:start + _IN_BATCH])
+            rows.extend(conn.execute(f"{sql} ({','.join('?' * len(batch))})", batch).fetchall())
+        return rows
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, doc_hashes: Sequence[str]) -> None:
+        for start in range(0, len(doc_hashes), _IN_BATCH):
+            batch = list(doc_hashes[start:start + _IN_BATCH])
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM terms WHERE doc_hash IN ({placeholders})", batch)
+            conn.execute(f"DELETE FROM documents WHERE doc_hash IN ({placeholders})", batch)
+
+    def delete_documents(self, doc_hashes: Sequence[str]) -> None:
+        with self._conn() as conn:
+            self._delete(conn, list(doc_hashes))
+
+    # ------------------------------------------------------------------ Consultas
+    @staticmethod
+    def _where(filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        """
+        Cláusula WHERE sobre `documents` para unos filtros (facetas por subconsulta al índice invertido).
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        for key, value in (filters or {}).items():
+            if key in TERM_FACETS:
+                values = value if isinstance(value, (list, set, tuple)) else [value]
+                normalized = [normalize_term(v) for v in values]
+                clauses.append(
+                    f"doc_hash IN (SELECT doc_hash FROM terms WHERE facet = ? AND value IN ({','.join('?' * len(normalized))}))"
+                )
+                params.extend([key, *normalized])
+            elif key in COLUMNS or key == "doc_hash":
+                if isinstance(value, tuple):
+                    low, high = value
+                    if low is not None:
+                        clauses.append(f"{key} >= ?")
+                        params.append(low)
+                    if high is not None:
+                        clauses.append(f"{key} <= ?")
+                        params.append(high)
+                elif isinstance(value, (list, set)):
+                    clauses.append(f"{key} IN ({','.join('?' * len(value))})")
+                    params.extend(value)
+                else:
+                    clauses.append(f"{key} = ?")
+                    params.append(value)
+            else:
+                raise ValueError(f"Filtro analítico desconocido: '{key}' "
+                                 f"(usa {sorted(TERM_FACETS)} o {list(COLUMNS)}).")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def documents(self, filters: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[str]:
+        """
+        Hashes de los documentos que cumplen los filtros (los más recientes primero).
+        """
+        where, params = self._where(filters)
+        sql = f"SELECT doc_hash FROM documents{where} ORDER BY date_min DESC, doc_hash"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [doc_hash for (doc_hash,) in self._conn().execute(sql, params)]
+
+    def describe(self, doc_hashes: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Fila de cada documento con sus palabras clave, temas y autores.
+        """
+        conn = self._conn()
+        names = ["doc_hash", *COLUMNS]
+        rows = {row[0]: dict(zip(names, row)) for row in
+                self._select_in(conn, f"SELECT {', '.join(names)} FROM documents WHERE doc_hash IN", list(doc_hashes))}
+        for doc_hash, facet, label in self._select_in(
+                conn, "SELECT doc_hash, facet, label FROM terms WHERE doc_hash IN", list(rows)):
+            rows[doc_hash].setdefault(facet, []).append(label)
+        return [rows[h] for h in doc_hashes if h in rows]
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        where, params = self._where(filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+
+    def facets(self,
+               facet: str,
+               filters: Optional[Dict[str, Any]] = None,
+               limit: int = 20) -> List[Tuple[Any, int]]:
+        """
+        [(valor, nº de documentos)] de una faceta entre los documentos que cumplen los filtros,
+        de más a menos frecuente. `facet` es una faceta del índice invertido o una columna.
+        """
+        where, params = self._where(filters)
+        conn = self._conn()
+        if facet in TERM_FACETS:
+            subquery = f"AND doc_hash IN (SELECT doc_hash FROM documents{where})" if where else ""
+            rows = conn.execute(
+                f"SELECT MIN(label), COUNT(*) AS n FROM terms WHERE facet = ? {subquery}"
+                f" GROUP BY value ORDER BY n DESC, value LIMIT ?",
+                [facet, *params, limit],
+            ).fetchall()
+        elif facet in COLUMNS:
+            rows = conn.execute(
+                f"SELECT {facet}, COUNT(*) AS n FROM documents{where}"
+                f" GROUP BY {facet} ORDER BY n DESC, {facet} LIMIT ?",
+                [*params, limit],
+            ).fetchall()
+        else:
+            raise ValueError(f"Faceta desconocida: '{facet}' (usa {sorted(TERM_FACETS)} o {list(COLUMNS)}).")
+        return [(value, n) for value, n in rows]
+
+    def search_filters(self,
+                       filters: Dict[str, Any],
+                       base: Optional[Dict[str, Any]] = None,
+                       max_docs: int = ANALYTICS_MAX_FILTER_DOCS) -> Optional[Dict[str, Any]]:
+        """
+        Filtros para la búsqueda vectorial: `base` más las facetas de `filters`. None si
+        ningún documento las cumple (no hace falta buscar).
+        - Las columnas (year, lang, source_folder...) pasan tal cual como filtros escalares.
+        - El autor se traduce a sus valores exactos en la columna `author`.
+        - Palabras clave, temas y subtemas se expanden a {"doc_hash": [...]}, con como mucho
+          `max_docs` documentos (los más recientes): una faceta muy amplia no produce una
+          expresión arbitrariamente larga en cada búsqueda.
+        """
+        if not self.count(filters):
+            return None
+        merged = dict(base or {})
+        expand: Dict[str, Any] = {}
+        for key, value in filters.items():
+            if key in SCALAR_FILTER_KEYS and key not in merged:
+                merged[key] = value
+            elif key == "author" and key not in merged:
+                authors = self._column_values("author", {key: value})
+                if len(authors) <= max_docs:
+                    merged[key] = authors
+                else:
+                    expand[key] = value
+            else:
+                expand[key] = value
+        if not expand:
+            return merged
+
+        # Se acotan con el resto de facetas para que la lista sea lo más corta posible
+        doc_hashes = self.documents(filters, limit=max_docs + 1)
+        if len(doc_hashes) > max_docs:
+            logging.warning(
+                f"[AnalyticsStore] Las facetas {sorted(expand)} coinciden con {self.count(filters)} documentos; "
+                f"la búsqueda se limita a los {max_docs} más recientes (ANALYTICS_MAX_FILTER_DOCS)"
+            )
+            doc_hashes = doc_hashes[:max_docs]
+        return {**merged, "doc_hash": doc_hashes}
+
+    def _column_values(self, column: str, filters: Dict[str, Any]) -> List[Any]:
+        # Valores distintos de una columna entre los documentos que cumplen los filtros
+        where, params = self._where(filters)
+        return [value for (value,) in self._conn().execute(
+            f"SELECT DISTINCT {column} FROM documents{where} ORDER BY {column}", params
+        )]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        facets = dict(conn.execute("SELECT facet, COUNT(DISTINCT value) FROM terms GROUP BY facet").fetchall())
+        return {
+            "path": self.path,
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "distinct_values": facets,
+            "size_mb": round(os.path.getsize(self.path) / 1e6, 3) if os.path.exists(self.path) else 0.0,
+        }
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_stores: Dict[str, AnalyticsStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_analytics_store(collection_name: str = MILVUS_COLLECTION) -> Optional[AnalyticsStore]:
+    """
+    Índice analítico de una colección (None si ANALYTICS_ENABLED=false).
+    """
+    if not ANALYTICS_ENABLED:
+        return None
+    with _stores_lock:
+        if collection_name not in _stores:
+            path = os.path.join(ANALYTICS_DIR, f"{_UNSAFE_CHARS.sub('_', collection_name)}.sqlite")
+            _stores[collection_name] = AnalyticsStore(path)
+        return _stores[collection_name]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.search_service import parse_filters
+
+    parser = argparse.ArgumentParser(description="Consultas al índice analítico del corpus")
+    parser.add_argument("--collection", default=MILVUS_COLLECTION)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_facets = sub.add_parser("facets", help="Documentos por valor de una faceta")
+    p_facets.add_argument("facet", help=f"{sorted(TERM_FACETS)} o una columna {list(COLUMNS)}")
+    p_facets.add_argument("--limit", type=int, default=20)
+    p_docs = sub.add_parser("documents", help="Documentos que cumplen los filtros")
+    p_docs.add_argument("--limit", type=int, default=50)
+    for p in (p_facets, p_docs):
+        p.add_argument("--filter", action="append", default=[], dest="filters",
+                       help="clave=valor, clave=v1,v2 o clave=desde:hasta (repetible)")
+    args = parser.parse_args(argv)
+
+    store = AnalyticsStore(os.path.join(ANALYTICS_DIR, f"{_UNSAFE_CHARS.sub('_', args.collection)}.sqlite"))
+    filters = parse_filters(args.filters)
+    start = time.perf_counter()
+    if args.command == "facets":
+        result: Any = [{"value": value, "documents": n} for value, n in store.facets(args.facet, filters, args.limit)]
+    else:
+        result = store.describe(store.documents(filters, limit=args.limit))
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+    print(json.dumps({"filters": filters, "elapsed_ms": elapsed_ms, "total": store.count(filters), "result": result},
+                     indent=2, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
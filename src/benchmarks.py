@@ -0,0 +1,676 @@
+"""
+Benchmarks de rendimiento del pipeline.
+
+Uso:
+    python -m src.benchmarks import-time [--budget 1.0]
+    python -m src.benchmarks embedding-backends [--texts 512] [--threshold 0.95]
+    python -m src.benchmarks embedding-pool [--texts 10000] [--workers 1 2 4 8]
+    python -m src.benchmarks vector-storage [--vectors 20000] [--queries 200] [--top-k 10]
+    python -m src.benchmarks milvus-index [--queries 100] [--top-k 10]   (requiere Milvus)
+    python -m src.benchmarks filtered-search --collections v2 v3 [--queries 100]   (requiere Milvus)
+    python -m src.benchmarks local-store [--vectors 200000] [--queries 100] [--top-k 10]
+    python -m src.benchmarks state-merge [--docs 500] [--text-chars 50000] [--min-saved-ratio 0.9]
+    python -m src.benchmarks node-pool [--docs 40] [--branches 4] [--workers 4]
+
+Cada benchmark imprime sus métricas en JSON y termina con código 1 si no se cumple
+el presupuesto fijado, de modo que puede usarse como guarda en CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos pesados que no deben cargarse al importar el paquete ni el estado
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "bertopic",
+    "langchain",
+    "langchain_core",
+    "langgraph",
+    "pymilvus",
+    "transformers",
+]
+
+# Sentencias de importación "ligeras" que deben ser rápidas y sin efectos secundarios
+LIGHT_IMPORTS = [
+    "import src",
+    "from src.state import DocState",
+    "from src.model_registry import registry",
+    # El almacén local de vectores no necesita pymilvus ni un servidor
+    "from src.vector_store import LocalVectorStore",
+    # El servicio de búsqueda carga el modelo y el almacén en la primera consulta
+    "from src.search_service import SearchService",
+]
+
+
+def benchmark_import_time(statements: Optional[List[str]] = None, budget_s: float = 1.0, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Mide, en un intérprete limpio por repetición, el tiempo de cada sentencia de importación
+    y qué módulos pesados arrastra. Se queda con el mejor tiempo de las repeticiones.
+    """
+    statements = statements or LIGHT_IMPORTS
+    probe = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        "{stmt}\n"
+        "elapsed = time.perf_counter() - t0\n"
+        "heavy = [m for m in {heavy!r} if m in sys.modules]\n"
+        "print(json.dumps({{'elapsed_s': elapsed, 'heavy_modules': heavy}}))\n"
+    )
+    results = {}
+    ok = True
+    for stmt in statements:
+        best = None
+        heavy: List[str] = []
+        error = None
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, "-c", probe.format(stmt=stmt, heavy=HEAVY_MODULES)],
+                capture_output=True, text=True, cwd=PROJECT_ROOT
+            )
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "error desconocido"
+                break
+            data = json.loads(proc.stdout.strip().splitlines()[-1])
+            heavy = data["heavy_modules"]
+            best = data["elapsed_s"] if best is None else min(best, data["elapsed_s"])
+        passed = error is None and best is not None and best <= budget_s and not heavy
+        ok = ok and passed
+        results[stmt] = {
+            "elapsed_s": round(best, 4) if best is not None else None,
+            "heavy_modules": heavy,
+            "error": error,
+            "passed": passed,
+        }
+    return {"budget_s": budget_s, "passed": ok, "imports": results}
+
+
+# Corpus fijo (frases de tipo contractual) para que las mediciones sean comparables entre ejecuciones
+BENCHMARK_SENTENCES = [
+    "El arrendatario se obliga a abonar la renta mensual dentro de los cinco primeros días de cada mes.",
+    "La presente cláusula penal será exigible en caso de incumplimiento de cualquiera de las obligaciones.",
+    "Las partes se someten a los juzgados y tribunales de Madrid con renuncia a su propio fuero.",
+    "El vendedor garantiza que la finca se encuentra libre de cargas, gravámenes y arrendatarios.",
+    "Este contrato entrará en vigor en la fecha de su firma y tendrá una duración de un año prorrogable.",
+    "Cualquier modificación del presente acuerdo deberá formalizarse por escrito y firmarse por ambas partes.",
+    "The licensee shall not sublicense, assign or transfer any rights granted under this agreement.",
+    "Confidential information excludes information that is publicly available through no fault of the recipient.",
+    "El trabajador tendrá derecho a treinta días naturales de vacaciones retribuidas por año de servicio.",
+    "La sociedad responderá de las deudas sociales con todo su patrimonio presente y futuro.",
+    "En caso de fuerza mayor, los plazos de ejecución quedarán suspendidos mientras dure la causa.",
+    "El prestatario podrá amortizar anticipadamente el préstamo abonando una comisión del uno por ciento.",
+]
+
+
+def fixed_corpus(n_texts: int) -> List[str]:
+    """
+    Corpus determinista de `n_texts` textos de longitudes variadas.
+    """
+    corpus = []
+    for i in range(n_texts):
+        base = BENCHMARK_SENTENCES[i % len(BENCHMARK_SENTENCES)]
+        repeat = 1 + (i * 7) % 6
+        corpus.append(f"Artículo {i + 1}. " + " ".join([base] * repeat))
+    return corpus
+
+
+def benchmark_embedding_backends(model_name: Optional[str] = None,
+                                 n_texts: int = 512,
+                                 batch_size: int = 32,
+                                 threshold: float = 0.95) -> Dict[str, Any]:
+    """
+    Compara el backend torch con el ONNX int8 sobre el corpus fijo:
+    - paridad: coseno fila a fila entre ambos vectores normalizados (mínimo >= threshold)
+    - rendimiento: textos/s de cada backend tras una pasada de calentamiento
+    """
+    import numpy as np
+    from src.model_registry import get_model, register_embedding_model
+    from src.settings import EMBEDDING_MODEL
+
+    model_name = model_name or EMBEDDING_MODEL
+    corpus = fixed_corpus(n_texts)
+    vectors = {}
+    report: Dict[str, Any] = {"model": model_name, "texts": n_texts, "batch_size": batch_size}
+    for backend in ("torch", "onnx"):
+        model = get_model(register_embedding_model(model_name, backend))
+        model.encode(corpus[:batch_size], batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+        start = time.perf_counter()
+        vecs = model.encode(corpus, batch_size=batch_size, convert_to_numpy=True,
+                            normalize_embeddings=True, show_progress_bar=False)
+        elapsed = time.perf_counter() - start
+        vectors[backend] = np.asarray(vecs, dtype=np.float32)
+        report[backend] = {"elapsed_s": round(elapsed, 3), "texts_per_s": round(n_texts / elapsed, 1)}
+
+    cosine = np.sum(vectors["torch"] * vectors["onnx"], axis=1)
+    report["parity"] = {
+        "min_cosine": round(float(cosine.min()), 5),
+        "mean_cosine": round(float(cosine.mean()), 5),
+        "threshold": threshold,
+    }
+    report["speedup"] = round(report["torch"]["elapsed_s"] / max(report["onnx"]["elapsed_s"], 1e-9), 2)
+    report["passed"] = bool(cosine.min() >= threshold)
+    return report
+
+
+def benchmark_embedding_pool(workers_list: Optional[List[int]] = None,
+                             n_texts: int = 10000,
+                             batch_size: int = 32) -> Dict[str, Any]:
+    """
+    Escalado del pool de procesos: textos/s con 1 proceso (codificación local) y con
+    cada número de trabajadores de `workers_list`, sobre el corpus fijo.
+    El arranque del pool (carga del modelo en cada trabajador) se excluye de la medida.
+    """
+    from src.embedding_pool import EmbeddingPool
+    from src.model_registry import get_model, register_embedding_model
+    from src.settings import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_POOL_CHUNK
+
+    workers_list = workers_list or [2, 4]
+    corpus = fixed_corpus(n_texts)
+    report: Dict[str, Any] = {"model": EMBEDDING_MODEL, "backend": EMBEDDING_BACKEND, "texts": n_texts, "runs": {}}
+
+    model = get_model(register_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND))
+    start = time.perf_counter()
+    model.encode(corpus, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+    baseline = time.perf_counter() - start
+    report["runs"]["1"] = {"elapsed_s": round(baseline, 3), "texts_per_s": round(n_texts / baseline, 1), "speedup": 1.0}
+
+    for workers in workers_list:
+        with EmbeddingPool(EMBEDDING_MODEL, EMBEDDING_BACKEND, workers,
+                           chunk_size=EMBEDDING_POOL_CHUNK, min_texts=0) as pool:
+            pool.encode(corpus[:workers * 2], batch_size=batch_size)  # arranque y calentamiento
+            start = time.perf_counter()
+            pool.encode(corpus, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+        report["runs"][str(workers)] = {
+            "elapsed_s": round(elapsed, 3),
+            "texts_per_s": round(n_texts / elapsed, 1),
+            "speedup": round(baseline / elapsed, 2),
+        }
+    return report
+
+
+def synthetic_embeddings(n_vectors: int, dim: int = 384, intrinsic_dim: int = 48, seed: int = 0):
+    """
+    Vectores normalizados con la estructura típica de los embeddings de frases: la mayor
+    parte de la varianza en pocas direcciones, algo de ruido isótropo y un sesgo común.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    scales = np.linspace(1.0, 0.2, intrinsic_dim)
+    latent = rng.standard_normal((n_vectors, intrinsic_dim)) * scales
+    mixing = np.linalg.qr(rng.standard_normal((dim, intrinsic_dim)))[0].T
+    vectors = latent @ mixing + 0.05 * rng.standard_normal((n_vectors, dim)) + 0.1 * rng.standard_normal(dim)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def benchmark_vector_storage(n_vectors: int = 20000,
+                             n_queries: int = 200,
+                             top_k: int = 10,
+                             pca_dims: Optional[List[int]] = None,
+                             rerank_factors: Optional[List[int]] = None,
+                             source: str = "synthetic",
+                             min_recall: float = 0.95) -> Dict[str, Any]:
+    """
+    Recall@k y memoria de cada representación de VECTOR_STORAGE frente a float32.
+    La búsqueda es exacta (NumPy), así que solo se mide la pérdida por la representación,
+    no la del índice IVF. Las consultas son vectores del corpus con ruido añadido.
+    El benchmark falla si float16 o bfloat16 bajan de `min_recall`.
+    """
+    import numpy as np
+    from src.vector_utils import (
+        PCAProjector, binarize, from_bfloat16_bits, hamming_distances, to_bfloat16_bits,
+    )
+
+    pca_dims = pca_dims or [128, 64]
+    rerank_factors = rerank_factors or [1, 4, 10]
+    if source == "model":
+        from src.model_registry import get_model, register_embedding_model
+        from src.settings import EMBEDDING_MODEL, EMBEDDING_BACKEND
+        model = get_model(register_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND))
+        corpus = model.encode(fixed_corpus(n_vectors), convert_to_numpy=True,
+                              normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+    else:
+        corpus = synthetic_embeddings(n_vectors)
+    rng = np.random.default_rng(1)
+    queries = corpus[rng.choice(len(corpus), n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    dim = corpus.shape[1]
+
+    def top(scores: np.ndarray, k: int) -> np.ndarray:
+        return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+    truth = top(queries @ corpus.T, top_k)
+
+    def recall(found: np.ndarray) -> float:
+        return round(float(np.mean([len(set(t) & set(f)) / top_k for t, f in zip(truth, found)])), 4)
+
+    def entry(found: np.ndarray, bytes_per_vector: float, **extra) -> Dict[str, Any]:
+        return {
+            "recall_at_k": recall(found),
+            "bytes_per_vector": bytes_per_vector,
+            "memory_mb": round(bytes_per_vector * n_vectors / 1e6, 2),
+            "memory_ratio": round(bytes_per_vector / (4 * dim), 4),
+            **extra,
+        }
+
+    options: Dict[str, Any] = {"float32": entry(truth, 4 * dim)}
+    options["float16"] = entry(top(queries @ corpus.astype(np.float16).astype(np.float32).T, top_k), 2 * dim)
+    options["bfloat16"] = entry(top(queries @ from_bfloat16_bits(to_bfloat16_bits(corpus)).T, top_k), 2 * dim)
+
+    codes, query_codes = binarize(corpus), binarize(queries)
+    hamming = np.vstack([hamming_distances(query_codes[i:i + 32], codes) for i in range(0, n_queries, 32)])
+    for factor in rerank_factors:
+        candidates = np.argsort(hamming, axis=1, kind="stable")[:, :top_k * factor]
+        # Re-ranking de los candidatos con los vectores float (fuera de la colección)
+        rescored = np.einsum("qd,qkd->qk", queries, corpus[candidates])
+        found = np.take_along_axis(candidates, top(rescored, top_k), axis=1)
+        options[f"binary_rerank_x{factor}"] = entry(found, dim / 8, candidates=top_k * factor)
+
+    for pca_dim in pca_dims:
+        projector = PCAProjector.fit(corpus, pca_dim)
+        found = top(projector.transform(queries) @ projector.transform(corpus).T, top_k)
+        options[f"pca_{pca_dim}"] = entry(found, 4 * pca_dim,
+                                          explained_variance=round(projector.explained_variance_ratio, 4))
+
+    passed = options["float16"]["recall_at_k"] >= min_recall and options["bfloat16"]["recall_at_k"] >= min_recall
+    return {
+        "source": source,
+        "vectors": n_vectors,
+        "queries": n_queries,
+        "dim": dim,
+        "top_k": top_k,
+        "min_recall": min_recall,
+        "options": options,
+        "passed": passed,
+    }
+
+
+def benchmark_milvus_index(n_queries: int = 100, top_k: int = 10) -> Dict[str, Any]:
+    """
+    Estado del índice de la colección configurada (tipo, parámetros, última construcción)
+    y latencia de IndexerAgent.search con consultas sintéticas de una en una.
+    """
+    import numpy as np
+    from src.indexer_agent import IndexerAgent
+
+    agent = IndexerAgent()
+    queries = synthetic_embeddings(n_queries, dim=agent.input_dim, seed=2)
+    agent.search(queries[:1], top_k=top_k)  # calentamiento
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        agent.search(query[None, :], top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    values = np.asarray(latencies)
+    return {
+        "storage": agent.storage,
+        "index": agent.index_manager.report(),
+        "search": {
+            "queries": n_queries,
+            "top_k": top_k,
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "mean_ms": round(float(values.mean()), 3),
+        },
+    }
+
+
+# Filtros típicos de la aplicación (idioma, rango de fechas, autor) para medir su coste
+BENCHMARK_FILTERS = {
+    "sin_filtro": None,
+    "idioma": {"lang": "es"},
+    "idioma_y_tokens": {"lang": "es", "token_count": (200, None)},
+    "autor": {"author": "Desconocido"},
+    "fuente": {"source": ["contrato.pdf", "anexo.pdf"]},
+}
+
+
+def _latency_stats(latencies: List[float]) -> Dict[str, float]:
+    import numpy as np
+    values = np.asarray(latencies)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def benchmark_filtered_search(collections: List[str], n_queries: int = 100, top_k: int = 10) -> Dict[str, Any]:
+    """
+    Latencia de búsqueda con filtros por metadatos en varias colecciones (p. ej. la antigua,
+    con todo en JSON, y la migrada con columnas tipadas). El filtro se traduce a la columna
+    escalar si existe o a la ruta JSON equivalente. Los filtros que la colección no admite
+    (p. ej. fechas en una colección solo JSON) se indican como no soportados.
+    """
+    from src.indexer_agent import IndexerAgent
+
+    report: Dict[str, Any] = {"queries": n_queries, "top_k": top_k, "collections": {}}
+    for name in collections:
+        agent = IndexerAgent(collection_name=name)
+        queries = synthetic_embeddings(n_queries, dim=agent.input_dim, seed=3)
+        agent.search(queries[:1], top_k=top_k)  # calentamiento
+        results: Dict[str, Any] = {}
+        filters = dict(BENCHMARK_FILTERS, fechas={"date_min": (20200101, 20241231)})
+        for label, flt in filters.items():
+            latencies = []
+            try:
+                for query in queries:
+                    start = time.perf_counter()
+                    agent.search(query[None, :], top_k=top_k, filters=flt)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            except ValueError as e:
+                results[label] = {"supported": False, "error": str(e)}
+                continue
+            results[label] = _latency_stats(latencies)
+        report["collections"][name] = {
+            "fields": [field.name for field in agent.collection.schema.fields],
+            "filters": results,
+        }
+    return report
+
+
+def benchmark_local_store(n_vectors: int = 200_000,
+                          n_queries: int = 100,
+                          top_k: int = 10,
+                          dim: int = 384,
+                          min_recall: float = 0.9) -> Dict[str, Any]:
+    """
+    Almacén local (VECTOR_STORE_BACKEND=local) sobre vectores sintéticos en un directorio
+    temporal: tiempo de inserción, latencia p50/p95 por fuerza bruta y con IVF, recall@k
+    del IVF frente a la búsqueda exacta y latencia con un filtro escalar.
+    El benchmark falla si el recall del IVF baja de `min_recall`; necesita al menos
+    IVF_MIN_TRAIN_ROWS vectores (por debajo el almacén no entrena el IVF).
+    """
+    import tempfile
+    import numpy as np
+    from src.vector_store import LocalVectorStore
+
+    corpus = synthetic_embeddings(n_vectors, dim=dim)
+    rng = np.random.default_rng(4)
+    queries = corpus[rng.choice(n_vectors, n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    metadata = [
+        {"doc_id": f"doc-{i // 20}", "chunk_index": i % 20, "char_start": i, "char_end": i + 1,
+         "language": {"lang": "es" if i % 4 else "en"}, "source": f"bench/doc-{i // 20}.pdf"}
+        for i in range(n_vectors)
+    ]
+
+    def timed_search(store: LocalVectorStore, **kwargs):
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = store.search(query[None, :], top_k=top_k, **kwargs)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append({hit["id"] for hit in hits})
+        return latencies, found
+
+    with tempfile.TemporaryDirectory() as root:
+        store = LocalVectorStore("benchmark", root=root, ivf_min_rows=n_vectors + 1, text_store=False)
+        start = time.perf_counter()
+        store.insert(corpus, metadata)
+        insert_s = time.perf_counter() - start
+        store.search(queries[:1], top_k=top_k)  # calentamiento
+        exact_latencies, truth = timed_search(store)
+        filtered_latencies, _ = timed_search(store, filters={"lang": "en"})
+        ivf = store.train_ivf()
+        ivf_latencies, found = timed_search(store)
+        recall = float(np.mean([len(t & f) / top_k for t, f in zip(truth, found)]))
+        stats = store.stats()
+
+    return {
+        "vectors": n_vectors,
+        "dim": dim,
+        "queries": n_queries,
+        "top_k": top_k,
+        "insert_s": round(insert_s, 3),
+        "vectors_mb": stats["vectors_mb"],
+        "exact": _latency_stats(exact_latencies),
+        "exact_filtered_lang": _latency_stats(filtered_latencies),
+        "ivf": dict(_latency_stats(ivf_latencies), nlist=ivf["nlist"], build_time_s=ivf["build_time_s"],
+                    recall_at_k=round(recall, 4)),
+        "min_recall": min_recall,
+        "passed": recall >= min_recall,
+    }
+
+
+def benchmark_state_merge(n_docs: int = 500, text_chars: int = 50_000,
+                          min_saved_ratio: float = 0.9) -> Dict[str, Any]:
+    """
+    Fusión de las salidas de los cinco agentes de enriquecimiento en paralelo con el reducer
+    de 'metadatos' (src/state.py), sobre documentos sintéticos (la corrección de la fusión
+    la comprueba tests/test_state.py):
+      - bytes que cada rama entrega al grafo (serializados, como los copiaría un checkpointer
+        o un pool de procesos): delta frente al estado completo que devolvían antes
+      - memoria pico y tiempo de la fusión de los deltas
+      - passed: los deltas ahorran al menos `min_saved_ratio` de esos bytes
+    """
+    import pickle
+    import random
+    import tracemalloc
+    from src.state import ENRICHMENT_FIELDS, metadata_delta, update_metadatos
+
+    rng = random.Random(7)
+    documents = [
+        {"title": f"doc-{i}", "text": "".join(rng.choice("abcdefghij ") for _ in range(200)) * (text_chars // 200),
+         "metadata": {"source": f"bench/doc-{i}.pdf", "total_pages": 3}}
+        for i in range(n_docs)
+    ]
+    # Lo que produce cada agente: sus campos en el 'metadata' de documentos enriquecidos
+    enriched = {
+        agent: [{"title": doc["title"], "text": doc["text"],
+                 "metadata": {**doc["metadata"], **{key: f"{agent}:{key}:{i}" for key in keys}}}
+                for i, doc in enumerate(documents)]
+        for agent, keys in ENRICHMENT_FIELDS.items()
+    }
+    deltas = {agent: metadata_delta(docs, ENRICHMENT_FIELDS[agent]) for agent, docs in enriched.items()}
+    base = [{"hash": f"h{i}", "token_count": 10} for i in range(n_docs)]
+
+    def merge() -> List[Dict[str, Any]]:
+        merged = update_metadatos(None, [dict(meta) for meta in base])
+        for agent in ENRICHMENT_FIELDS:
+            merged = update_metadatos(merged, deltas[agent])
+        return merged
+
+    delta_bytes = {agent: len(pickle.dumps({"metadatos": delta})) for agent, delta in deltas.items()}
+    full_state = {"documents": documents, "source_stats": {"documents": n_docs}, "metadatos": merge()}
+    full_bytes = len(pickle.dumps(full_state))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    merge()
+    merge_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_delta = sum(delta_bytes.values())
+    saved_ratio = 1 - total_delta / (full_bytes * len(ENRICHMENT_FIELDS))
+    return {
+        "documents": n_docs,
+        "text_chars": text_chars,
+        "branches": len(ENRICHMENT_FIELDS),
+        "delta_bytes": delta_bytes,
+        "delta_bytes_total": total_delta,
+        "full_state_bytes_total": full_bytes * len(ENRICHMENT_FIELDS),
+        "bytes_saved_ratio": round(saved_ratio, 4),
+        "merge_ms": round(merge_ms, 3),
+        "merge_peak_mb": round(peak / 1e6, 3),
+        "min_saved_ratio": min_saved_ratio,
+        "passed": bool(saved_ratio >= min_saved_ratio),
+    }
+
+
+def _scan_sections_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Nodo CPU-bound de prueba (escaneo de encabezados como StructureAgent); a nivel de
+    módulo para que el pool de procesos pueda serializarlo por referencia.
+    """
+    from src.chunker import split_sections
+    from src.state import metadata_delta
+    enriched = []
+    for doc in state["documents"]:
+        sections = split_sections(doc["text"])
+        words = sum(len(page.split()) for page in doc.pages())
+        enriched.append({"doc_id": doc["doc_id"], "metadata": {"sections": len(sections), "words": words}})
+    return {"metadatos": metadata_delta(enriched, {"sections": 0, "words": 0})}
+
+
+def benchmark_node_pool(n_docs: int = 40, text_chars: int = 200_000,
+                        branches: int = 4, workers: int = 4) -> Dict[str, Any]:
+    """
+    Ramas CPU-bound del grafo en hilos frente al pool de procesos de nodos (src/node_pool.py):
+    `branches` ramas en paralelo ejecutan el mismo nodo de escaneo sobre los documentos
+    (DocumentHandle del almacén compartido).
+      - passed: los deltas del pool son idénticos a los de los hilos
+      - tiempo de las ramas en hilos y en procesos (sin contar el arranque del pool)
+      - bytes enviados a un trabajador por rama (handles con su texto)
+    """
+    import pickle
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from src.document_store import get_document_store
+    from src.node_pool import NodePool
+
+    rng = random.Random(11)
+    store = get_document_store()
+    vocabulary = ["contrato", "partes", "servicio", "plazo", "pago", "acuerdo", "cliente", "proveedor"]
+    documents = []
+    for i in range(n_docs):
+        parts, length = [], 0
+        while length < text_chars:
+            part = (f"CLÁUSULA {len(parts) + 1}. "
+                    + " ".join(rng.choice(vocabulary) for _ in range(60)) + ".")
+            parts.append(part)
+            length += len(part) + 1
+        text = " ".join(parts)
+        documents.append(store.add(f"doc-{i}", text, {"source": f"bench/doc-{i}.pdf"},
+                                   page_starts=range(0, len(text), max(1, len(text) // 5))))
+    payload = {"documents": documents, "source_stats": {"documents": n_docs}}
+
+    def run_branches(call) -> List[Dict[str, Any]]:
+        with ThreadPoolExecutor(max_workers=branches) as executor:
+            return list(executor.map(lambda _: call(payload), range(branches)))
+
+    start = time.perf_counter()
+    threaded = run_branches(_scan_sections_node)
+    threads_s = time.perf_counter() - start
+
+    with NodePool([], workers) as pool:
+        pool.run(_scan_sections_node, {"documents": documents[:1]})  # arranque y calentamiento
+        start = time.perf_counter()
+        pooled = run_branches(lambda state: pool.run(_scan_sections_node, state))
+        processes_s = time.perf_counter() - start
+
+    return {
+        "documents": n_docs,
+        "text_chars": text_chars,
+        "branches": branches,
+        "workers": workers,
+        "threads_s": round(threads_s, 3),
+        "processes_s": round(processes_s, 3),
+        "speedup": round(threads_s / processes_s, 2),
+        "payload_bytes": len(pickle.dumps(payload)),
+        "result_bytes": len(pickle.dumps(pooled[0])),
+        "passed": pooled == threaded,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de rendimiento del pipeline")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p_import = sub.add_parser("import-time", help="Tiempo de importación del paquete src")
+    p_import.add_argument("--budget", type=float, default=1.0, help="Tiempo máximo por importación (s)")
+    p_import.add_argument("--repeat", type=int, default=3)
+
+    p_backends = sub.add_parser("embedding-backends", help="Paridad y rendimiento torch vs ONNX int8")
+    p_backends.add_argument("--model", default=None)
+    p_backends.add_argument("--texts", type=int, default=512)
+    p_backends.add_argument("--batch-size", type=int, default=32)
+    p_backends.add_argument("--threshold", type=float, default=0.95, help="Coseno mínimo aceptable")
+
+    p_pool = sub.add_parser("embedding-pool", help="Escalado del pool de procesos de embeddings")
+    p_pool.add_argument("--texts", type=int, default=10000)
+    p_pool.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    p_pool.add_argument("--batch-size", type=int, default=32)
+
+    p_storage = sub.add_parser("vector-storage", help="Recall y memoria de cada representación de vectores")
+    p_storage.add_argument("--vectors", type=int, default=20000)
+    p_storage.add_argument("--queries", type=int, default=200)
+    p_storage.add_argument("--top-k", type=int, default=10)
+    p_storage.add_argument("--pca-dims", type=int, nargs="+", default=[128, 64])
+    p_storage.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 4, 10])
+    p_storage.add_argument("--source", choices=["synthetic", "model"], default="synthetic",
+                           help="Vectores sintéticos o embeddings reales del corpus fijo")
+    p_storage.add_argument("--min-recall", type=float, default=0.95, help="Recall mínimo de float16/bfloat16")
+
+    p_index = sub.add_parser("milvus-index", help="Índice de la colección y latencia de búsqueda (requiere Milvus)")
+    p_index.add_argument("--queries", type=int, default=100)
+    p_index.add_argument("--top-k", type=int, default=10)
+
+    p_filtered = sub.add_parser("filtered-search", help="Latencia de búsquedas filtradas por metadatos (requiere Milvus)")
+    p_filtered.add_argument("--collections", nargs="+", required=True)
+    p_filtered.add_argument("--queries", type=int, default=100)
+    p_filtered.add_argument("--top-k", type=int, default=10)
+
+    p_local = sub.add_parser("local-store", help="Inserción, latencia y recall del almacén local de vectores")
+    p_local.add_argument("--vectors", type=int, default=200_000)
+    p_local.add_argument("--queries", type=int, default=100)
+    p_local.add_argument("--top-k", type=int, default=10)
+    p_local.add_argument("--min-recall", type=float, default=0.9, help="Recall mínimo del IVF")
+
+    p_merge = sub.add_parser("state-merge", help="Fusión de los deltas de los agentes en paralelo (reducers del estado)")
+    p_merge.add_argument("--docs", type=int, default=500)
+    p_merge.add_argument("--text-chars", type=int, default=50_000)
+    p_merge.add_argument("--min-saved-ratio", type=float, default=0.9, help="Ahorro mínimo de bytes de los deltas")
+
+    p_nodes = sub.add_parser("node-pool", help="Ramas CPU-bound del grafo en hilos frente a procesos")
+    p_nodes.add_argument("--docs", type=int, default=40)
+    p_nodes.add_argument("--text-chars", type=int, default=200_000)
+    p_nodes.add_argument("--branches", type=int, default=4)
+    p_nodes.add_argument("--workers", type=int, default=4)
+
+    args = parser.parse_args(argv)
+    if args.benchmark == "import-time":
+        report = benchmark_import_time(budget_s=args.budget, repeat=args.repeat)
+    elif args.benchmark == "embedding-backends":
+        report = benchmark_embedding_backends(args.model, n_texts=args.texts,
+                                              batch_size=args.batch_size, threshold=args.threshold)
+    elif args.benchmark == "embedding-pool":
+        report = benchmark_embedding_pool(args.workers, n_texts=args.texts, batch_size=args.batch_size)
+    elif args.benchmark == "vector-storage":
+        report = benchmark_vector_storage(args.vectors, n_queries=args.queries, top_k=args.top_k,
+                                          pca_dims=args.pca_dims, rerank_factors=args.rerank_factors,
+                                          source=args.source, min_recall=args.min_recall)
+    elif args.benchmark == "milvus-index":
+        report = benchmark_milvus_index(args.queries, top_k=args.top_k)
+    elif args.benchmark == "filtered-search":
+        report = benchmark_filtered_search(args.collections, n_queries=args.queries, top_k=args.top_k)
+    elif args.benchmark == "local-store":
+        from src.vector_store import IVF_MIN_TRAIN_ROWS
+        if args.vectors < IVF_MIN_TRAIN_ROWS:
+            parser.error(f"local-store necesita --vectors >= {IVF_MIN_TRAIN_ROWS} (por debajo no hay IVF)")
+        report = benchmark_local_store(args.vectors, n_queries=args.queries, top_k=args.top_k,
+                                       min_recall=args.min_recall)
+    elif args.benchmark == "state-merge":
+        report = benchmark_state_merge(args.docs, text_chars=args.text_chars, min_saved_ratio=args.min_saved_ratio)
+    elif args.benchmark == "node-pool":
+        report = benchmark_node_pool(args.docs, text_chars=args.text_chars,
+                                     branches=args.branches, workers=args.workers)
+    else:
+        parser.error(f"Benchmark desconocido: {args.benchmark}")
+        return 2
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if report.get("passed", True) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
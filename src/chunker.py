@@ -0,0 +1,169 @@
+"""
+División de documentos en fragmentos (chunks) para generar varios embeddings por documento.
+
+Los fragmentos se miden en tokens del propio modelo de embeddings, se solapan entre sí
+y respetan, cuando es posible, los encabezados estructurales (cláusulas, artículos,
+secciones numeradas...). Cada fragmento conserva sus offsets de carácter en el texto
+original para poder recuperar el pasaje exacto.
+"""
+import bisect
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Encabezados en línea propia (mismos patrones que StructureAgent.extract_index)
+LINE_HEADING_PATTERN = re.compile(r'^(\d+\.|[A-ZÁÉÍÓÚÑ ]{4,}|[IVXLCDM]+\.|[A-Z][a-z]+:)', re.MULTILINE)
+# Encabezados habituales en textos legales; el loader colapsa los saltos de línea,
+# así que también se buscan dentro del texto corrido
+INLINE_HEADING_PATTERN = re.compile(
+    r'(?<![\w])('
+    r'(?:ART[IÍ]CULO|Art[ií]culo|CL[AÁ]USULA|Cl[aá]usula|CAP[IÍ]TULO|Cap[ií]tulo|'
+    r'SECCI[OÓ]N|Secci[oó]n|ANEXO|Anexo|T[IÍ]TULO|ESTIPULACI[OÓ]N|Estipulaci[oó]n)'
+    r'\s+(?:\d+|[IVXLCDM]+|[A-ZÁÉÍÓÚÑ]+)\b'
+    r'|(?:PRIMER[OA]|SEGUND[OA]|TERCER[OA]|CUART[OA]|QUINT[OA]|SEXT[OA]|S[EÉ]PTIM[OA]|OCTAV[OA]|NOVEN[OA]|D[EÉ]CIM[OA])\s*[\.\-:]'
+    r')'
+)
+
+# Relación aproximada word pieces / palabra cuando no hay tokenizador con offsets
+WORDPIECES_PER_WORD = 1.3
+_WORD_PATTERN = re.compile(r'\S+')
+
+
+def split_sections(text: str) -> List[Tuple[int, str]]:
+    """
+    Devuelve las posiciones de inicio de sección como [(offset, encabezado), ...],
+    ordenadas y siempre empezando en el offset 0.
+    """
+    starts: Dict[int, str] = {}
+    for pattern in (LINE_HEADING_PATTERN, INLINE_HEADING_PATTERN):
+        for match in pattern.finditer(text):
+            heading = match.group(1).strip()
+            if heading:
+                starts.setdefault(match.start(1), heading)
+    # Sección sin encabezado al principio solo si ningún encabezado empieza en el offset 0
+    starts.setdefault(0, "")
+    return sorted(starts.items())
+
+
+def token_spans(text: str, tokenizer: Any = None) -> Tuple[List[Tuple[int, int]], float]:
+    """
+    Offsets de carácter (inicio, fin) de cada token del texto y cuántos tokens reales
+    del modelo representa cada elemento de la lista.
+    Con un tokenizador "fast" de HuggingFace se usan sus offsets (factor 1.0);
+    si no, se tokeniza por palabras y se aplica WORDPIECES_PER_WORD.
+    """
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            truncation=False,
+            verbose=False,
+        )
+        spans = [(s, e) for s, e in encoded["offset_mapping"] if e > s]
+        return spans, 1.0
+    return [(m.start(), m.end()) for m in _WORD_PATTERN.finditer(text)], WORDPIECES_PER_WORD
+
+
+def validate_chunking(max_tokens: int, overlap: int) -> None:
+    """
+    Lanza ValueError si el solape no deja avanzar la ventana: con overlap >= max_tokens
+    el paso se reduce a un token y cada sección produciría un fragmento por token.
+    """
+    if max_tokens <= 0:
+        raise ValueError(f"max_tokens debe ser positivo (es {max_tokens}).")
+    if not 0 <= overlap < max_tokens:
+        raise ValueError(f"El solape ({overlap} tokens) debe estar entre 0 y max_tokens - 1 ({max_tokens - 1}).")
+
+
+def chunk_text(
+    text: str,
+    tokenizer: Any = None,
+    max_tokens: int = 254,
+    overlap: int = 32,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Divide un texto en fragmentos de como máximo `max_tokens` tokens del modelo.
+    - Las secciones consecutivas cortas se agrupan mientras quepan en un fragmento.
+    - Las secciones largas se recorren con una ventana deslizante que solapa `overlap` tokens.
+    Genera dicts con 'chunk_index', 'text', 'char_start', 'char_end', 'section' y 'token_count'.
+    Lanza ValueError (al llamarla, no al iterar) si overlap >= max_tokens.
+    """
+    validate_chunking(max_tokens, overlap)
+    return _chunk_text(text, tokenizer, max_tokens, overlap)
+
+
+def _chunk_text(text: str, tokenizer: Any, max_tokens: int, overlap: int) -> Iterator[Dict[str, Any]]:
+    if not text:
+        return
+    spans, factor = token_spans(text, tokenizer)
+    if not spans:
+        return
+    window = max(1, int(max_tokens / factor))
+    step = max(1, window - int(overlap / factor))
+
+    # Pasar los inicios de sección (en caracteres) a índices de token
+    token_starts = [s for s, _ in spans]
+    segments: List[Tuple[int, int, str]] = []
+    sections = split_sections(text)
+    for i, (offset, heading) in enumerate(sections):
+        first = bisect.bisect_left(token_starts, offset)
+        last = bisect.bisect_left(token_starts, sections[i + 1][0]) if i + 1 < len(sections) else len(spans)
+        if last > first:
+            segments.append((first, last, heading))
+
+    # Agrupar secciones cortas consecutivas mientras quepan en la ventana; una sección
+    # muy corta (p. ej. solo un encabezado) se une siempre a la siguiente
+    min_segment = max(1, window // 4)
+    merged: List[Tuple[int, int, str]] = []
+    for first, last, heading in segments:
+        if merged and (last - merged[-1][0] <= window or merged[-1][1] - merged[-1][0] < min_segment):
+            merged[-1] = (merged[-1][0], last, merged[-1][2] or heading)
+        else:
+            merged.append((first, last, heading))
+
+    chunk_index = 0
+    for first, last, heading in merged:
+        pos = first
+        while True:
+            end = min(pos + window, last)
+            char_start, char_end = spans[pos][0], spans[end - 1][1]
+            yield {
+                "chunk_index": chunk_index,
+                "text": text[char_start:char_end],
+                "char_start": char_start,
+                "char_end": char_end,
+                "section": heading,
+                "token_count": int(round((end - pos) * factor)),
+            }
+            chunk_index += 1
+            if end >= last:
+                break
+            pos += step
+
+
+def iter_chunks(
+    texts: Iterable[str],
+    tokenizer: Any = None,
+    max_tokens: int = 254,
+    overlap: int = 32,
+    chunking: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre varios textos y genera sus fragmentos uno a uno, añadiendo 'doc_index'.
+    Con chunking=False cada texto produce un único fragmento con el texto completo.
+    """
+    for doc_index, text in enumerate(texts):
+        if not chunking:
+            yield {
+                "doc_index": doc_index,
+                "chunk_index": 0,
+                "text": text,
+                "char_start": 0,
+                "char_end": len(text),
+                "section": "",
+                "token_count": len(text.split()),
+            }
+            continue
+        for chunk in chunk_text(text, tokenizer=tokenizer, max_tokens=max_tokens, overlap=overlap):
+            chunk["doc_index"] = doc_index
+            yield chunk
@@ -0,0 +1,562 @@
+"""
+Exportación del corpus indexado a ficheros Parquet e importación masiva desde ellos.
+
+Restaurar una colección o pasarla a otro servidor reinsertando fila a fila por la API cuesta
+una llamada por lote y el tiempo de decodificar cada respuesta; con los datos en ficheros
+columnares la copia queda limitada por el disco:
+
+  - CorpusWriter escribe (embeddings, metadatos) por tandas, en streaming, en un directorio
+    por partición (EXPORT_PARTITION_BY: idioma, carpeta de origen o año) con ficheros de
+    como máximo EXPORT_ROWS_PER_FILE filas. Columnas: id (la clave primaria de Milvus),
+    doc_id, chunk_index, source, embedding (lista fija de float32), text y metadata (JSON con
+    el resto de metadatos aplanados). Cada sesión de escritura deja un manifest-<sesión>.json.
+  - iter_corpus lee los ficheros por lotes; si una misma fuente aparece en varias sesiones
+    (ingestas sucesivas con EXPORT_ON_INGEST) solo se usan las filas de la más reciente.
+  - import_corpus carga los ficheros en el almacén de vectores (VECTOR_STORE_BACKEND). En
+    Milvus, si la colección está vacía y MILVUS_BULK_ENDPOINT apunta al almacén de objetos
+    del servidor, las filas se suben como Parquet y se cargan con el bulk insert de Milvus
+    (sin pasar por las llamadas de inserción); si no, se insertan en streaming.
+
+Requiere el paquete `pyarrow` (solo al exportar o importar; el resto del pipeline no lo usa).
+
+Uso:
+    python -m src.corpus_export export --out backups/contratos [--backend local] [--partition-by lang]
+    python -m src.corpus_export import backups/contratos --collection documentos_legales_v3 [--mode bulk]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.milvus_schema import chunk_primary_key, field_names, flatten_metadata, partition_name
+from src.settings import (
+    EMBEDDING_MODEL,
+    EXPORT_BATCH_ROWS,
+    EXPORT_DIR,
+    EXPORT_ON_INGEST,
+    EXPORT_PARTITION_BY,
+    EXPORT_ROWS_PER_FILE,
+    MILVUS_BULK_ACCESS_KEY,
+    MILVUS_BULK_BUCKET,
+    MILVUS_BULK_ENDPOINT,
+    MILVUS_BULK_SECRET_KEY,
+    MILVUS_BULK_SECURE,
+    MILVUS_COLLECTION,
+    VECTOR_STORE_BACKEND,
+)
+from src.vector_utils import as_embedding_matrix, validate_embeddings
+
+FORMAT_VERSION = "1"
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+_PART_FILE = re.compile(r"^part-(?P<session>.+)-\d{5}\.parquet$")
+_BULK_POLL_S = 2.0  # intervalo de consulta del estado de las tareas de bulk insert
+
+
+def _new_session() -> str:
+    # Ordenable por fecha (hasta el microsegundo): las sesiones más recientes se leen al final
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def _require_pyarrow() -> Tuple[Any, Any]:
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError(
+            "La exportación del corpus necesita el paquete 'pyarrow' (pip install pyarrow)."
+        ) from e
+    return pyarrow, pyarrow.parquet
+
+
+def _arrow_schema(pa: Any, dim: int, partition_by: str) -> Any:
+    return pa.schema(
+        [
+            pa.field("id", pa.int64()),
+            pa.field("doc_id", pa.string()),
+            pa.field("chunk_index", pa.int64()),
+            pa.field("source", pa.string()),
+            pa.field("embedding", pa.list_(pa.float32(), dim)),
+            pa.field("text", pa.string()),
+            pa.field("metadata", pa.string()),
+        ],
+        metadata={
+            "format_version": FORMAT_VERSION,
+            "embedding_model": EMBEDDING_MODEL,
+            "partition_by": partition_by,
+        },
+    )
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CorpusWriter:
+    """
+    Escritor en streaming de (embeddings, metadatos) a Parquet. Uso:
+        with CorpusWriter("backups/contratos") as writer:
+            for matriz, metadatos in store.iter_batches():
+                writer.write(matriz, metadatos)
+        writer.manifest  # ficheros y filas escritos
+    Cada partición tiene como mucho un fichero abierto; se escribe con extensión .tmp y se
+    renombra al cerrarlo, así que un lector nunca ve un fichero a medias.
+    """
+    def __init__(self,
+                 root: str,
+                 partition_by: str = EXPORT_PARTITION_BY,
+                 rows_per_file: int = EXPORT_ROWS_PER_FILE,
+                 compression: str = "zstd"):
+        self.pa, self.pq = _require_pyarrow()
+        self.root = root
+        self.partition_by = partition_by
+        self.rows_per_file = max(1, rows_per_file)
+        self.compression = compression
+        self.session = _new_session()
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self.manifest: Optional[Dict[str, Any]] = None
+        self._schema: Any = None
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._files: List[Dict[str, Any]] = []
+        self._counter = 0
+        os.makedirs(root, exist_ok=True)
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def write(self, embeddings: Any, metadata: List[Dict[str, Any]]) -> int:
+        """
+        Añade una tanda; devuelve el número de filas escritas.
+        """
+        matrix = as_embedding_matrix(embeddings, dtype="float32")
+        validate_embeddings(matrix, expected_rows=len(metadata))
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+            self._schema = _arrow_schema(self.pa, self.dim, self.partition_by)
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"La exportación tiene dimensión {self.dim} y los embeddings {matrix.shape[1]}.")
+
+        metas = flatten_metadata(metadata)
+        groups: Dict[str, List[int]] = {}
+        for pos, meta in enumerate(metas):
+            name = partition_name(meta, self.partition_by) if self.partition_by else ""
+            groups.setdefault(name, []).append(pos)
+        for name, positions in groups.items():
+            self._write_partition(name, matrix[positions], [metas[i] for i in positions])
+        self.rows += len(metas)
+        return len(metas)
+
+    def _write_partition(self, name: str, matrix: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+        start = 0
+        while start < len(metas):
+            current = self._open.get(name) or self._open_file(name)
+            end = min(len(metas), start + self.rows_per_file - current["rows"])
+            current["writer"].write_table(self._table(matrix[start:end], metas[start:end]))
+            current["rows"] += end - start
+            if current["rows"] >= self.rows_per_file:
+                self._close_file(name)
+            start = end
+
+    def _open_file(self, name: str) -> Dict[str, Any]:
+        directory = os.path.join(self.root, name) if name else self.root
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self.session}-{self._counter:05d}.parquet")
+        self._counter += 1
+        writer = self.pq.ParquetWriter(path + ".tmp", self._schema, compression=self.compression)
+        self._open[name] = {"writer": writer, "path": path, "rows": 0}
+        return self._open[name]
+
+    def _close_file(self, name: str) -> None:
+        current = self._open.pop(name)
+        current["writer"].close()
+        os.replace(current["path"] + ".tmp", current["path"])
+        self._files.append({
+            "path": os.path.relpath(current["path"], self.root),
+            "partition": name,
+            "rows": current["rows"],
+        })
+
+    def _table(self, matrix: np.ndarray, metas: List[Dict[str, Any]]) -> Any:
+        pa = self.pa
+        # La matriz se pasa a Arrow como un único buffer contiguo, sin listas de Python
+        values = pa.array(np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1), type=pa.float32())
+        columns = [
+            pa.array([chunk_primary_key(meta) for meta in metas], type=pa.int64()),
+            pa.array([str(meta.get("doc_id") or meta.get("hash") or "") or None for meta in metas], type=pa.string()),
+            pa.array([_optional_int(meta.get("chunk_index")) for meta in metas], type=pa.int64()),
+            pa.array([str(meta["source"]) if meta.get("source") else None for meta in metas], type=pa.string()),
+            pa.FixedSizeListArray.from_arrays(values, self.dim),
+            pa.array([meta.get("text") for meta in metas], type=pa.string()),
+            pa.array([
+                json.dumps({k: v for k, v in meta.items() if k != "text"}, ensure_ascii=False, default=str)
+                for meta in metas
+            ], type=pa.string()),
+        ]
+        return pa.Table.from_arrays(columns, schema=self._schema)
+
+    def close(self) -> Dict[str, Any]:
+        if self.manifest is not None:
+            return self.manifest
+        for name in list(self._open):
+            self._close_file(name)
+        self.manifest = {
+            "format_version": FORMAT_VERSION,
+            "session": self.session,
+            "embedding_model": EMBEDDING_MODEL,
+            "dim": self.dim,
+            "partition_by": self.partition_by,
+            "rows": self.rows,
+            "files": self._files,
+        }
+        if self.rows:
+            with open(os.path.join(self.root, f"manifest-{self.session}.json"), "w", encoding="utf-8") as fh:
+                json.dump(self.manifest, fh, indent=2, ensure_ascii=False)
+        return self.manifest
+
+
+def open_ingest_writer(collection_name: str) -> Optional[CorpusWriter]:
+    """
+    Escritor de la exportación que acompaña a la ingesta (EXPORT_ON_INGEST), en
+    EXPORT_DIR/<colección>; None si está desactivada o falta pyarrow.
+    """
+    if not EXPORT_ON_INGEST:
+        return None
+    try:
+        return CorpusWriter(os.path.join(EXPORT_DIR, _UNSAFE_CHARS.sub("_", collection_name)))
+    except RuntimeError as e:
+        logging.warning(f"[CorpusExport] No se exporta la ingesta: {e}")
+        return None
+
+
+# ---------------------------------------------------------------------- Lectura
+def corpus_files(root: str) -> List[str]:
+    """
+    Ficheros Parquet de una exportación, de la sesión más antigua a la más reciente.
+    """
+    found = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            match = _PART_FILE.match(name)
+            if match:
+                found.append((match.group("session"), os.path.join(directory, name)))
+    return [path for _, path in sorted(found)]
+
+
+def _session(path: str) -> str:
+    return _PART_FILE.match(os.path.basename(path)).group("session")
+
+
+def _latest_sessions(pq: Any, files: List[str]) -> Dict[str, str]:
+    # Solo se lee la columna 'source' de cada fichero: fuente -> última sesión que la exportó
+    latest: Dict[str, str] = {}
+    for path in files:
+        session = _session(path)
+        for source in set(pq.read_table(path, columns=["source"]).column("source").to_pylist()):
+            if source is not None:
+                latest[source] = session
+    return latest
+
+
+def iter_corpus(root: str,
+                batch_size: int = EXPORT_BATCH_ROWS,
+                latest_only: bool = True) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+    """
+    Genera (matriz float32, metadatos con su texto) leyendo la exportación por lotes.
+    Con `latest_only`, de cada fuente solo se leen las filas de su sesión más reciente.
+    """
+    _, pq = _require_pyarrow()
+    files = corpus_files(root)
+    if not files:
+        raise FileNotFoundError(f"No hay ficheros Parquet exportados en '{root}'.")
+    latest = _latest_sessions(pq, files) if latest_only else {}
+    warned = False
+    for path in files:
+        session = _session(path)
+        parquet = pq.ParquetFile(path)
+        schema = parquet.schema_arrow
+        model = (schema.metadata or {}).get(b"embedding_model", b"").decode("utf-8")
+        if model and model != EMBEDDING_MODEL and not warned:
+            logging.warning(f"[CorpusExport] La exportación se hizo con el modelo '{model}' y "
+                            f"EMBEDDING_MODEL es '{EMBEDDING_MODEL}'")
+            warned = True
+        dim = schema.field("embedding").type.list_size
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=["source", "embedding", "text", "metadata"]):
+            sources = batch.column(0).to_pylist()
+            keep = [i for i, source in enumerate(sources) if source is None or latest.get(source, session) == session]
+            if not keep:
+                continue
+            # flatten() respeta el desplazamiento del lote; la matriz se copia una sola vez
+            matrix = batch.column(1).flatten().to_numpy(zero_copy_only=False).reshape(-1, dim)
+            texts = batch.column(2).to_pylist()
+            raw = batch.column(3).to_pylist()
+            metadata = []
+            for i in keep:
+                meta = json.loads(raw[i])
+                if texts[i] is not None:
+                    meta["text"] = texts[i]
+                metadata.append(meta)
+            yield (matrix[keep] if len(keep) < len(sources) else matrix), metadata
+
+
+# ---------------------------------------------------------------------- Exportación / importación
+def export_store(store: Any,
+                 root: str,
+                 batch_size: int = EXPORT_BATCH_ROWS,
+                 partition_by: str = EXPORT_PARTITION_BY,
+                 rows_per_file: int = EXPORT_ROWS_PER_FILE) -> Dict[str, Any]:
+    """
+    Exporta todas las filas de un VectorStore (ver VectorStore.iter_batches) a `root`.
+    """
+    start = time.perf_counter()
+    with CorpusWriter(root, partition_by=partition_by, rows_per_file=rows_per_file) as writer:
+        for matrix, metadata in store.iter_batches(batch_size):
+            writer.write(matrix, metadata)
+    elapsed = time.perf_counter() - start
+    logging.info(f"[CorpusExport] Exportadas {writer.rows} filas de '{store.collection_name}' a '{root}' "
+                 f"en {len(writer.manifest['files'])} ficheros ({elapsed:.2f}s)")
+    return {
+        "collection": store.collection_name,
+        "backend": store.backend,
+        "root": root,
+        "rows": writer.rows,
+        "files": len(writer.manifest["files"]),
+        "session": writer.session,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def bulk_unavailable(agent: Any) -> Optional[str]:
+    """
+    Motivo por el que no se puede usar el bulk insert de Milvus con este agente (None = se puede).
+    """
+    from pymilvus import Collection, utility
+
+    if not MILVUS_BULK_ENDPOINT:
+        return "MILVUS_BULK_ENDPOINT no está configurado"
+    if agent.storage not in ("float32", "pca"):
+        return f"el bulk insert solo se usa con vectores float32 o pca (la colección usa {agent.storage})"
+    alias = agent._connect()
+    if utility.has_collection(agent.collection_name, using=alias):
+        collection = Collection(agent.collection_name, using=alias)
+        if collection.schema.fields[0].auto_id:
+            return "la colección usa auto_id"
+        if collection.num_entities:
+            # El bulk insert no deduplica contra las filas que ya existen
+            return f"la colección '{agent.collection_name}' no está vacía"
+    return None
+
+
+def _wait_bulk_tasks(tasks: List[int], alias: str, timeout_s: float) -> Dict[str, Any]:
+    from pymilvus import BulkInsertState, utility
+
+    done: Dict[int, Any] = {}
+    deadline = time.monotonic() + timeout_s
+    while len(done) < len(tasks):
+        for task in tasks:
+            if task in done:
+                continue
+            state = utility.get_bulk_insert_state(task, using=alias)
+            if state.state in (BulkInsertState.ImportCompleted, BulkInsertState.ImportFailed,
+                               BulkInsertState.ImportFailedAndCleaned):
+                done[task] = state
+        if len(done) < len(tasks):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"El bulk insert no terminó en {timeout_s:.0f}s ({len(done)}/{len(tasks)} tareas).")
+            time.sleep(_BULK_POLL_S)
+    inserted = sum(state.row_count for state in done.values() if state.state == BulkInsertState.ImportCompleted)
+    failures = {task: state.failed_reason for task, state in done.items()
+                if state.state != BulkInsertState.ImportCompleted}
+    return {"inserted": inserted, "failures": failures}
+
+
+def bulk_import_milvus(store: Any,
+                       root: str,
+                       batch_size: int = EXPORT_BATCH_ROWS,
+                       timeout_s: float = 3600.0) -> Dict[str, Any]:
+    """
+    Carga la exportación en una colección de Milvus vacía con el bulk insert: las filas se
+    escriben como Parquet en el bucket del servidor (una carpeta por partición) y Milvus las
+    importa por su cuenta. El texto y los detalles van al TextStore como en la ingesta.
+    """
+    from pymilvus import utility
+    from pymilvus.bulk_writer import BulkFileType, RemoteBulkWriter
+    from src.vector_store import _record_analytics
+
+    agent = store.agent
+    alias = agent._connect()
+    connect = RemoteBulkWriter.S3ConnectParam(
+        endpoint=MILVUS_BULK_ENDPOINT,
+        access_key=MILVUS_BULK_ACCESS_KEY,
+        secret_key=MILVUS_BULK_SECRET_KEY,
+        bucket_name=MILVUS_BULK_BUCKET,
+        secure=MILVUS_BULK_SECURE,
+    )
+    start = time.perf_counter()
+    session = _new_session()
+    writers: Dict[Optional[str], Any] = {}
+    seen: set = set()
+    read = skipped = 0
+
+    for matrix, metadata in iter_corpus(root, batch_size):
+        if agent.collection is None:
+            agent._get_or_create_collection(matrix.shape[1])
+        read += len(metadata)
+        metas = flatten_metadata(metadata)
+        ids = [chunk_primary_key(meta) for meta in metas]
+        keep = []
+        for pos, pk in enumerate(ids):
+            if pk not in seen:
+                seen.add(pk)
+                keep.append(pos)
+        skipped += len(ids) - len(keep)
+        if not keep:
+            continue
+        ids = [ids[pos] for pos in keep]
+        metas = [metas[pos] for pos in keep]
+        matrix = matrix[keep]
+        if agent.text_store is not None:
+            metas, texts = agent._store_details(metas)
+            agent.text_store.put_chunks(ids, texts, metas)
+
+        names = field_names(agent.collection)
+        groups: Dict[Optional[str], List[int]] = {}
+        for pos, meta in enumerate(metas):
+            name = partition_name(meta, agent.partition_by) if agent.partition_by else None
+            groups.setdefault(name, []).append(pos)
+        for name, positions in groups.items():
+            if name not in writers:
+                writers[name] = RemoteBulkWriter(
+                    schema=agent.collection.schema,
+                    remote_path=f"/{agent.collection_name}/{session}/{name or '_default'}",
+                    connect_param=connect,
+                    file_type=BulkFileType.PARQUET,
+                )
+            columns = agent._columns([ids[i] for i in positions], matrix[positions], [metas[i] for i in positions])
+            for values in zip(*columns):
+                writers[name].append_row(dict(zip(names, values)))
+        _record_analytics(store, metadata)
+
+    if not writers:
+        raise ValueError(f"La exportación de '{root}' no tiene filas.")
+    if agent.partition_by:
+        agent._ensure_partitions([name for name in writers if name])
+    tasks = []
+    for name, writer in writers.items():
+        writer.commit()
+        for files in writer.batch_files:
+            tasks.append(utility.do_bulk_insert(collection_name=agent.collection_name, files=files,
+                                                partition_name=name, using=alias))
+    logging.info(f"[CorpusExport] {len(tasks)} tareas de bulk insert lanzadas para '{agent.collection_name}'")
+    result = _wait_bulk_tasks(tasks, alias, timeout_s)
+    if result["failures"] and not result["inserted"]:
+        raise RuntimeError(f"El bulk insert en '{agent.collection_name}' falló: {result['failures']}")
+    if result["failures"]:
+        logging.error(f"[CorpusExport] Bulk insert parcial: {len(result['failures'])} tareas fallidas")
+    agent._ensure_ready()
+    store._changed()
+    return {
+        "collection": agent.collection_name,
+        "backend": "milvus",
+        "mode": "bulk",
+        "rows_read": read,
+        "insert_count": result["inserted"],
+        "skipped_count": skipped,
+        "failed_tasks": result["failures"],
+        "tasks": len(tasks),
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+
+
+def import_corpus(root: str,
+                  backend: str = VECTOR_STORE_BACKEND,
+                  collection_name: str = MILVUS_COLLECTION,
+                  mode: str = "auto",
+                  batch_size: int = EXPORT_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Carga una exportación en el almacén de vectores.
+    mode: "bulk" (bulk insert de Milvus; error si no se puede), "stream" (insert_stream del
+    almacén, con deduplicación y borrado de filas obsoletas) o "auto" (bulk si se puede).
+    """
+    from src.vector_store import _record_analytics, get_vector_store
+
+    if mode not in ("auto", "bulk", "stream"):
+        raise ValueError(f"Modo de importación desconocido: '{mode}' (usa 'auto', 'bulk' o 'stream').")
+    store = get_vector_store(backend, collection_name)
+    if backend == "milvus" and mode != "stream":
+        reason = bulk_unavailable(store.agent)
+        if reason is None:
+            return bulk_import_milvus(store, root, batch_size)
+        if mode == "bulk":
+            raise RuntimeError(f"No se puede usar el bulk insert: {reason}.")
+        logging.info(f"[CorpusExport] Importación en streaming ({reason})")
+    elif mode == "bulk":
+        raise RuntimeError(f"El bulk insert solo existe para Milvus (backend '{backend}').")
+
+    start = time.perf_counter()
+    read = 0
+
+    def batches():
+        nonlocal read
+        for matrix, metadata in iter_corpus(root, batch_size):
+            read += len(metadata)
+            yield matrix, metadata
+            _record_analytics(store, metadata)
+
+    result = store.insert_stream(batches())
+    return {
+        "collection": collection_name,
+        "backend": backend,
+        "mode": "stream",
+        "rows_read": read,
+        "insert_count": result["insert_count"],
+        "skipped_count": result["skipped_count"],
+        "failed_count": result.get("failed_count", 0),
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.vector_store import get_vector_store
+
+    parser = argparse.ArgumentParser(description="Exportación del corpus a Parquet e importación masiva")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="Exporta una colección a ficheros Parquet")
+    p_export.add_argument("--out", default="", help="Directorio de salida (por defecto EXPORT_DIR/<colección>)")
+    p_export.add_argument("--partition-by", default=EXPORT_PARTITION_BY)
+    p_export.add_argument("--rows-per-file", type=int, default=EXPORT_ROWS_PER_FILE)
+    p_import = sub.add_parser("import", help="Carga una exportación en el almacén de vectores")
+    p_import.add_argument("root", help="Directorio de la exportación")
+    p_import.add_argument("--mode", choices=["auto", "bulk", "stream"], default="auto")
+    for p in (p_export, p_import):
+        p.add_argument("--collection", default=MILVUS_COLLECTION)
+        p.add_argument("--backend", choices=["milvus", "local"], default=VECTOR_STORE_BACKEND)
+        p.add_argument("--batch-size", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "export":
+        root = args.out or os.path.join(EXPORT_DIR, _UNSAFE_CHARS.sub("_", args.collection))
+        report = export_store(get_vector_store(args.backend, args.collection), root, args.batch_size,
+                              args.partition_by, args.rows_per_file)
+    else:
+        report = import_corpus(args.root, args.backend, args.collection, args.mode, args.batch_size)
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Almacén único de documentos compartido por todos los agentes.
+
+El texto de cada documento se guarda una sola vez, indexado por su SHA256 (el mismo hash
+que calcula MetadataAgent), y el estado del grafo solo transporta `DocumentHandle`:
+referencias ligeras e inmutables con el título, los metadatos del cargador y los
+límites de página. Los agentes leen el texto completo, una página o sus fragmentos a
+través del handle sin copiarlo.
+
+Los textos se liberan cuando desaparece el último handle que los referencia. Al
+serializar un handle (pickle) viaja también su texto, de modo que en otro proceso se
+vuelve a registrar en el almacén local de ese proceso.
+"""
+import hashlib
+import threading
+import weakref
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+HANDLE_KEYS = ("doc_id", "title", "text", "metadata")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    """
+    Textos indexados por SHA256 con recuento de referencias: dos documentos con el
+    mismo contenido comparten el texto y cada handle mantiene viva su entrada.
+    """
+
+    def __init__(self):
+        self._texts: Dict[str, str] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, title: str, text: str, metadata: Optional[Dict[str, Any]] = None,
+            page_starts: Sequence[int] = (0,)) -> "DocumentHandle":
+        """
+        Registra un documento y devuelve su handle. `page_starts` son los offsets de
+        carácter en los que empieza cada página dentro de `text`.
+        """
+        doc_id = text_hash(text)
+        with self._lock:
+            self._texts.setdefault(doc_id, text)
+            self._refs[doc_id] = self._refs.get(doc_id, 0) + 1
+        handle = DocumentHandle(self, doc_id, title, metadata or {}, tuple(page_starts) or (0,))
+        weakref.finalize(handle, self._release, doc_id)
+        return handle
+
+    def text(self, doc_id: str) -> str:
+        with self._lock:
+            try:
+                return self._texts[doc_id]
+            except KeyError:
+                raise KeyError(f"Documento '{doc_id}' no está en el almacén") from None
+
+    def _release(self, doc_id: str) -> None:
+        with self._lock:
+            remaining = self._refs.get(doc_id, 0) - 1
+            if remaining > 0:
+                self._refs[doc_id] = remaining
+            else:
+                self._refs.pop(doc_id, None)
+                self._texts.pop(doc_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "texts": len(self._texts),
+                "handles": sum(self._refs.values()),
+                "chars": sum(len(t) for t in self._texts.values()),
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._texts)
+
+
+class DocumentHandle(Mapping):
+    """
+    Referencia inmutable a un documento del almacén. Se comporta como el dict
+    {'doc_id', 'title', 'text', 'metadata'} que usaban los agentes, pero 'text' se
+    resuelve en el almacén y 'metadata' devuelve una copia nueva en cada acceso.
+    """
+    __slots__ = ("_store", "doc_id", "title", "_metadata", "page_starts", "__weakref__")
+
+    def __init__(self, store: DocumentStore, doc_id: str, title: str,
+                 metadata: Dict[str, Any], page_starts: Tuple[int, ...]):
+        self._store = store
+        self.doc_id = doc_id
+        self.title = title
+        self._metadata = MappingProxyType(dict(metadata))
+        self.page_starts = page_starts
+
+    # ---------------------------------------------------------------- vistas
+    @property
+    def text(self) -> str:
+        return self._store.text(self.doc_id)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return dict(self._metadata)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_starts)
+
+    def page(self, number: int) -> str:
+        """Texto de la página `number` (empezando en 0)."""
+        text = self.text
+        start = self.page_starts[number]
+        end = self.page_starts[number + 1] if number + 1 < len(self.page_starts) else len(text)
+        return text[start:end].strip()
+
+    def pages(self) -> Iterator[str]:
+        for number in range(len(self.page_starts)):
+            yield self.page(number)
+
+    def chunks(self, tokenizer: Any = None, max_tokens: int = 254,
+               overlap: int = 32) -> Iterator[Dict[str, Any]]:
+        """Fragmentos del documento (ver chunker.chunk_text), generados bajo demanda."""
+        from src.chunker import chunk_text
+        return chunk_text(self.text, tokenizer=tokenizer, max_tokens=max_tokens, overlap=overlap)
+
+    # ------------------------------------------------------- interfaz de dict
+    def __getitem__(self, key: str) -> Any:
+        if key == "doc_id":
+            return self.doc_id
+        if key == "title":
+            return self.title
+        if key == "text":
+            return self.text
+        if key == "metadata":
+            return self.metadata
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(HANDLE_KEYS)
+
+    def __len__(self) -> int:
+        return len(HANDLE_KEYS)
+
+    def __contains__(self, key: object) -> bool:
+        return key in HANDLE_KEYS
+
+    # Inmutable: copiar un handle devuelve el mismo objeto (y su referencia al texto)
+    def __copy__(self) -> "DocumentHandle":
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "DocumentHandle":
+        return self
+
+    def __reduce__(self):
+        return _restore_handle, (self.title, self.text, dict(self._metadata), self.page_starts)
+
+    def __repr__(self) -> str:
+        return (f"DocumentHandle(doc_id={self.doc_id[:12]}, title={self.title!r}, "
+                f"pages={len(self.page_starts)})")
+
+
+def _restore_handle(title: str, text: str, metadata: Dict[str, Any],
+                    page_starts: Tuple[int, ...]) -> DocumentHandle:
+    return get_document_store().add(title, text, metadata, page_starts)
+
+
+_store: Optional[DocumentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+        return _store
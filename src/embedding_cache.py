@@ -0,0 +1,322 @@
+"""
+Caché persistente de embeddings en disco.
+
+Por cada modelo se guarda una matriz float32 mapeada en memoria (un fichero binario con
+una fila por vector) y un índice SQLite que relaciona el hash del texto normalizado con
+su fila. Antes de codificar se consulta la caché y solo los textos que no están se envían
+al modelo.
+
+Varios procesos pueden escribir a la vez: las escrituras y la compactación se hacen bajo
+un bloqueo de fichero exclusivo, los vectores se escriben y sincronizan antes de confirmar
+sus filas en SQLite, y la compactación escribe un fichero nuevo (nueva "generación") en
+lugar de modificar el que puedan estar leyendo otros procesos.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    _HAS_FCNTL = False
+
+_WHITESPACE = re.compile(r'\s+')
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+# Filas que se copian de una vez al compactar (memoria acotada con cachés grandes)
+_BLOCK_ROWS = 65536
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalización usada para la clave: Unicode NFC, espacios colapsados y sin bordes.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _FileLock:
+    """
+    Bloqueo exclusivo entre procesos sobre un fichero (flock en POSIX, msvcrt en Windows).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+b")
+        if _HAS_FCNTL:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self._fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if _HAS_FCNTL:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fh.close()
+            self._fh = None
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings de un modelo concreto.
+    - get_many(texts): devuelve ({posición: vector} de los aciertos, posiciones que faltan)
+    - put_many(texts, matriz): guarda los vectores nuevos
+    - compact(max_rows): conserva solo las filas usadas más recientemente
+    - stats(): aciertos, fallos, tasa de acierto y tamaño en disco
+    """
+    def __init__(self, cache_dir: str, model_name: str, max_rows: int = 1_000_000):
+        self.model_name = model_name
+        self.max_rows = max_rows
+        self.path = os.path.join(cache_dir, _UNSAFE_CHARS.sub("_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self._db_path = os.path.join(self.path, "index.sqlite")
+        self._lock_path = os.path.join(self.path, "write.lock")
+        self._local = threading.local()
+        self._mmap: Optional[np.memmap] = None
+        self._mmap_key: Tuple[int, int] = (-1, 0)
+        self._mmap_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_db()
+
+    # ------------------------------------------------------------------ SQLite
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        with _FileLock(self._lock_path):
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+
+    def _meta(self, conn: sqlite3.Connection) -> Dict[str, int]:
+        values = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+        return {
+            "dim": int(values.get("dim", 0)),
+            "rows": int(values.get("rows", 0)),
+            "capacity": int(values.get("capacity", 0)),
+            "generation": int(values.get("generation", 0)),
+        }
+
+    def _set_meta(self, conn: sqlite3.Connection, **values: int) -> None:
+        conn.executemany(
+            "INSERT INTO meta(name, value) VALUES(?, ?) ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+            [(k, str(v)) for k, v in values.items()],
+        )
+
+    # ------------------------------------------------------------------ Matriz
+    def _matrix_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors-{generation}.f32")
+
+    def _reader(self, generation: int, dim: int, rows_needed: int) -> np.memmap:
+        """
+        Mapeo de solo lectura de la generación actual, reabierto si el fichero ha crecido.
+        """
+        with self._mmap_lock:
+            gen, mapped_rows = self._mmap_key
+            if self._mmap is None or gen != generation or mapped_rows < rows_needed:
+                path = self._matrix_path(generation)
+                n_rows = os.path.getsize(path) // (dim * 4)
+                self._mmap = np.memmap(path, dtype=np.float32, mode="r", shape=(n_rows, dim))
+                self._mmap_key = (generation, n_rows)
+            return self._mmap
+
+    # ------------------------------------------------------------------ API
+    def get_many(self, texts: Sequence[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Busca los textos en la caché.
+        Devuelve ({posición: vector}, [posiciones sin vector en caché]).
+        """
+        keys = [cache_key(self.model_name, t) for t in texts]
+        conn = self._conn()
+        found: Dict[str, int] = {}
+        # Filas y generación se leen en la misma transacción (misma instantánea) para que
+        # una compactación concurrente no mezcle filas nuevas con el fichero antiguo
+        conn.execute("BEGIN")
+        try:
+            meta = self._meta(conn)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall())
+        finally:
+            conn.commit()
+
+        hits: Dict[int, np.ndarray] = {}
+        if found and meta["dim"]:
+            try:
+                matrix = self._reader(meta["generation"], meta["dim"], max(found.values()) + 1)
+                for pos, key in enumerate(keys):
+                    row = found.get(key)
+                    if row is not None:
+                        hits[pos] = np.array(matrix[row], dtype=np.float32)
+            except (FileNotFoundError, ValueError) as e:
+                # Una compactación concurrente ha sustituido el fichero: se trata como fallo
+                logging.info(f"[EmbeddingCache] Lectura descartada por compactación concurrente: {e}")
+                hits = {}
+            if hits:
+                now = time.time()
+                with conn:
+                    conn.executemany(
+                        "UPDATE entries SET last_access=? WHERE key=?",
+                        [(now, keys[pos]) for pos in hits],
+                    )
+
+        missing = [pos for pos in range(len(keys)) if pos not in hits]
+        self.hits += len(hits)
+        self.misses += len(missing)
+        return hits, missing
+
+    def put_many(self, texts: Sequence[str], matrix: np.ndarray) -> int:
+        """
+        Guarda los vectores de `texts`. Devuelve cuántas filas nuevas se han escrito.
+        """
+        if len(texts) == 0:
+            return 0
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        keys = [cache_key(self.model_name, t) for t in texts]
+        with _FileLock(self._lock_path):
+            conn = self._conn()
+            meta = self._meta(conn)
+            dim = meta["dim"] or matrix.shape[1]
+            if matrix.shape[1] != dim:
+                raise ValueError(f"Dimensión {matrix.shape[1]} no coincide con la de la caché ({dim}).")
+
+            # Otro proceso puede haber guardado ya alguno de estos textos
+            existing = set()
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(k for (k,) in conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            new_positions = []
+            seen = set(existing)
+            for pos, key in enumerate(keys):
+                if key not in seen:
+                    seen.add(key)
+                    new_positions.append(pos)
+            if not new_positions:
+                return 0
+
+            rows, capacity, generation = meta["rows"], meta["capacity"], meta["generation"]
+            needed = rows + len(new_positions)
+            path = self._matrix_path(generation)
+            if needed > capacity:
+                capacity = max(needed, capacity * 2, 1024)
+                with open(path, "ab") as f:
+                    f.truncate(capacity * dim * 4)
+
+            writer = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            writer[rows:needed] = matrix[new_positions]
+            writer.flush()
+            del writer
+
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO entries(key, row, last_access) VALUES(?, ?, ?)",
+                    [(keys[pos], rows + i, now) for i, pos in enumerate(new_positions)],
+                )
+                self._set_meta(conn, dim=dim, rows=needed, capacity=capacity, generation=generation)
+
+        if needed > self.max_rows:
+            self.compact(int(self.max_rows * 0.8))
+        return len(new_positions)
+
+    def compact(self, keep_rows: Optional[int] = None) -> Dict[str, int]:
+        """
+        Reescribe la matriz en una generación nueva conservando las `keep_rows` filas
+        usadas más recientemente (todas si es None) y elimina huecos y entradas expulsadas.
+        """
+        with _FileLock(self._lock_path):
+            conn = self._conn()
+            meta = self._meta(conn)
+            if not meta["dim"]:
+                return {"kept": 0, "evicted": 0}
+            limit = keep_rows if keep_rows is not None else meta["rows"]
+            kept = conn.execute(
+                "SELECT key, row, last_access FROM entries ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+            total = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+            dim, old_gen = meta["dim"], meta["generation"]
+            new_gen = old_gen + 1
+            new_path = self._matrix_path(new_gen)
+            capacity = max(len(kept), 1024)
+            old = np.memmap(self._matrix_path(old_gen), dtype=np.float32, mode="r", shape=(meta["capacity"], dim))
+            new = np.memmap(new_path, dtype=np.float32, mode="w+", shape=(capacity, dim))
+            rows = np.fromiter((row for _, row, _ in kept), dtype=np.int64, count=len(kept))
+            for start in range(0, len(rows), _BLOCK_ROWS):
+                block = rows[start:start + _BLOCK_ROWS]
+                new[start:start + len(block)] = old[block]
+            new.flush()
+            del new, old
+
+            with conn:
+                conn.execute("DELETE FROM entries")
+                conn.executemany(
+                    "INSERT INTO entries(key, row, last_access) VALUES(?, ?, ?)",
+                    [(key, i, last_access) for i, (key, _, last_access) in enumerate(kept)],
+                )
+                self._set_meta(conn, rows=len(kept), capacity=capacity, generation=new_gen)
+            try:
+                os.remove(self._matrix_path(old_gen))
+            except OSError:
+                pass  # en Windows puede seguir abierto por otro lector; se ignora
+
+        evicted = total - len(kept)
+        logging.info(f"[EmbeddingCache] Compactada '{self.model_name}': {len(kept)} filas conservadas, {evicted} expulsadas")
+        return {"kept": len(kept), "evicted": evicted}
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        meta = self._meta(conn)
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "rows": meta["rows"],
+            "disk_bytes": meta["capacity"] * meta["dim"] * 4,
+            "generation": meta["generation"],
+        }
@@ -0,0 +1,118 @@
+"""
+Pool de procesos para generar embeddings de corpus grandes.
+
+Cada proceso trabajador carga el modelo una sola vez (en su inicializador, a través del
+registro de modelos) y recibe trozos de `chunk_size` textos. Los resultados se devuelven
+en el mismo orden que la entrada. Para entradas pequeñas no compensa arrancar el pool,
+así que `should_use` indica cuándo conviene seguir codificando en el propio proceso.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Modelo cargado en cada proceso trabajador
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int) -> None:
+    global _worker_model
+    if threads > 0:
+        # Evita que cada trabajador intente usar todos los núcleos (sobre-suscripción)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(threads)
+        os.environ["ONNX_NUM_THREADS"] = str(threads)
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    from src.model_registry import get_model, register_embedding_model
+    _worker_model = get_model(register_embedding_model(model_name, backend))
+    if threads > 0 and backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _encode_chunk(args: Tuple[List[str], int]) -> np.ndarray:
+    texts, batch_size = args
+    vectors = _worker_model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+class EmbeddingPool:
+    """
+    Pool persistente de `workers` procesos con el modelo precargado.
+    Se arranca en el primer uso y se cierra con close() (o al salir del intérprete).
+    """
+    def __init__(self,
+                 model_name: str,
+                 backend: str,
+                 workers: int,
+                 chunk_size: int = 256,
+                 min_texts: int = 2048,
+                 threads_per_worker: int = 0):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_texts = min_texts
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // max(workers, 1))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def should_use(self, n_texts: int) -> bool:
+        """
+        True si la entrada es lo bastante grande para amortizar el arranque del pool.
+        """
+        return self.workers > 1 and n_texts >= self.min_texts
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # "spawn": los trabajadores no heredan hilos, locks ni canales gRPC del padre
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.backend, self.threads_per_worker),
+                )
+                atexit.register(self.close)
+                logging.info(
+                    f"[EmbeddingPool] Arrancados {self.workers} procesos para '{self.model_name}' "
+                    f"({self.threads_per_worker} hilos por proceso)"
+                )
+            return self._executor
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Reparte los textos en trozos de `chunk_size`, los codifica en paralelo y
+        devuelve una matriz float32 con las filas en el orden de entrada.
+        """
+        executor = self._ensure_started()
+        chunks = [(texts[i:i + self.chunk_size], batch_size) for i in range(0, len(texts), self.chunk_size)]
+        # executor.map conserva el orden de los trozos
+        return np.concatenate(list(executor.map(_encode_chunk, chunks)))
+
+    def close(self) -> None:
+        """
+        Detiene los procesos trabajadores esperando a que terminen los trozos en curso.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                logging.info(f"[EmbeddingPool] Pool de '{self.model_name}' cerrado")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
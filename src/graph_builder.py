@@ -1,48 +1,69 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 from src.state import DocState
 # Importar las funciones de cada agente
 from src.agent_loader import run_loader
 from src.agent_metadata import run_metadata
 from src.agent_summarizer import run_summarizer
 from src.agent_keywords import run_keywords
-from src.agent_topics import run_topics
+from src.agent_topics import run_corpus_topics, run_topics
 from src.agent_structure import run_structure
 from src.agent_insights import run_insights
 from src.vectorizer_agent import run_vectorizer
-from src.indexer_agent import run_indexer
+from src.vector_store import run_indexer, run_vectorize_and_index
+from src.node_pool import process_node, validate_nodes
+from src.settings import INDEX_STREAMING, PIPELINE_MODE, PIPELINE_MAX_CONCURRENCY, PIPELINE_PROCESS_NODES
 
 # (Opcional) Agente de depuración:
 from src.agent_loader import json  # para usar json si hiciera falta
-def run_debug(state: DocState) -> DocState:
+def run_debug(state: DocState) -> Dict[str, Any]:
     """
-    Agente de depuración: imprime el estado (en JSON) en la consola, sin modificarlo.
+    Agente de depuración: imprime el estado (en JSON) en la consola, sin modificarlo
+    (no devuelve ningún campo).
     """
-    state_json = json.dumps(state, ensure_ascii=False, indent=2)
+    state_json = json.dumps(state, ensure_ascii=False, indent=2, default=str)
     print("\n>>> [DebugAgent] Estado actual:\n", state_json, "\n>>> Fin del estado.\n")
-    return state
+    return {}
 
-def build_graph():
-    # Crear el grafo de estado basado en nuestra estructura DocState
-    builder = StateGraph(DocState)
 
-    # Añadir nodos (agentes) al grafo:
-    builder.add_node("LoaderAgent",    run_loader)
-    builder.add_node("MetadataAgent",  run_metadata)
+def _node(name: str, fn):
+    """
+    Función del nodo `name`: la del agente o, si está en PIPELINE_PROCESS_NODES, un
+    envoltorio que la ejecuta en el pool de procesos (src/node_pool.py).
+    """
+    if name in PIPELINE_PROCESS_NODES:
+        return process_node(name, fn)
+    return fn
+
+
+def _add_document_stages(builder: StateGraph, entry: str) -> None:
+    """
+    Nodos y aristas que recorre cada documento, de MetadataAgent a la indexación;
+    `entry` es el nodo (o START) del que parte MetadataAgent.
+    """
+    validate_nodes(PIPELINE_PROCESS_NODES)
+    builder.add_node("MetadataAgent",   _node("MetadataAgent", run_metadata))
     # Nodos en paralelo (posteriores a MetadataAgent):
-    builder.add_node("SummarizerAgent", run_summarizer)
+    builder.add_node("SummarizerAgent", _node("SummarizerAgent", run_summarizer))
     builder.add_node("KeywordAgent",    run_keywords)
-    builder.add_node("TopicModelAgent", run_topics)
-    builder.add_node("StructureAgent",  run_structure)
+    builder.add_node("TopicModelAgent", _node("TopicModelAgent", run_topics))
+    builder.add_node("StructureAgent",  _node("StructureAgent", run_structure))
     builder.add_node("InsightAgent",    run_insights)
     # Nodo de debug (sin alterar estado, opcional)
     builder.add_node("DebugAgent",      run_debug)
-    # Nodos finales
-    builder.add_node("VectorizerAgent", run_vectorizer)
-    builder.add_node("IndexerAgent",    run_indexer)
+    # Nodos finales (con INDEX_STREAMING se vectoriza e indexa por tandas en un solo nodo)
+    if INDEX_STREAMING:
+        builder.add_node("VectorizerAgent", run_vectorize_and_index)
+    else:
+        builder.add_node("VectorizerAgent", run_vectorizer)
+        builder.add_node("IndexerAgent",    run_indexer)
 
-    # Definir las aristas (flujo entre agentes):
-    builder.add_edge(START,           "LoaderAgent")      # inicio -> cargador
-    builder.add_edge("LoaderAgent",   "MetadataAgent")    # cargador -> metadata
+    builder.add_edge(entry,           "MetadataAgent")
 
     # De MetadataAgent a cada agente de enriquecimiento (ejecución en paralelo lógica)
     builder.add_edge("MetadataAgent", "SummarizerAgent")
@@ -60,9 +81,127 @@ def build_graph():
 
     # Continuación del flujo tras DebugAgent:
     builder.add_edge("DebugAgent",      "VectorizerAgent")
-    builder.add_edge("VectorizerAgent", "IndexerAgent")
-    builder.add_edge("IndexerAgent",    END)  # Fin del flujo
+    if INDEX_STREAMING:
+        builder.add_edge("VectorizerAgent", END)  # Fin del flujo
+    else:
+        builder.add_edge("VectorizerAgent", "IndexerAgent")
+        builder.add_edge("IndexerAgent",    END)  # Fin del flujo
+
+
+# ---------------------------------------------------------------------- Modo por documento
+_document_graph = None
+_document_graph_lock = threading.Lock()
+
+
+def build_document_graph():
+    """
+    Subgrafo de un único documento: metadatos, enriquecimiento, vectorización e indexación.
+    """
+    builder = StateGraph(DocState)
+    _add_document_stages(builder, START)
+    return builder.compile()
+
+
+def get_document_graph():
+    global _document_graph
+    with _document_graph_lock:
+        if _document_graph is None:
+            _document_graph = build_document_graph()
+        return _document_graph
+
 
-    # Compilar el grafo a un pipeline ejecutable
-    pipeline = builder.compile()
-    return pipeline
+def fan_out_documents(state: DocState) -> List[Send]:
+    """
+    Un Send por documento cargado: cada uno recorre el subgrafo de documento por su cuenta,
+    así que un documento lento no retrasa la indexación de los demás. Todos comparten el
+    conjunto de hashes vistos para seguir detectando duplicados entre documentos, y cada
+    uno recibe sus temas del BERTopic ajustado sobre el corpus (CorpusTopicAgent).
+    """
+    known_hashes = state.get("known_hashes")
+    if known_hashes is None:
+        known_hashes = set()
+    source_stats = state.get("source_stats", {})
+    corpus_topics = state.get("corpus_topics") or []
+    return [
+        Send("DocumentAgent", {
+            "doc_index": idx,
+            "documents": [doc],
+            "source_stats": source_stats,
+            "known_hashes": known_hashes,
+            "corpus_topics": corpus_topics[idx:idx + 1],
+        })
+        for idx, doc in enumerate(state.get("documents", []))
+    ]
+
+
+def run_document(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ejecuta el subgrafo de un documento y devuelve su resumen en 'document_results'.
+    Un fallo se registra en el resumen en lugar de interrumpir al resto de documentos.
+    """
+    doc = task["documents"][0]
+    title = doc.get("title")
+    start = time.perf_counter()
+    result: Dict[str, Any] = {
+        "doc_index": task["doc_index"],
+        "title": title,
+        "source": doc.get("metadata", {}).get("source"),
+    }
+    try:
+        final = get_document_graph().invoke({
+            "documents": task["documents"],
+            "source_stats": task["source_stats"],
+            "known_hashes": task["known_hashes"],
+            "corpus_topics": task["corpus_topics"],
+        })
+        metadatos = final.get("metadatos") or [{}]
+        result.update(metadatos=metadatos[0], index_result=final.get("index_result", {}), error=None)
+    except Exception as e:
+        logging.error(f"[DocumentAgent] Error procesando '{title}': {e}")
+        result.update(metadatos={}, index_result={}, error=str(e))
+    result["elapsed_s"] = round(time.perf_counter() - start, 2)
+    logging.info(f"[DocumentAgent] '{title}' terminado en {result['elapsed_s']}s")
+    return {"document_results": [result]}
+
+
+def build_graph(mode: str = PIPELINE_MODE, max_concurrency: int = PIPELINE_MAX_CONCURRENCY):
+    """
+    mode="batch": cada etapa procesa todos los documentos y los cinco agentes de
+    enriquecimiento se sincronizan en DebugAgent antes de vectorizar.
+    mode="document": tras LoaderAgent, CorpusTopicAgent ajusta BERTopic sobre todo el corpus
+    y cada documento recorre el pipeline completo por su cuenta (Send a DocumentAgent), con
+    como mucho `max_concurrency` documentos en curso.
+    """
+    # Crear el grafo de estado basado en nuestra estructura DocState
+    builder = StateGraph(DocState)
+    builder.add_node("LoaderAgent",    run_loader)
+    builder.add_edge(START,           "LoaderAgent")      # inicio -> cargador
+
+    if mode == "batch":
+        _add_document_stages(builder, "LoaderAgent")      # cargador -> metadata -> ...
+        # Compilar el grafo a un pipeline ejecutable
+        return builder.compile()
+    if mode != "document":
+        raise ValueError(f"Modo del pipeline desconocido: '{mode}' (usa 'batch' o 'document').")
+
+    # BERTopic se ajusta una vez sobre todo el corpus antes de repartir los documentos
+    builder.add_node("CorpusTopicAgent", run_corpus_topics)
+    builder.add_node("DocumentAgent",  run_document)
+    builder.add_edge("LoaderAgent",   "CorpusTopicAgent")
+    builder.add_conditional_edges("CorpusTopicAgent", fan_out_documents, ["DocumentAgent"])
+    builder.add_edge("DocumentAgent", END)
+    # max_concurrency limita las tareas de un mismo paso: aquí, los documentos en curso
+    return builder.compile().with_config(max_concurrency=max(1, max_concurrency))
+
+
+def stream_documents(file_path: str,
+                     max_concurrency: int = PIPELINE_MAX_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """
+    Ejecuta el pipeline por documento sobre `file_path` (fichero o carpeta) y genera el
+    resumen de cada documento en cuanto termina, sin esperar a los demás.
+    """
+    pipeline = build_graph(mode="document", max_concurrency=max_concurrency)
+    for update in pipeline.stream({"file_path": file_path}, stream_mode="updates"):
+        for node, values in update.items():
+            if node == "DocumentAgent" and values:
+                yield from values.get("document_results", [])
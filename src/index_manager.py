@@ -0,0 +1,395 @@
+"""
+Ciclo de vida del índice vectorial de una colección de Milvus.
+
+El índice se crea una sola vez (si no existe) y su tipo y parámetros se eligen según el
+número de vectores de la colección:
+  - pocos vectores: FLAT (búsqueda exacta, sin coste de construcción)
+  - tamaño medio: HNSW, con M y efConstruction crecientes con el tamaño
+  - muy grande: IVF_FLAT con nlist ~ 4·sqrt(n)
+Los vectores de VectorizerAgent están normalizados, así que la métrica es COSINE
+(HAMMING para vectores binarios). Cuando la colección cruza un umbral de tamaño, o el
+índice existente usa otra métrica, el índice se reconstruye en un hilo en segundo plano
+y ensure_index no espera por él. Milvus solo admite un índice por campo y no permite
+cambiarlo con la colección cargada, así que mientras se reconstruye la colección no puede
+servir búsquedas: las búsquedas y consultas esperan (wait_serving) a que el índice nuevo
+esté construido y cargado en lugar de fallar. Milvus indexa por sí mismo los segmentos
+nuevos, así que insertar no requiere volver a crear el índice.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from src.settings import (
+    INDEX_METRIC,
+    INDEX_FLAT_MAX_ROWS,
+    INDEX_HNSW_MAX_ROWS,
+    INDEX_BACKGROUND_REBUILD,
+    INDEX_REBUILD_WAIT_S,
+    MILVUS_MAX_LOADED_PARTITIONS,
+)
+
+VECTOR_FIELD = "embedding"
+VECTOR_INDEX_NAME = "embedding_index"
+_UNKNOWN = object()
+
+
+def choose_index(n_rows: int,
+                 binary: bool = False,
+                 metric: str = INDEX_METRIC,
+                 flat_max_rows: int = INDEX_FLAT_MAX_ROWS,
+                 hnsw_max_rows: int = INDEX_HNSW_MAX_ROWS) -> Dict[str, Any]:
+    """
+    Parámetros de índice recomendados para una colección de `n_rows` vectores.
+    """
+    nlist = int(min(65536, max(64, 4 * math.sqrt(max(n_rows, 1)))))
+    if binary:
+        if n_rows <= flat_max_rows:
+            return {"index_type": "BIN_FLAT", "metric_type": "HAMMING", "params": {}}
+        return {"index_type": "BIN_IVF_FLAT", "metric_type": "HAMMING", "params": {"nlist": nlist}}
+    if n_rows <= flat_max_rows:
+        return {"index_type": "FLAT", "metric_type": metric, "params": {}}
+    if n_rows <= hnsw_max_rows:
+        m = 16 if n_rows <= 500_000 else 32
+        return {"index_type": "HNSW", "metric_type": metric, "params": {"M": m, "efConstruction": 8 * m + 72}}
+    return {"index_type": "IVF_FLAT", "metric_type": metric, "params": {"nlist": nlist}}
+
+
+def search_params(index: Dict[str, Any], top_k: int, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Parámetros de búsqueda coherentes con el índice: ef para HNSW, nprobe para IVF.
+    `overrides` ({"ef": 128} o {"nprobe": 32}) sustituye el valor automático; solo se aplica
+    el parámetro que corresponde al tipo de índice.
+    """
+    overrides = overrides or {}
+    index_type = index.get("index_type", "")
+    params: Dict[str, Any] = {}
+    if index_type == "HNSW":
+        # ef nunca puede ser menor que el número de resultados pedidos
+        params["ef"] = max(top_k, int(overrides["ef"])) if overrides.get("ef") else max(64, 2 * top_k)
+    elif "IVF" in index_type:
+        nlist = int(index.get("params", {}).get("nlist", 128))
+        nprobe = int(overrides["nprobe"]) if overrides.get("nprobe") else max(8, nlist // 16)
+        params["nprobe"] = min(nlist, nprobe)
+    return {"metric_type": index.get("metric_type", INDEX_METRIC), "params": params}
+
+
+def _needs_rebuild(current: Dict[str, Any], desired: Dict[str, Any]) -> bool:
+    if current.get("index_type") != desired["index_type"] or current.get("metric_type") != desired["metric_type"]:
+        return True
+    # Dentro de IVF solo compensa reconstruir si nlist se ha quedado muy corto
+    current_nlist = int(current.get("params", {}).get("nlist", 0) or 0)
+    desired_nlist = int(desired["params"].get("nlist", 0) or 0)
+    return bool(desired_nlist and current_nlist and desired_nlist >= 2 * current_nlist)
+
+
+class IndexManager:
+    """
+    Gestiona el índice y la carga en memoria de una colección (objeto pymilvus.Collection).
+    La carga puede ser de la colección entera o solo de algunas particiones; en ese caso se
+    mantienen cargadas como máximo `max_loaded_partitions` (se liberan las menos usadas que
+    no esté usando ninguna búsqueda en curso, ver serving). Mientras la colección entera
+    está cargada (búsquedas sin poda) no se libera ninguna partición.
+    """
+    def __init__(self,
+                 collection: Any,
+                 binary: bool = False,
+                 metric: str = INDEX_METRIC,
+                 background: bool = INDEX_BACKGROUND_REBUILD,
+                 max_loaded_partitions: int = MILVUS_MAX_LOADED_PARTITIONS,
+                 using: str = "default",
+                 rebuild_wait_s: float = INDEX_REBUILD_WAIT_S):
+        self.collection = collection
+        self.using = using
+        self.binary = binary
+        self.metric = metric
+        self.background = background
+        self.max_loaded_partitions = max_loaded_partitions
+        self._lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self.rebuild_wait_s = rebuild_wait_s
+        # Desactivado mientras una reconstrucción tiene el índice borrado o la colección liberada
+        self._serving = threading.Event()
+        self._serving.set()
+        self.last_build: Dict[str, Any] = {}
+        # Índice vectorial leído de Milvus (describe_index); se invalida al construir otro
+        self._index_info: Any = _UNKNOWN
+        # Particiones cargadas, de la menos a la más recientemente usada
+        self.loaded_partitions: "OrderedDict[str, float]" = OrderedDict()
+        # load_state de la colección es Loaded en cuanto hay una partición cargada: la carga
+        # completa se registra aparte
+        self.collection_loaded = False
+        # Particiones en uso por búsquedas en curso (no se pueden liberar)
+        self._pinned: Counter = Counter()
+        self._load_lock = threading.RLock()
+
+    def _vector_index(self) -> Optional[Any]:
+        # La colección puede tener también índices escalares: se busca el del campo vectorial
+        for index in self.collection.indexes:
+            if index.field_name == VECTOR_FIELD:
+                return index
+        return None
+
+    def current_index(self, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Tipo, métrica y parámetros del índice existente (None si no hay índice). Se leen de
+        Milvus una vez y se guardan hasta la próxima construcción (o con `refresh`).
+        """
+        if refresh or self._index_info is _UNKNOWN:
+            self._index_info = self._read_index()
+        return self._index_info
+
+    def _read_index(self) -> Optional[Dict[str, Any]]:
+        index = self._vector_index()
+        if index is None:
+            return None
+        params = dict(index.params)
+        inner = params.get("params", {})
+        if isinstance(inner, str):
+            inner = json.loads(inner)
+        return {
+            "index_type": params.get("index_type"),
+            "metric_type": params.get("metric_type"),
+            "params": inner or {},
+        }
+
+    def desired_index(self, n_rows: Optional[int] = None) -> Dict[str, Any]:
+        n_rows = self.collection.num_entities if n_rows is None else n_rows
+        return choose_index(n_rows, binary=self.binary, metric=self.metric)
+
+    def _build(self, index: Dict[str, Any], rows: int, drop: bool) -> Dict[str, Any]:
+        from pymilvus import utility
+        start = time.perf_counter()
+        self._index_info = _UNKNOWN
+        if drop:
+            # Milvus no permite cambiar el índice de una colección cargada
+            self.collection.release()
+            self.collection.drop_index(index_name=self._vector_index().index_name)
+        self.collection.create_index(field_name=VECTOR_FIELD, index_params=index, index_name=VECTOR_INDEX_NAME)
+        utility.wait_for_index_building_complete(self.collection.name, using=self.using)
+        self._index_info = _UNKNOWN
+        build_time = time.perf_counter() - start
+        self.last_build = {
+            "index_type": index["index_type"],
+            "metric_type": index["metric_type"],
+            "params": index["params"],
+            "rows": rows,
+            "build_time_s": round(build_time, 3),
+            "rebuild": drop,
+        }
+        logging.info(
+            f"[IndexManager] Índice {index['index_type']} ({index['metric_type']}, {index['params']}) "
+            f"construido en {build_time:.2f}s sobre {rows} vectores de '{self.collection.name}'"
+        )
+        return self.last_build
+
+    def _rebuild(self, index: Dict[str, Any], rows: int) -> None:
+        self._serving.clear()
+        with self._lock:
+            try:
+                self._build(index, rows, drop=True)
+                # Se vuelve a cargar lo que estaba cargado antes de la reconstrucción
+                if self.loaded_partitions and not self.collection_loaded:
+                    self.collection.load(partition_names=list(self.loaded_partitions))
+                else:
+                    self.collection.load()
+                    self.collection_loaded = True
+            except Exception as e:
+                logging.error(f"[IndexManager] Error al reconstruir el índice de '{self.collection.name}': {e}")
+            finally:
+                self._serving.set()
+
+    def ensure_index(self) -> Dict[str, Any]:
+        """
+        Crea el índice si falta. Si existe pero ya no es el adecuado para el tamaño actual
+        (o usa otra métrica), programa su reconstrucción en segundo plano.
+        Devuelve el estado: {"action": "created"|"kept"|"rebuilding", "index": {...}}.
+        """
+        if self.rebuilding:
+            return {"action": "rebuilding", "index": self.current_index()}
+        rows = self.collection.num_entities
+        desired = self.desired_index(rows)
+        # Otro proceso puede haber cambiado el índice: aquí se vuelve a leer
+        current = self.current_index(refresh=True)
+        if current is None:
+            with self._lock:
+                self._build(desired, rows, drop=False)
+            return {"action": "created", "index": desired, "build": self.last_build}
+        if not _needs_rebuild(current, desired):
+            return {"action": "kept", "index": current}
+
+        logging.info(
+            f"[IndexManager] '{self.collection.name}' tiene {rows} vectores: índice "
+            f"{current['index_type']}/{current['metric_type']} -> {desired['index_type']}/{desired['metric_type']}"
+        )
+        if not self.background:
+            self._rebuild(desired, rows)
+            return {"action": "rebuilt", "index": desired, "build": self.last_build}
+        # Se marca antes de arrancar el hilo para que ninguna búsqueda se cuele entre medias
+        self._serving.clear()
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(desired, rows), name="milvus-index-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+        return {"action": "rebuilding", "index": current}
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que termine una reconstrucción en curso. Devuelve True si no queda ninguna.
+        """
+        if self._rebuild_thread is not None:
+            self._rebuild_thread.join(timeout)
+        return not self.rebuilding
+
+    def wait_serving(self, timeout: Optional[float] = None) -> None:
+        """
+        Bloquea mientras una reconstrucción impide buscar en la colección (como mucho
+        `timeout` segundos, por defecto rebuild_wait_s; después lanza TimeoutError).
+        """
+        if self._serving.is_set():
+            return
+        logging.info(f"[IndexManager] '{self.collection.name}' está reconstruyendo su índice; esperando para buscar")
+        if not self._serving.wait(self.rebuild_wait_s if timeout is None else timeout):
+            raise TimeoutError(f"El índice de '{self.collection.name}' sigue reconstruyéndose")
+
+    def ensure_loaded(self, partitions: Optional[List[str]] = None) -> bool:
+        """
+        Carga en memoria la colección entera (o solo `partitions`) si no lo está ya.
+        Si hay una reconstrucción en curso, espera antes a que termine.
+        Devuelve True si ha tenido que cargar algo.
+        """
+        from pymilvus import utility
+        from pymilvus.client.types import LoadState
+        self.wait_serving()
+        with self._load_lock:
+            if not partitions:
+                if self.collection_loaded:
+                    return False
+                # Con alguna partición cargada la colección ya figura como Loaded: se comprueban todas
+                names = [partition.name for partition in self.collection.partitions]
+                loaded = utility.load_state(self.collection.name, partition_names=names,
+                                            using=self.using) == LoadState.Loaded
+                if not loaded:
+                    self.collection.load()
+                    logging.info(f"[IndexManager] Colección '{self.collection.name}' cargada entera")
+                self.collection_loaded = True
+                now = time.monotonic()
+                for name in names:
+                    self.loaded_partitions[name] = now
+                    self.loaded_partitions.move_to_end(name)
+                return not loaded
+
+            now = time.monotonic()
+            missing = [p for p in partitions if p not in self.loaded_partitions]
+            for name in partitions:
+                self.loaded_partitions[name] = now
+                self.loaded_partitions.move_to_end(name)
+            missing = [
+                p for p in missing
+                if utility.load_state(self.collection.name, partition_names=[p], using=self.using) != LoadState.Loaded
+            ]
+            if missing:
+                self.collection.load(partition_names=missing)
+                logging.info(f"[IndexManager] Particiones cargadas en '{self.collection.name}': {missing}")
+            self._evict(keep=set(partitions))
+            return bool(missing)
+
+    @contextmanager
+    def serving(self, partitions: Optional[List[str]] = None) -> Iterator[None]:
+        """
+        Carga lo que necesita una búsqueda (ensure_loaded) y evita que _evict libere sus
+        particiones hasta que termine:
+            with manager.serving(partitions):
+                collection.search(..., partition_names=partitions)
+        """
+        # La espera por una reconstrucción se hace fuera del lock de carga
+        self.wait_serving()
+        with self._load_lock:
+            self.ensure_loaded(partitions)
+            self._pinned.update(partitions or [])
+        try:
+            yield
+        finally:
+            with self._load_lock:
+                self._pinned.subtract(partitions or [])
+                self._pinned += Counter()  # descarta las que ya no usa nadie
+                # Las que no se pudieron liberar mientras estaban en uso
+                self._evict(keep=set())
+
+    def _evict(self, keep: set) -> None:
+        # Libera las particiones menos usadas por encima del máximo: nunca las que se van a
+        # usar ahora, las de búsquedas en curso ni ninguna con la colección entera cargada
+        if self.max_loaded_partitions <= 0 or self.collection_loaded:
+            return
+        while len(self.loaded_partitions) > self.max_loaded_partitions:
+            victim = next((p for p in self.loaded_partitions if p not in keep and not self._pinned[p]), None)
+            if victim is None:
+                break
+            self.release([victim])
+
+    def release(self, partitions: Optional[List[str]] = None) -> None:
+        """
+        Libera de memoria las particiones indicadas (o la colección entera).
+        """
+        with self._load_lock:
+            self.collection_loaded = False
+            if not partitions:
+                self.collection.release()
+                self.loaded_partitions.clear()
+                return
+            for name in partitions:
+                partition = self.collection.partition(name)
+                if partition is not None:
+                    partition.release()
+                self.loaded_partitions.pop(name, None)
+        logging.info(f"[IndexManager] Particiones liberadas en '{self.collection.name}': {partitions}")
+
+    def search_params(self, top_k: int, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        index = self.current_index() or self.desired_index()
+        return search_params(index, top_k, overrides)
+
+    def measure_search_latency(self,
+                               queries: List[Any],
+                               top_k: int = 10,
+                               repeat: int = 3) -> Dict[str, Any]:
+        """
+        Latencia de búsqueda (una consulta por llamada) sobre la colección cargada.
+        `queries` ya debe estar en el formato del campo vectorial.
+        """
+        param = self.search_params(top_k)
+        latencies = []
+        for _ in range(repeat):
+            for query in queries:
+                start = time.perf_counter()
+                self.collection.search(data=[query], anns_field=VECTOR_FIELD, param=param, limit=top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+        values = np.asarray(latencies)
+        return {
+            "index": self.current_index(),
+            "rows": self.collection.num_entities,
+            "searches": len(latencies),
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "mean_ms": round(float(values.mean()), 3),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "collection": self.collection.name,
+            "rows": self.collection.num_entities,
+            "index": self.current_index(),
+            "rebuilding": self.rebuilding,
+            "last_build": self.last_build,
+            "collection_loaded": self.collection_loaded,
+            "loaded_partitions": list(self.loaded_partitions),
+        }
@@ -1,181 +1,842 @@
 import logging
-from typing import Any, List, Dict
-from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
-from src.state import DocState
+import os
+import re
+import threading
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+import numpy as np
+from pymilvus import FieldSchema, CollectionSchema, DataType, Collection, utility
+from src.index_manager import IndexManager
+from src.milvus_connection import MilvusConnectionManager, get_connection_manager
+from src.milvus_writer import MilvusWriter
+from src.text_store import TextStore, split_payload
+from src.milvus_schema import (
+    PARTITION_KEYS,
+    SCALAR_FIELDS,
+    build_filter_expr,
+    chunk_primary_key,
+    field_names,
+    flatten_metadata,
+    merge_metadata,
+    partition_name,
+    partitions_for_filters,
+    split_metadata,
+)
+from src.settings import (
+    MILVUS_HOST,
+    MILVUS_PORT,
+    MILVUS_COLLECTION,
+    MILVUS_PARTITION_BY,
+    TEXT_STORE_ENABLED,
+    TEXT_STORE_DIR,
+    TEXT_STORE_CODEC,
+    SPARSE_INDEX_ENABLED,
+    VECTOR_STORAGE,
+    VECTOR_PCA_DIM,
+    VECTOR_PCA_DIR,
+    VECTOR_PCA_MIN_ROWS,
+    VECTOR_RERANK_FACTOR,
+)
+from src.vector_utils import (
+    PCAProjector,
+    as_embedding_matrix,
+    binarize,
+    to_bfloat16_array,
+    to_bfloat16_bits,
+    to_float16,
+    validate_embeddings,
+)
+
+# Tipo de campo vectorial de Milvus para cada representación
+VECTOR_FIELD_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "bfloat16": DataType.BFLOAT16_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+    "pca": DataType.FLOAT_VECTOR,
+}
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# Tamaño de los lotes de ids en las expresiones `id in [...]` (consultas y borrados)
+ID_BATCH = 1000
+
 
 class IndexerAgent:
     """
     Agente para indexar embeddings + metadatos JSON en Milvus.
+    La conexión se abre de forma perezosa en la primera indexación, no al construir el agente.
+    `storage` fija cómo se guardan los vectores al crear la colección:
+      - "float32": FLOAT_VECTOR (4 bytes por dimensión)
+      - "float16" / "bfloat16": FLOAT16_VECTOR / BFLOAT16_VECTOR (2 bytes por dimensión)
+      - "binary": BINARY_VECTOR (1 bit por dimensión, Hamming); la búsqueda recupera
+        `rerank_factor` veces más candidatos y los re-ordena con los vectores float
+      - "pca": FLOAT_VECTOR de `pca_dim` dimensiones, con una PCA ajustada sobre las
+        primeras `pca_min_rows` filas indexadas (la primera ingesta debe tener al menos esas)
+    Con `partition_by` ("lang", "source_folder" o "year") cada fila se inserta en la
+    partición que le corresponde; las búsquedas filtradas por esa clave solo cargan y
+    recorren sus particiones.
+    Con `text_store` el texto de los fragmentos y los detalles de enriquecimiento de los
+    documentos no se guardan en el JSON de Milvus sino en un TextStore comprimido
+    (ver src/text_store.py), del que se leen bajo demanda por clave primaria.
     """
     def __init__(self, 
-                 collection_name: str = "documentos_legales_v2", 
-                 host: str = "localhost", 
-                 port: str = "19530"):
+                 collection_name: str = MILVUS_COLLECTION, 
+                 host: str = MILVUS_HOST, 
+                 port: str = MILVUS_PORT,
+                 storage: str = VECTOR_STORAGE,
+                 pca_dim: int = VECTOR_PCA_DIM,
+                 pca_min_rows: int = VECTOR_PCA_MIN_ROWS,
+                 rerank_factor: int = VECTOR_RERANK_FACTOR,
+                 partition_by: str = MILVUS_PARTITION_BY,
+                 text_store: bool = TEXT_STORE_ENABLED):
+        if storage not in VECTOR_FIELD_TYPES:
+            raise ValueError(f"Representación de vectores desconocida: '{storage}' (usa {list(VECTOR_FIELD_TYPES)}).")
+        if partition_by and partition_by not in PARTITION_KEYS:
+            raise ValueError(f"Clave de partición desconocida: '{partition_by}' (usa {list(PARTITION_KEYS)}).")
         self.collection_name = collection_name
-        connections.connect(alias="default", host=host, port=port)
-        self.collection = None
-        logging.info(f"[IndexerAgent] Inicializado con colección: {self.collection_name}")
+        self.host = host
+        self.port = port
+        self.storage = storage
+        self.pca_dim = pca_dim
+        self.pca_min_rows = max(pca_min_rows, pca_dim)
+        self.rerank_factor = max(1, rerank_factor)
+        self.partition_by = partition_by
+        self._partitions: set = set()
+        self.use_text_store = text_store
+        self._text_store: Optional[TextStore] = None
+        self._alias: Optional[str] = None
+        # Colección e IndexManager quedan ligados al alias (y al canal gRPC) del proceso que
+        # los abrió: tras un fork se descartan y se vuelven a abrir con un alias del hijo
+        self._pid = os.getpid()
+        self._collection = None
+        self._index_manager: Optional[IndexManager] = None
+        # Una Collection por alias del pool para las búsquedas (como MilvusWriter._collection):
+        # construirla cuesta un has_collection y un describe_collection
+        self._search_collections: Dict[str, Any] = {}
+        self._search_lock = threading.Lock()
+        self._pca: Optional[PCAProjector] = None
+        logging.info(f"[IndexerAgent] Inicializado con colección: {self.collection_name} (vectores {self.storage})")
+
+    def _check_fork(self) -> None:
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._collection = None
+            self._index_manager = None
+            self._alias = None
+            self._text_store = None
+            self._search_collections = {}
+            self._search_lock = threading.Lock()
+            logging.info(f"[IndexerAgent] Proceso hijo: se reabre la colección '{self.collection_name}'")
+
+    @property
+    def collection(self) -> Any:
+        self._check_fork()
+        return self._collection
+
+    @collection.setter
+    def collection(self, value: Any) -> None:
+        self._check_fork()
+        self._collection = value
+
+    @property
+    def index_manager(self) -> Optional[IndexManager]:
+        self._check_fork()
+        return self._index_manager
+
+    @index_manager.setter
+    def index_manager(self, value: Optional[IndexManager]) -> None:
+        self._check_fork()
+        self._index_manager = value
+
+    def _search_collection(self, alias: str) -> Any:
+        self._check_fork()
+        with self._search_lock:
+            if alias not in self._search_collections:
+                self._search_collections[alias] = Collection(self.collection_name, using=alias)
+            return self._search_collections[alias]
+
+    @property
+    def connections(self) -> MilvusConnectionManager:
+        """
+        Gestor de conexiones compartido con el resto de agentes que usan el mismo servidor.
+        """
+        return get_connection_manager(self.host, self.port)
+
+    def _connect(self) -> str:
+        """
+        Alias de la conexión principal con Milvus (se abre en el primer uso y se
+        comprueba periódicamente; ver src/milvus_connection.py).
+        """
+        self._alias = self.connections.alias()
+        return self._alias
+
+    @property
+    def pca_path(self) -> str:
+        return os.path.join(VECTOR_PCA_DIR, f"{_UNSAFE_CHARS.sub('_', self.collection_name)}.npz")
+
+    @property
+    def text_store_path(self) -> str:
+        return os.path.join(TEXT_STORE_DIR, f"{_UNSAFE_CHARS.sub('_', self.collection_name)}.sqlite")
+
+    @property
+    def text_store(self) -> Optional[TextStore]:
+        """
+        Almacén de textos de la colección (se abre en el primer uso; None si está desactivado).
+        """
+        self._check_fork()
+        if self.use_text_store and self._text_store is None:
+            self._text_store = TextStore(self.text_store_path, codec=TEXT_STORE_CODEC,
+                                         sparse=SPARSE_INDEX_ENABLED)
+        return self._text_store
+
+    def _get_pca(self, matrix: Optional[np.ndarray] = None) -> PCAProjector:
+        """
+        Proyección PCA de la colección: se carga de disco o, si no existe, se ajusta
+        con `matrix` (al menos pca_min_rows vectores, ver _buffer_for_pca) y se guarda.
+        """
+        if self._pca is None:
+            if os.path.exists(self.pca_path):
+                self._pca = PCAProjector.load(self.pca_path)
+            elif matrix is None:
+                raise RuntimeError(f"No existe la proyección PCA de la colección en {self.pca_path}.")
+            elif len(matrix) < self.pca_min_rows:
+                raise ValueError(self._pca_rows_error(len(matrix)))
+            else:
+                self._pca = PCAProjector.fit(matrix, self.pca_dim)
+                self._pca.save(self.pca_path)
+                logging.info(
+                    f"[IndexerAgent] PCA {self._pca.input_dim}->{self._pca.output_dim} ajustada "
+                    f"({self._pca.explained_variance_ratio:.1%} de la varianza) y guardada en {self.pca_path}"
+                )
+        return self._pca
+
+    def _pca_rows_error(self, rows: int) -> str:
+        return (
+            f"VECTOR_STORAGE='pca' ajusta la proyección con los primeros {self.pca_min_rows} vectores "
+            f"de la colección '{self.collection_name}' y esta ingesta solo tiene {rows}: indexa un corpus "
+            f"mayor la primera vez, baja VECTOR_PCA_MIN_ROWS o usa otra representación (p. ej. float16)."
+        )
+
+    def _buffer_for_pca(self, batches: Iterable[Tuple[Any, List[Dict[str, Any]]]]
+                        ) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Sin proyección PCA guardada, retiene las primeras tandas hasta reunir pca_min_rows
+        vectores, ajusta la PCA con todos ellos y después las deja pasar: un primer lote
+        pequeño no fija una proyección pobre para todo el corpus. Si la ingesta termina
+        antes, lanza ValueError sin haber creado ni escrito nada.
+        """
+        iterator = iter(batches)
+        if self._pca is None and not os.path.exists(self.pca_path):
+            buffered: List[Tuple[np.ndarray, List[Dict[str, Any]]]] = []
+            rows = 0
+            for embeddings, metadata in iterator:
+                buffered.append((self._validate_batch(embeddings, metadata), metadata))
+                rows += len(metadata)
+                if rows >= self.pca_min_rows:
+                    break
+            if rows < self.pca_min_rows:
+                raise ValueError(self._pca_rows_error(rows))
+            self._get_pca(np.concatenate([matrix for matrix, _ in buffered]))
+            yield from buffered
+        yield from iterator
+
+    def _encode_vectors(self, matrix: np.ndarray) -> List[Any]:
+        """
+        Convierte la matriz float32 al formato de la columna vectorial según `storage`
+        (filas float32 o bytes por vector para float16, bfloat16 y binario).
+        """
+        if self.storage == "float32":
+            return list(matrix)
+        if self.storage == "pca":
+            return list(self._get_pca(matrix).transform(matrix))
+        if self.storage == "float16":
+            encoded = to_float16(matrix)
+        elif self.storage == "bfloat16":
+            encoded = to_bfloat16_bits(matrix)
+        else:
+            encoded = binarize(matrix)
+        return [row.tobytes() for row in encoded]
+
+    def _encode_queries(self, queries: np.ndarray) -> List[Any]:
+        """
+        Vectores de consulta en el formato que pymilvus asocia al tipo de la columna:
+        pymilvus toma cualquier `bytes` como BINARY_VECTOR, así que float16 y bfloat16
+        se envían como arrays tipados (np.float16 y ml_dtypes.bfloat16) y solo el
+        almacenamiento binario usa bytes.
+        """
+        if self.storage == "pca":
+            return list(self._get_pca().transform(queries))
+        if self.storage == "float16":
+            return list(to_float16(queries))
+        if self.storage == "bfloat16":
+            return list(to_bfloat16_array(queries))
+        return self._encode_vectors(queries)
+
+    def _stored_dim(self, dim: int) -> int:
+        if self.storage == "pca":
+            return self.pca_dim
+        if self.storage == "binary" and dim % 8:
+            raise ValueError(f"La cuantización binaria requiere una dimensión múltiplo de 8 (es {dim}).")
+        return dim
 
     def _create_collection(self, dim: int):
         """
-        Crea una colección con 3 campos: 
-          - id       (INT64, primary, auto_id)
-          - embedding (FLOAT_VECTOR, dimension=dim)
-          - metadata  (JSON)
+        Crea una colección con los campos: 
+          - id       (INT64, primary, determinista: ver chunk_primary_key)
+          - embedding (vector según `storage`, dimension=dim o pca_dim)
+          - columnas escalares tipadas e indexadas (ver src/milvus_schema.py):
+            doc_hash, chunk_index, title, lang, author, token_count, date_min, date_max, source
+          - metadata  (JSON con el resto de metadatos)
         """
         fields = [
             FieldSchema(
                 name="id", 
                 dtype=DataType.INT64, 
                 is_primary=True, 
-                auto_id=True
+                auto_id=False
             ),
             FieldSchema(
                 name="embedding", 
-                dtype=DataType.FLOAT_VECTOR, 
-                dim=dim
+                dtype=VECTOR_FIELD_TYPES[self.storage], 
+                dim=self._stored_dim(dim)
             ),
+            *[field.schema() for field in SCALAR_FIELDS],
             FieldSchema(
                 name="metadata",
                 dtype=DataType.JSON
             )
         ]
-        schema = CollectionSchema(fields, description="Colección de embeddings R50 + metadatos JSON")
-        self.collection = Collection(name=self.collection_name, schema=schema)
-        logging.info(f"[IndexerAgent] Colección '{self.collection_name}' creada con dimensión {dim}.")
+        schema = CollectionSchema(fields, description=f"Colección de embeddings R50 ({self.storage}) + metadatos JSON")
+        self.collection = Collection(name=self.collection_name, schema=schema, using=self._connect())
+        for field in SCALAR_FIELDS:
+            self.collection.create_index(
+                field_name=field.name,
+                index_params={"index_type": field.index_type},
+                index_name=f"{field.name}_index",
+            )
+        logging.info(
+            f"[IndexerAgent] Colección '{self.collection_name}' creada con dimensión {self._stored_dim(dim)} "
+            f"(vectores {self.storage})."
+        )
 
     def _get_or_create_collection(self, dim: int):
         """
         Si la colección existe, comprueba que su dimensión coincide. Si no existe, la crea.
         """
         if self.collection is None:
-            if self.collection_name in utility.list_collections():
-                self.collection = Collection(self.collection_name)
-                existing_dim = self.collection.schema.fields[1].params["dim"]
-                if existing_dim != dim:
+            alias = self._connect()
+            if self.collection_name in utility.list_collections(using=alias):
+                self.collection = Collection(self.collection_name, using=alias)
+                field = self.collection.schema.fields[1]
+                if field.dtype != VECTOR_FIELD_TYPES[self.storage]:
                     raise ValueError(
-                        f"Dimensión existente ({existing_dim}) no coincide con la solicitada ({dim})."
+                        f"La colección guarda vectores {field.dtype.name} y el agente está configurado "
+                        f"con VECTOR_STORAGE='{self.storage}'."
+                    )
+                existing_dim = field.params["dim"]
+                if existing_dim != self._stored_dim(dim):
+                    raise ValueError(
+                        f"Dimensión existente ({existing_dim}) no coincide con la solicitada ({self._stored_dim(dim)})."
                     )
                 logging.info(f"[IndexerAgent] Conectado a colección existente '{self.collection_name}' (dim={dim}).")
+                if self.collection.schema.fields[0].auto_id:
+                    logging.warning(
+                        f"[IndexerAgent] La colección '{self.collection_name}' usa auto_id: se insertará sin "
+                        f"deduplicar. Recréala (o usa otra MILVUS_COLLECTION) para tener upserts idempotentes."
+                    )
             else:
                 self._create_collection(dim)
 
-    def run(
-        self,
-        embeddings: List[List[float]],
-        metadata: List[Dict[str, Any]]
-    ) -> Dict[str, Any]:
+    def _validate_batch(self, embeddings: Any, metadata: List[Dict[str, Any]]) -> np.ndarray:
         """
-        embeddings: lista de vectores (List[List[float]])
-        metadata:  lista de diccionarios JSON (List[Dict[str, Any]])
+        Comprueba una tanda (embeddings, metadatos) y devuelve la matriz float32.
         """
-        logging.info(f"[IndexerAgent] Iniciando indexación con {len(embeddings)} embeddings y {len(metadata)} metadatos")
-        
-        if not isinstance(embeddings, list) or not embeddings:
+        if embeddings is None or len(embeddings) == 0:
             raise ValueError("Se esperaba una lista no vacía de embeddings.")
         if not isinstance(metadata, list) or not metadata:
             raise ValueError("Se esperaba una lista no vacía de metadatos.")
         if len(embeddings) != len(metadata):
             raise ValueError("La longitud de embeddings y metadatos debe coincidir.")
 
-        dim = len(embeddings[0])
-        logging.info(f"[IndexerAgent] Dimensión de embeddings: {dim}")
-        for idx, vec in enumerate(embeddings):
-            if len(vec) != dim:
-                raise ValueError(
-                    f"Dimensión del embedding en índice {idx} ({len(vec)}) no coincide con {dim}."
-                )
-
-        # Conectarse o crear la colección según sea necesario
-        self._get_or_create_collection(dim)
-
-        # Validar que cada metadato es un dict plano
-        metadata_limpios = []
-        for idx, meta in enumerate(metadata):
-            if not isinstance(meta, dict):
-                raise ValueError(f"El metadato en la posición {idx} no es un dict.")
-            # Eliminar claves anidadas no deseadas
-            meta_plano = dict(meta)  # copia
-            if "metadata" in meta_plano:
-                inner = meta_plano.pop("metadata")
-                if isinstance(inner, dict):
-                    meta_plano.update(inner)
-            if "metadatos" in meta_plano:
-                inner = meta_plano.pop("metadatos")
-                if isinstance(inner, dict):
-                    meta_plano.update(inner)
-            metadata_limpios.append(meta_plano)
-
-        # LOGS DE DEPURACIÓN ANTES DE INSERTAR
-        logging.info(f"[IndexerAgent] Embeddings a insertar: {len(embeddings)}")
-        logging.info(f"[IndexerAgent] Metadata a insertar: {len(metadata_limpios)}")
-        if metadata_limpios:
-            logging.info(f"[IndexerAgent] Ejemplo de metadata: {metadata_limpios[0]}")
-        else:
-            logging.info(f"[IndexerAgent] Metadata está VACÍO")
-
-        # Preparar los datos para insertar: 
-        # Milvus espera una lista de columnas, en el mismo orden en que definimos los FieldSchema
-        # (omitimos 'id' porque es auto_id):
-        #   - columna embeddings (FLOAT_VECTOR)
-        #   - columna metadatos  (JSON)
-        insert_data = [
-            embeddings,   # FIELD 1: FLOAT_VECTOR
-            metadata_limpios     # FIELD 2: JSON (dict plano)
-        ]
-        logging.info(f"[IndexerAgent] Ejemplo de metadato a insertar: {metadata_limpios[0] if metadata_limpios else 'VACÍO'}")
-        logging.info(f"[IndexerAgent] Preparando inserción de datos...")
-        
+        # FLOAT_VECTOR de Milvus es float32: las matrices float16 se convierten aquí
+        # (np.asarray con listas de longitudes distintas falla, igual que la comprobación anterior)
         try:
-            insert_result = self.collection.insert(insert_data)
-            primary_keys = insert_result.primary_keys
-            insert_count = len(primary_keys)
-            logging.info(f"[IndexerAgent] Datos insertados exitosamente. Primary keys: {primary_keys}")
-        except Exception as e:
-            logging.error(f"[IndexerAgent] Error al insertar datos: {str(e)}")
-            raise e
+            matrix = as_embedding_matrix(embeddings, dtype="float32")
+        except ValueError as e:
+            raise ValueError(f"Los embeddings no tienen todos la misma dimensión: {e}")
+        validate_embeddings(matrix, expected_rows=len(metadata))
+        return matrix
 
-        # Crear índice para permitir búsquedas
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 128}
-        }
-        logging.info(f"[IndexerAgent] Creando índice...")
+    # Conservado por compatibilidad: la lógica vive en milvus_schema
+    _flatten_metadata = staticmethod(flatten_metadata)
+
+    def _columns(self,
+                 ids: Optional[List[int]],
+                 matrix: np.ndarray,
+                 metadata: List[Dict[str, Any]]) -> List[List[Any]]:
+        """
+        Milvus espera una lista de columnas, en el mismo orden en que están los FieldSchema
+        de la colección:
+          - id          (INT64, omitida en colecciones antiguas con auto_id)
+          - embedding   (vector en la representación de `storage`)
+          - columnas escalares (si la colección las tiene)
+          - metadata    (JSON; sin las claves que ya tienen columna propia)
+        """
+        names = field_names(self.collection)
+        typed = [field.name for field in SCALAR_FIELDS if field.name in names]
+        if typed:
+            split = [split_metadata(meta) for meta in metadata]
+        columns: List[List[Any]] = []
+        for name in names:
+            if name == "id":
+                if ids is not None:
+                    columns.append(ids)
+            elif name == "embedding":
+                columns.append(self._encode_vectors(matrix))
+            elif name == "metadata":
+                columns.append([rest for _, rest in split] if typed else metadata)
+            elif name in typed:
+                columns.append([scalars[name] for scalars, _ in split])
+            else:
+                raise ValueError(f"Campo '{name}' de la colección desconocido para el IndexerAgent.")
+        return columns
+
+    def _writer_aliases(self) -> List[str]:
+        """
+        Pool de conexiones para el MilvusWriter (los lotes en vuelo se reparten entre ellas).
+        """
+        return self.connections.pool()
+
+    def run(
+        self,
+        embeddings: Union[np.ndarray, List[List[float]]],
+        metadata: List[Dict[str, Any]],
+        replace: bool = False
+    ) -> Dict[str, Any]:
+        """
+        embeddings: matriz NumPy (n, dim) (también se acepta una lista de vectores)
+        metadata:  lista de diccionarios JSON (List[Dict[str, Any]])
+        Las filas se envían en lotes acotados por filas y bytes (ver run_stream).
+        """
+        logging.info(f"[IndexerAgent] Iniciando indexación con {len(embeddings)} embeddings y {len(metadata)} metadatos")
+        matrix = self._validate_batch(embeddings, metadata)
+        return self.run_stream([(matrix, metadata)], replace=replace)
+
+    def run_stream(self,
+                   batches: Iterable[Tuple[Any, List[Dict[str, Any]]]],
+                   replace: bool = False) -> Dict[str, Any]:
+        """
+        Indexa tandas (embeddings, metadatos) a medida que llegan, p. ej. las de
+        VectorizerAgent.iter_embeddings: mientras Milvus inserta una tanda, se codifica la
+        siguiente. Cada tanda pasa por un MilvusWriter que la divide en lotes de como máximo
+        MILVUS_INSERT_MAX_ROWS filas / MILVUS_INSERT_MAX_BYTES bytes.
+        Con claves deterministas, las filas que ya existen se omiten y, al terminar, se borran
+        las filas antiguas de los mismos documentos (texto o fragmentación distintos).
+        Con `replace` (upsert) las filas que ya existen se borran y se vuelven a escribir,
+        p. ej. para actualizar sus metadatos.
+        """
+        if self.storage == "pca":
+            batches = self._buffer_for_pca(batches)
+        writer: Optional[MilvusWriter] = None
+        auto_id = False
+        seen: set = set()
+        sources: set = set()
+        total = skipped = 0
         try:
-            self.collection.create_index(field_name="embedding", index_params=index_params)
-            logging.info(f"[IndexerAgent] Índice creado para embeddings en '{self.collection_name}'.")
-        except Exception as e:
-            logging.error(f"[IndexerAgent] Error al crear índice: {str(e)}")
-            raise e
+            for embeddings, metadata in batches:
+                matrix = self._validate_batch(embeddings, metadata)
+                if writer is None:
+                    logging.info(f"[IndexerAgent] Dimensión de embeddings: {matrix.shape[1]}")
+                    # Conectarse o crear la colección según sea necesario
+                    self._get_or_create_collection(matrix.shape[1])
+                    auto_id = self.collection.schema.fields[0].auto_id
+                    self._ensure_ready()
+                    writer = MilvusWriter(self.collection_name, aliases=self._writer_aliases())
 
-        # Cargar la colección en memoria para permitir búsquedas
-        logging.info(f"[IndexerAgent] Cargando colección en memoria...")
+                metadata_limpios = self._flatten_metadata(metadata)
+                total += len(metadata_limpios)
+                # Las claves se calculan con los metadatos completos (sin hash de documento
+                # dependen del texto del fragmento)
+                claves = [chunk_primary_key(meta) for meta in metadata_limpios] if not auto_id else []
+                textos: List[Optional[str]] = []
+                if not auto_id and self.text_store is not None:
+                    # El texto y los detalles del documento van al TextStore, no al JSON de Milvus
+                    metadata_limpios, textos = self._store_details(metadata_limpios)
+                if total == len(metadata_limpios):
+                    logging.info(f"[IndexerAgent] Ejemplo de metadata: {metadata_limpios[0]}")
+
+                # Reparto por particiones (una sola, la por defecto, si no hay partition_by)
+                groups: Dict[Optional[str], List[int]] = {}
+                for pos, meta in enumerate(metadata_limpios):
+                    name = partition_name(meta, self.partition_by) if self.partition_by else None
+                    groups.setdefault(name, []).append(pos)
+                if self.partition_by:
+                    self._ensure_partitions(list(groups))
+                    self._ensure_ready(list(groups))
+
+                for name, positions in groups.items():
+                    if auto_id:
+                        writer.write(self._columns(None, matrix[positions],
+                                                   [metadata_limpios[i] for i in positions]), partition=name)
+                        continue
+                    ids = [claves[i] for i in positions]
+                    sources.update(str(metadata_limpios[i]["source"]) for i in positions
+                                   if metadata_limpios[i].get("source"))
+                    keep = self._new_positions(ids, seen, check_existing=not replace)
+                    if replace and keep:
+                        self.delete_ids([ids[i] for i in keep])
+                    skipped += len(ids) - len(keep)
+                    if keep:
+                        rows = [positions[i] for i in keep]
+                        if textos:
+                            # Antes que en Milvus: una fila nunca queda sin su texto
+                            self.text_store.put_chunks([ids[i] for i in keep], [textos[i] for i in rows],
+                                                       [metadata_limpios[i] for i in rows])
+                        writer.write(self._columns(
+                            [ids[i] for i in keep], matrix[rows], [metadata_limpios[i] for i in rows]
+                        ), partition=name)
+        finally:
+            report = writer.close() if writer is not None else None
+
+        if report is None:
+            raise ValueError("Se esperaba una lista no vacía de embeddings.")
+        if report["failed_rows"] and not report["inserted"]:
+            raise RuntimeError(f"No se pudo insertar ningún lote en '{self.collection_name}': {report['failures']}")
+        if report["failures"]:
+            logging.error(
+                f"[IndexerAgent] Inserción parcial: {report['failed_rows']} filas en "
+                f"{len(report['failures'])} lotes no se insertaron"
+            )
+        # Solo se borran filas obsoletas si todas las nuevas se han escrito
+        # (y nunca en un upsert, que actualiza filas sueltas)
+        deleted = self._delete_stale(sources, seen) if not (auto_id or replace or report["failures"]) else 0
+
+        # El índice solo se crea si falta (o se reconstruye en segundo plano al cruzar un
+        # umbral de tamaño); los segmentos nuevos los indexa Milvus por sí mismo
         try:
-            self.collection.load()
-            logging.info(f"[IndexerAgent] Colección '{self.collection_name}' cargada en memoria.")
+            index_status = self._ensure_ready()
+            logging.info(f"[IndexerAgent] Índice de '{self.collection_name}': {index_status['action']} "
+                         f"({index_status['index']})")
         except Exception as e:
-            logging.error(f"[IndexerAgent] Error al cargar colección: {str(e)}")
+            logging.error(f"[IndexerAgent] Error al preparar el índice o cargar la colección: {str(e)}")
             raise e
 
-        logging.info(f"[IndexerAgent] Insertados {insert_count} vectores+metadatos en '{self.collection_name}'.")
-        return {"insert_count": insert_count, "primary_keys": primary_keys}
+        logging.info(
+            f"[IndexerAgent] Insertados {report['inserted']} de {total} vectores+metadatos en "
+            f"'{self.collection_name}' ({report['batches']} lotes, {skipped} ya indexados, {deleted} obsoletos borrados)."
+        )
+        return {
+            "insert_count": report["inserted"],
+            "primary_keys": report["primary_keys"],
+            "skipped_count": skipped,
+            "deleted_count": deleted,
+            "failed_count": report["failed_rows"],
+            "failures": report["failures"],
+            "batches": report["batches"],
+            "retries": report["retries"],
+            "elapsed_s": report["elapsed_s"],
+            "storage": self.storage,
+            "index": index_status,
+        }
 
+    def _store_details(self, metadata: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """
+        Guarda en el TextStore los detalles de enriquecimiento de cada documento y devuelve
+        los metadatos sin texto ni detalles junto con el texto de cada fragmento.
+        """
+        lean_metadata, texts = [], []
+        details_by_doc: Dict[str, Dict[str, Any]] = {}
+        for meta in metadata:
+            lean, text, details = split_payload(meta)
+            lean_metadata.append(lean)
+            texts.append(text)
+            doc_hash = lean.get("doc_id") or lean.get("hash")
+            if details and doc_hash:
+                details_by_doc[doc_hash] = details
+        self.text_store.put_details(details_by_doc)
+        return lean_metadata, texts
 
-# Instancia global para no reconectar en cada llamada
-indexer = IndexerAgent()
+    def fetch_texts(self, ids: List[int]) -> Dict[int, str]:
+        """
+        Texto de los fragmentos indicados por clave primaria ({id: texto}).
+        """
+        return self.text_store.get_chunks(ids) if self.text_store is not None else {}
 
-def run_indexer(state: DocState) -> DocState:
-    """
-    Toma state['embeddings'] y state['metadata'] y los inserta en Milvus.
-    Por defecto, state['metadata'] es la lista de dicts que generaron los agentes anteriores.
-    """
-    embeddings = state.get("embeddings", [])
-    metadata  = state.get("metadatos", [])
+    def document_text(self, doc_hash: str) -> Optional[str]:
+        """
+        Texto completo de un documento indexado, recompuesto desde el TextStore.
+        """
+        return self.text_store.document_text(doc_hash) if self.text_store is not None else None
+
+    def document_details(self, doc_hash: str) -> Dict[str, Any]:
+        """
+        Resumen, palabras clave, temas, estructura e insights de un documento indexado.
+        """
+        return self.text_store.get_details(doc_hash) if self.text_store is not None else {}
+
+    def _query_ids(self, expr: str) -> List[int]:
+        """
+        Ids de todas las filas de la colección que cumplen `expr` (con iterador para no topar
+        con el límite de query). Sirve para deduplicar y limpiar, así que no se poda por
+        partición: un documento que cambia de carpeta, año o idioma tiene filas en otra
+        partición. Por eso se carga la colección entera (y se espera si el índice se está
+        reconstruyendo).
+        """
+        if self.index_manager is None:
+            # Milvus solo consulta datos indexados y cargados: en una colección recién creada
+            # el índice se crea antes de la primera consulta de deduplicación
+            self._ensure_ready()
+        with self.index_manager.serving():
+            if hasattr(self.collection, "query_iterator"):
+                found: List[int] = []
+                iterator = self.collection.query_iterator(expr=expr, output_fields=["id"], batch_size=ID_BATCH)
+                try:
+                    while True:
+                        rows = iterator.next()
+                        if not rows:
+                            break
+                        found.extend(row["id"] for row in rows)
+                finally:
+                    iterator.close()
+                return found
+            return [row["id"] for row in self.collection.query(expr=expr, output_fields=["id"])]
+
+    def delete_ids(self, ids: List[int]) -> int:
+        """
+        Borra filas por clave primaria en lotes de ID_BATCH (y su texto del TextStore).
+        """
+        for start in range(0, len(ids), ID_BATCH):
+            batch = ids[start:start + ID_BATCH]
+            self.collection.delete(expr=f"id in [{', '.join(str(i) for i in batch)}]")
+        if self.text_store is not None:
+            self.text_store.delete_chunks(ids)
+        return len(ids)
+
+    def _new_positions(self,
+                       ids: List[int],
+                       seen: set,
+                       check_existing: bool = True) -> List[int]:
+        """
+        Posiciones de `ids` que hay que insertar: ni repetidas (en `seen`, que se actualiza)
+        ni presentes ya en cualquier partición de la colección (con `check_existing`).
+        """
+        unique = []
+        for pos, pk in enumerate(ids):
+            if pk not in seen:
+                seen.add(pk)
+                unique.append(pos)
+        if not check_existing:
+            return unique
+        existing = set()
+        for start in range(0, len(unique), ID_BATCH):
+            batch = [ids[pos] for pos in unique[start:start + ID_BATCH]]
+            existing.update(self._query_ids(f"id in [{', '.join(str(i) for i in batch)}]"))
+        return [pos for pos in unique if ids[pos] not in existing]
+
+    def _delete_stale(self, sources: set, seen: set) -> int:
+        """
+        Borra las filas de las fuentes indexadas cuya clave no se ha generado en esta ejecución
+        (en todas las particiones).
+        """
+        stale: List[int] = []
+        ordered = sorted(sources)
+        for start in range(0, len(ordered), ID_BATCH):
+            batch = ordered[start:start + ID_BATCH]
+            expr = build_filter_expr({"source": batch}, field_names(self.collection))
+            stale.extend(pk for pk in self._query_ids(expr) if pk not in seen)
+        if stale:
+            logging.info(f"[IndexerAgent] Borrando {len(stale)} fragmentos obsoletos de {len(sources)} fuentes")
+        return self.delete_ids(stale) if stale else 0
+
+    def _ensure_ready(self, partitions: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Crea el índice si falta y carga en memoria lo que aún no lo esté: la colección
+        entera o, con particiones, solo `partitions` (sin particiones indicadas no se carga
+        nada: cada búsqueda carga las suyas).
+        """
+        if self.index_manager is None:
+            self.index_manager = IndexManager(self.collection, binary=self.storage == "binary", using=self._alias or self._connect())
+        status = self.index_manager.ensure_index()
+        if self.partition_by and not partitions:
+            return status
+        if self.index_manager.ensure_loaded(partitions):
+            logging.info(f"[IndexerAgent] '{self.collection_name}' cargada en memoria"
+                         f"{f' (particiones {partitions})' if partitions else ''}.")
+        return status
+
+    def _ensure_partitions(self, names: List[str]) -> None:
+        for name in names:
+            if name not in self._partitions:
+                if not self.collection.has_partition(name):
+                    self.collection.create_partition(name)
+                    logging.info(f"[IndexerAgent] Partición '{name}' creada en '{self.collection_name}'")
+                self._partitions.add(name)
+
+    def load_partitions(self, names: List[str]) -> None:
+        """
+        Carga en memoria solo estas particiones (se liberan las menos usadas si se supera
+        MILVUS_MAX_LOADED_PARTITIONS).
+        """
+        self.open_collection()
+        self._ensure_ready(names)
+
+    def release_partitions(self, names: Optional[List[str]] = None) -> None:
+        """
+        Libera de memoria estas particiones (o toda la colección si no se indican).
+        """
+        self.open_collection()
+        self.index_manager.release(names)
+
+    def _rerank_vectors(self, texts: List[str]) -> np.ndarray:
+        # Vectores float de los candidatos: salen de la caché de embeddings en disco
+        # (solo se codifican los textos que no estén en ella)
+        from src.vectorizer_agent import vectorizer
+        return vectorizer.embed_texts(texts)
+
+    def open_collection(self) -> Any:
+        """
+        Abre la colección existente (sin insertar nada) y la deja indexada y cargada
+        (con particiones, la carga se hace por partición al buscar).
+        """
+        if self.collection is None:
+            self.collection = Collection(self.collection_name, using=self._connect())
+        if self.index_manager is None:
+            self._ensure_ready()
+        return self.collection
 
-    if not embeddings or not metadata:
-        raise ValueError("Faltan embeddings o metadatos en el estado para indexar.")
+    @property
+    def input_dim(self) -> int:
+        """
+        Dimensión de los vectores que acepta el agente (antes de la PCA, si la hay).
+        """
+        if self.storage == "pca":
+            return self._get_pca().input_dim
+        return self.open_collection().schema.fields[1].params["dim"]
+
+    def search(self,
+               query_vectors: Union[np.ndarray, List[List[float]]],
+               top_k: int = 10,
+               rerank: bool = True,
+               filters: Optional[Dict[str, Any]] = None,
+               partitions: Optional[List[str]] = None,
+               with_text: bool = False,
+               search_params: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Busca los `top_k` vecinos de cada vector de consulta (normalizado, float32).
+        `filters` restringe la búsqueda por metadatos (ver milvus_schema.build_filter_expr),
+        p. ej. {"lang": "es", "date_min": (20200101, None)}. Con particiones, los filtros por
+        la clave de partición (o `partitions` explícitas) limitan la búsqueda a esas particiones.
+        Devuelve por consulta una lista de {"id", "distance", "score", "metadata"}, donde
+        "distance" es el valor de Milvus y "score" una similitud (mayor = más parecido);
+        "metadata" incluye las columnas escalares junto con el JSON; el texto de cada
+        fragmento solo se añade (en metadata["text"]) con `with_text`.
+        `search_params` ({"ef": ...} o {"nprobe": ...}) fija el esfuerzo de búsqueda del índice.
+        Con almacenamiento binario se recuperan top_k * rerank_factor candidatos por Hamming
+        y se re-ordenan por coseno con sus vectores float ("score" = coseno).
+        """
+        queries = as_embedding_matrix(query_vectors, dtype="float32")
+        partitions = self._search_partitions(filters, partitions)
+        if partitions == []:
+            return [[] for _ in range(len(queries))]
+
+        binary_rerank = self.storage == "binary" and rerank
+        limit = top_k * self.rerank_factor if binary_rerank else top_k
+        param = self.index_manager.search_params(limit, search_params)
+        similarity = param["metric_type"] in ("COSINE", "IP")
+        names = field_names(self.collection)
+        output_fields = [name for name in names if name not in ("id", "embedding")]
+        data = self._encode_queries(queries)
+        # Las búsquedas concurrentes se reparten entre las conexiones del pool; sus
+        # particiones siguen cargadas hasta que termina
+        with self.index_manager.serving(partitions):
+            hits = self.connections.call(lambda alias: self._search_collection(alias).search(
+                data=data,
+                anns_field="embedding",
+                param=param,
+                limit=limit,
+                expr=build_filter_expr(filters, names) or None,
+                partition_names=partitions,
+                output_fields=output_fields,
+            ))
+        results = []
+        for query, query_hits in zip(queries, hits):
+            candidates = [
+                {
+                    "id": hit.id,
+                    "distance": float(hit.distance),
+                    # COSINE/IP ya son similitudes; L2 y HAMMING son distancias
+                    "score": float(hit.distance) if similarity else -float(hit.distance),
+                    "metadata": merge_metadata({name: hit.entity.get(name) for name in output_fields}),
+                }
+                for hit in query_hits
+            ]
+            if with_text or binary_rerank:
+                self._attach_texts(candidates)
+            texts = [c["metadata"].get("text") for c in candidates]
+            if binary_rerank and candidates and all(texts):
+                scores = self._rerank_vectors(texts) @ query
+                order = np.argsort(-scores, kind="stable")[:top_k]
+                candidates = [dict(candidates[i], score=float(scores[i])) for i in order]
+            results.append(candidates[:top_k])
+        return results
+
+    def _search_partitions(self,
+                           filters: Optional[Dict[str, Any]],
+                           partitions: Optional[List[str]] = None) -> Optional[List[str]]:
+        """
+        Abre la colección y poda sus particiones: solo se recorren las que encajan con los
+        filtros. Devuelve las particiones a recorrer (None = todas, [] = ninguna encaja);
+        la búsqueda las carga con index_manager.serving (sin poda, la colección entera).
+        """
+        self.open_collection()
+        # Los parámetros de búsqueda dependen del índice: se espera a una reconstrucción en curso
+        self.index_manager.wait_serving()
+        if partitions is None and self.partition_by:
+            partitions = partitions_for_filters(filters, self.partition_by)
+        if partitions:
+            partitions = [p for p in partitions if self._has_partition(p)]
+            return partitions or []
+        return None
+
+    def _has_partition(self, name: str) -> bool:
+        # Las particiones no se borran: solo se pregunta a Milvus por las que aún no se conocen
+        if name not in self._partitions and self.collection.has_partition(name):
+            self._partitions.add(name)
+        return name in self._partitions
+
+    def fetch_metadata(self, ids: List[int], filters: Optional[Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Metadatos (columnas escalares más JSON) de las filas indicadas que cumplen `filters`
+        ({id: metadatos}; las que no existen o no cumplen los filtros se omiten).
+        """
+        if not ids:
+            return {}
+        partitions = self._search_partitions(filters)
+        if partitions == []:
+            return {}
+        names = field_names(self.collection)
+        output_fields = [name for name in names if name not in ("id", "embedding")]
+        found: Dict[int, Dict[str, Any]] = {}
+        with self.index_manager.serving(partitions):
+            for start in range(0, len(ids), ID_BATCH):
+                batch = [int(pk) for pk in ids[start:start + ID_BATCH]]
+                expr = " and ".join(filter(None, [f"id in {batch}", build_filter_expr(filters, names)]))
+                for row in self.collection.query(expr=expr, output_fields=output_fields, partition_names=partitions):
+                    found[row["id"]] = merge_metadata(row)
+        return found
+
+    def _attach_texts(self, candidates: List[Dict[str, Any]]) -> None:
+        # Las colecciones antiguas aún llevan el texto en el JSON; el resto lo lee del TextStore
+        missing = [c["id"] for c in candidates if not c["metadata"].get("text")]
+        texts = self.fetch_texts(missing) if missing else {}
+        for candidate in candidates:
+            if candidate["id"] in texts:
+                candidate["metadata"]["text"] = texts[candidate["id"]]
+
+
+# Instancia global para no reconectar en cada llamada (la conexión se abre en el primer uso)
+indexer = IndexerAgent()
 
-    result = indexer.run(embeddings, metadata)
-    state["index_result"] = result
-    return state
\ No newline at end of file
+# Los nodos del grafo usan el almacén configurado (VECTOR_STORE_BACKEND); se reexportan
+# aquí para quien los importaba de este módulo
+from src.vector_store import run_indexer, run_vectorize_and_index  # noqa: E402,F401
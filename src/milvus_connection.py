@@ -0,0 +1,209 @@
+"""
+Conexiones a Milvus compartidas por todo el proceso.
+
+Un MilvusConnectionManager por servidor (host, puerto) gestiona un pequeño pool de alias
+de pymilvus:
+  - las conexiones se abren en el primer uso, nunca al importar
+  - el alias 0 es el principal (creación de colecciones, consultas, índices) y el resto del
+    pool se reparte entre los lotes de inserción y las búsquedas en paralelo
+  - antes de usar un alias, si hace más de MILVUS_HEALTH_INTERVAL_S que no se comprueba, se
+    pide la versión del servidor; si falla, se reconecta con espera exponencial
+  - los alias llevan el PID del proceso: tras un fork el hijo abre sus propios canales gRPC
+    en lugar de usar los heredados del padre (que no son válidos después de un fork)
+"""
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+from src.settings import (
+    MILVUS_HOST,
+    MILVUS_PORT,
+    MILVUS_POOL_SIZE,
+    MILVUS_CONNECT_RETRIES,
+    MILVUS_CONNECT_TIMEOUT_S,
+    MILVUS_HEALTH_INTERVAL_S,
+)
+
+T = TypeVar("T")
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_]+')
+
+
+class MilvusConnectionManager:
+    """
+    Pool de alias de conexión a un servidor Milvus. Uso:
+        manager = get_connection_manager()
+        collection = Collection(name, using=manager.alias())
+        hits = manager.call(lambda alias: Collection(name, using=alias).search(...))
+    """
+    def __init__(self,
+                 host: str = MILVUS_HOST,
+                 port: str = MILVUS_PORT,
+                 pool_size: int = MILVUS_POOL_SIZE,
+                 retries: int = MILVUS_CONNECT_RETRIES,
+                 timeout_s: float = MILVUS_CONNECT_TIMEOUT_S,
+                 health_interval_s: float = MILVUS_HEALTH_INTERVAL_S,
+                 backoff_s: float = 0.5):
+        self.host = host
+        self.port = port
+        self.pool_size = max(1, pool_size)
+        self.retries = max(0, retries)
+        self.timeout_s = timeout_s
+        self.health_interval_s = health_interval_s
+        self.backoff_s = backoff_s
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        # alias -> instante de la última comprobación correcta
+        self._checked: Dict[str, float] = {}
+        self._next_slot = 0
+        self.reconnects = 0
+        _managers_alive.add(self)
+
+    def _alias_name(self, slot: int) -> str:
+        return f"milvus_{_UNSAFE_CHARS.sub('_', f'{self.host}_{self.port}')}_{self._pid}_{slot}"
+
+    def _after_fork(self) -> None:
+        # Los canales heredados son del padre: el hijo no los usa ni los cierra
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._checked = {}
+        self._next_slot = 0
+
+    def _open(self, alias: str) -> None:
+        from pymilvus import connections, utility
+        attempt = 0
+        while True:
+            try:
+                connections.connect(alias=alias, host=self.host, port=self.port, timeout=self.timeout_s)
+                utility.get_server_version(using=alias)
+                self._checked[alias] = time.monotonic()
+                logging.info(f"[MilvusConnection] Conexión '{alias}' abierta con {self.host}:{self.port}")
+                return
+            except Exception as e:
+                self._drop(alias)
+                if attempt >= self.retries:
+                    raise ConnectionError(
+                        f"No se pudo conectar a Milvus en {self.host}:{self.port} tras {attempt + 1} intentos: {e}"
+                    ) from e
+                delay = self.backoff_s * (2 ** attempt)
+                attempt += 1
+                logging.warning(f"[MilvusConnection] Conexión a {self.host}:{self.port} fallida ({e}); "
+                                f"reintento {attempt} en {delay:.1f}s")
+                time.sleep(delay)
+
+    def _drop(self, alias: str) -> None:
+        from pymilvus import connections
+        self._checked.pop(alias, None)
+        try:
+            connections.disconnect(alias)
+        except Exception:
+            pass
+
+    def _healthy(self, alias: str) -> bool:
+        from pymilvus import utility
+        try:
+            utility.get_server_version(using=alias)
+            return True
+        except Exception as e:
+            logging.warning(f"[MilvusConnection] La conexión '{alias}' no responde: {e}")
+            return False
+
+    def alias(self, slot: int = 0) -> str:
+        """
+        Alias del hueco `slot` del pool, conectado y comprobado.
+        """
+        if os.getpid() != self._pid:
+            self._after_fork()
+        with self._lock:
+            alias = self._alias_name(slot % self.pool_size)
+            last_check = self._checked.get(alias)
+            if last_check is None:
+                self._open(alias)
+            elif time.monotonic() - last_check > self.health_interval_s:
+                if self._healthy(alias):
+                    self._checked[alias] = time.monotonic()
+                else:
+                    self._drop(alias)
+                    self.reconnects += 1
+                    self._open(alias)
+            return alias
+
+    def pool(self) -> List[str]:
+        """
+        Todos los alias del pool (para repartir lotes de inserción entre ellos).
+        """
+        return [self.alias(slot) for slot in range(self.pool_size)]
+
+    def next_alias(self) -> str:
+        """
+        Siguiente alias del pool, por turnos (para repartir búsquedas concurrentes).
+        """
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (self._next_slot + 1) % self.pool_size
+        return self.alias(slot)
+
+    def call(self, fn: Callable[[str], T], retries: int = 1) -> T:
+        """
+        Ejecuta fn(alias) con un alias del pool; si falla, reconecta ese alias y reintenta.
+        """
+        attempt = 0
+        while True:
+            alias = self.next_alias()
+            try:
+                return fn(alias)
+            except Exception as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                logging.warning(f"[MilvusConnection] Llamada fallida con '{alias}' ({e}); reconectando")
+                with self._lock:
+                    self._drop(alias)
+                    self.reconnects += 1
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Estado de las conexiones abiertas: latencia de una petición ligera a cada alias.
+        """
+        report: Dict[str, Any] = {"server": f"{self.host}:{self.port}", "pid": self._pid,
+                                  "reconnects": self.reconnects, "aliases": {}}
+        for alias in list(self._checked):
+            start = time.perf_counter()
+            ok = self._healthy(alias)
+            report["aliases"][alias] = {"ok": ok, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            for alias in list(self._checked):
+                self._drop(alias)
+
+
+_managers: Dict[Tuple[str, str], MilvusConnectionManager] = {}
+_managers_lock = threading.Lock()
+_managers_alive: "weakref.WeakSet[MilvusConnectionManager]" = weakref.WeakSet()
+
+
+def get_connection_manager(host: str = MILVUS_HOST, port: str = MILVUS_PORT) -> MilvusConnectionManager:
+    """
+    Gestor de conexiones compartido para un servidor (uno por proceso).
+    """
+    with _managers_lock:
+        key = (host, str(port))
+        if key not in _managers:
+            _managers[key] = MilvusConnectionManager(host, port)
+        return _managers[key]
+
+
+def _reset_after_fork() -> None:
+    global _managers_lock
+    _managers_lock = threading.Lock()
+    for manager in list(_managers_alive):
+        manager._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
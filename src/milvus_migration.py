@@ -0,0 +1,183 @@
+"""
+Migración de una colección existente (p. ej. documentos_legales_v2, con todo en el JSON
+`metadata` y auto_id) al esquema actual del IndexerAgent: columnas escalares tipadas,
+claves deterministas y la representación de vectores de VECTOR_STORAGE.
+
+Las filas se leen por lotes con un iterador y se escriben con IndexerAgent.run_stream, así
+que las filas duplicadas de la colección antigua (mismo documento y fragmento) se funden en
+una sola. Con --swap, al terminar la colección antigua se renombra a <origen>_legacy y la
+nueva pasa a llamarse como la antigua. Si la colección de origen ya guardaba sus textos en
+un TextStore, se leen de él para que la de destino los tenga en el suyo.
+
+Uso:
+    python -m src.milvus_migration --source documentos_legales_v2 --target documentos_legales_v3 [--swap]
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.settings import MILVUS_COLLECTION, VECTOR_STORAGE
+
+
+def restore_metadata(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Devuelve a sus claves originales los metadatos que estaban en columnas escalares
+    (para poder migrar también desde colecciones con el esquema tipado).
+    """
+    meta = dict(meta)
+    if "doc_hash" in meta:
+        meta.setdefault("hash", meta.pop("doc_hash"))
+    if "lang" in meta:
+        meta.setdefault("language", {"lang": meta.pop("lang"), "prob": 1.0})
+    meta.pop("date_min", None)
+    meta.pop("date_max", None)
+    return meta
+
+
+def attach_stored_payload(text_store: Any,
+                          ids: List[int],
+                          metadata: List[Dict[str, Any]],
+                          details_cache: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Devuelve a los metadatos (en el sitio) el texto de cada fragmento y los detalles de su
+    documento guardados en el TextStore. `details_cache` evita leer varias veces los
+    detalles de un mismo documento entre lotes.
+    """
+    texts = text_store.get_chunks(ids)
+    for pk, meta in zip(ids, metadata):
+        if not meta.get("text") and pk in texts:
+            meta["text"] = texts[pk]
+        doc_hash = meta.get("doc_id") or meta.get("hash")
+        if doc_hash:
+            if doc_hash not in details_cache:
+                details_cache[doc_hash] = text_store.get_details(doc_hash)
+            for key, value in details_cache[doc_hash].items():
+                meta.setdefault(key, value)
+
+
+def iter_collection(collection: Any,
+                    batch_size: int,
+                    text_store: Optional[Any] = None) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+    """
+    Recorre la colección por lotes y genera (matriz float32, metadatos aplanados).
+    Con `text_store` (el TextStore de la colección de origen) se recuperan el texto de los
+    fragmentos y los detalles de los documentos que no estén en el JSON.
+    """
+    from pymilvus import DataType
+    from src.milvus_schema import merge_metadata
+
+    names = [field.name for field in collection.schema.fields]
+    vector_field = collection.schema.fields[1]
+    if vector_field.dtype != DataType.FLOAT_VECTOR:
+        raise ValueError(
+            f"Solo se puede migrar desde colecciones con FLOAT_VECTOR (la de origen usa {vector_field.dtype.name})."
+        )
+    output_fields = list(names)
+    details_cache: Dict[str, Dict[str, Any]] = {}
+    iterator = collection.query_iterator(batch_size=batch_size, output_fields=output_fields)
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            matrix = np.asarray([row[vector_field.name] for row in rows], dtype=np.float32)
+            metadata = [restore_metadata(merge_metadata(row)) for row in rows]
+            if text_store is not None:
+                attach_stored_payload(text_store, [row["id"] for row in rows], metadata, details_cache)
+            yield matrix, metadata
+    finally:
+        iterator.close()
+
+
+def migrate_collection(source: str,
+                       target: str,
+                       batch_size: int = 1000,
+                       storage: str = VECTOR_STORAGE,
+                       swap: bool = False) -> Dict[str, Any]:
+    """
+    Copia `source` en `target` (que se crea con el esquema actual si no existe).
+    """
+    from pymilvus import Collection, utility
+    from src.indexer_agent import IndexerAgent
+    from src.text_store import TextStore
+
+    if source == target:
+        raise ValueError("La colección de origen y la de destino deben ser distintas.")
+    agent = IndexerAgent(collection_name=target, storage=storage)
+    alias = agent._connect()
+    if source not in utility.list_collections(using=alias):
+        raise ValueError(f"No existe la colección de origen '{source}'.")
+    old = Collection(source, using=alias)
+    old.load()
+    source_agent = IndexerAgent(collection_name=source, storage=storage)
+    source_store = TextStore(source_agent.text_store_path) if os.path.exists(source_agent.text_store_path) else None
+
+    start = time.perf_counter()
+    read = 0
+
+    def batches():
+        nonlocal read
+        for matrix, metadata in iter_collection(old, batch_size, source_store):
+            read += len(metadata)
+            yield matrix, metadata
+
+    result = agent.run_stream(batches())
+    agent.collection.flush()
+    report: Dict[str, Any] = {
+        "source": source,
+        "target": target,
+        "storage": storage,
+        "rows_read": read,
+        "rows_written": result["insert_count"],
+        "duplicates_merged": result["skipped_count"],
+        "failed": result["failed_count"],
+        "target_rows": agent.collection.num_entities,
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+
+    if swap:
+        if result["failed_count"]:
+            raise RuntimeError(f"No se intercambian las colecciones: {result['failed_count']} filas no se migraron.")
+        legacy = f"{source}_legacy"
+        agent.collection.release()
+        old.release()
+        utility.rename_collection(source, legacy, using=alias)
+        utility.rename_collection(target, source, using=alias)
+        if storage == "pca" and os.path.exists(agent.pca_path):
+            # La proyección PCA y el TextStore se guardan por nombre de colección
+            shutil.copyfile(agent.pca_path, source_agent.pca_path)
+        if source_store is not None:
+            source_store.copy_to(IndexerAgent(collection_name=legacy, storage=storage).text_store_path)
+        if agent.text_store is not None:
+            agent.text_store.copy_to(source_agent.text_store_path)
+        report["swapped"] = {"legacy": legacy, "active": source}
+        logging.info(f"[Migración] '{source}' renombrada a '{legacy}' y '{target}' a '{source}'")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Migra una colección de Milvus al esquema con columnas tipadas")
+    parser.add_argument("--source", default=MILVUS_COLLECTION)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--storage", default=VECTOR_STORAGE)
+    parser.add_argument("--swap", action="store_true",
+                        help="Renombrar la colección de origen a <origen>_legacy y la nueva al nombre de origen")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = migrate_collection(args.source, args.target, batch_size=args.batch_size,
+                                storage=args.storage, swap=args.swap)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0 if not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
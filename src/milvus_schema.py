@@ -0,0 +1,328 @@
+"""
+Campos escalares tipados de la colección de Milvus.
+
+Los metadatos por los que más se filtra se guardan en columnas propias (con índice
+INVERTED para cadenas y STL_SORT para números) en lugar de dentro del JSON `metadata`,
+de modo que un filtro por idioma, fuente o fecha no evalúa rutas JSON fila a fila.
+El resto de metadatos sigue en el campo JSON.
+
+`partition_name` reparte las filas en particiones según PARTITION_KEYS (idioma, carpeta
+de origen o año de la primera fecha del documento) para poder buscar y cargar en memoria
+solo las particiones que interesan.
+
+`build_filter_expr` traduce filtros sencillos ({"lang": "es", "date_min": (20200101, None)})
+a una expresión de Milvus, usando la columna si la colección la tiene o la ruta JSON
+equivalente en colecciones antiguas.
+
+El módulo no necesita pymilvus salvo para generar los FieldSchema, así que también lo usa
+el almacén local de src/vector_store.py.
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+
+def _language(meta: Dict[str, Any]) -> str:
+    language = meta.get("language")
+    if isinstance(language, dict):
+        return str(language.get("lang") or "")
+    return str(language or meta.get("lang") or "")
+
+
+def _date_number(value: Any) -> Optional[int]:
+    # "2023-05-17" -> 20230517 (entero ordenable)
+    try:
+        date = datetime.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def _dates(meta: Dict[str, Any]) -> List[int]:
+    values = meta.get("dates") or []
+    if isinstance(values, str):
+        values = [values]
+    return sorted(n for n in (_date_number(v) for v in values) if n is not None)
+
+
+def _text(value: Any, max_length: int) -> str:
+    text = "" if value is None else str(value)
+    # max_length de VARCHAR cuenta bytes UTF-8
+    encoded = text.encode("utf-8")[:max_length]
+    return encoded.decode("utf-8", errors="ignore")
+
+
+class ScalarField:
+    """
+    Columna escalar: tipo ("VARCHAR" o "INT32", como en DataType de pymilvus), índice, cómo se extrae de los metadatos aplanados y su ruta
+    equivalente en el JSON de las colecciones antiguas (None si no se puede filtrar allí).
+    """
+    def __init__(self,
+                 name: str,
+                 dtype: str,
+                 extract: Callable[[Dict[str, Any]], Any],
+                 index_type: str,
+                 json_path: Optional[str] = None,
+                 max_length: int = 0,
+                 source_keys: Tuple[str, ...] = ()):
+        self.name = name
+        self.dtype = dtype
+        self.extract = extract
+        self.index_type = index_type
+        self.json_path = json_path
+        self.max_length = max_length
+        self.source_keys = source_keys
+
+    def schema(self) -> Any:
+        from pymilvus import DataType, FieldSchema
+        if self.dtype == "VARCHAR":
+            return FieldSchema(name=self.name, dtype="VARCHAR", max_length=self.max_length)
+        return FieldSchema(name=self.name, dtype=getattr(DataType, self.dtype))
+
+    def value(self, meta: Dict[str, Any]) -> Any:
+        value = self.extract(meta)
+        if self.dtype == "VARCHAR":
+            return _text(value, self.max_length)
+        return int(value or 0)
+
+
+SCALAR_FIELDS: List[ScalarField] = [
+    ScalarField("doc_hash", "VARCHAR", lambda m: m.get("doc_id") or m.get("hash"),
+                "INVERTED", 'metadata["hash"]', max_length=64, source_keys=("doc_id", "hash")),
+    ScalarField("chunk_index", "INT32", lambda m: m.get("chunk_index", 0),
+                "STL_SORT", 'metadata["chunk_index"]', source_keys=("chunk_index",)),
+    ScalarField("title", "VARCHAR", lambda m: m.get("title"),
+                "INVERTED", 'metadata["title"]', max_length=512, source_keys=("title",)),
+    ScalarField("lang", "VARCHAR", _language,
+                "INVERTED", 'metadata["language"]["lang"]', max_length=16, source_keys=("language",)),
+    ScalarField("author", "VARCHAR", lambda m: m.get("author"),
+                "INVERTED", 'metadata["author"]', max_length=256, source_keys=("author",)),
+    ScalarField("token_count", "INT32", lambda m: m.get("token_count", 0),
+                "STL_SORT", 'metadata["token_count"]', source_keys=("token_count",)),
+    # Primera y última fecha mencionadas en el documento, como AAAAMMDD (0 = sin fechas)
+    ScalarField("date_min", "INT32", lambda m: (_dates(m) or [0])[0], "STL_SORT"),
+    ScalarField("date_max", "INT32", lambda m: (_dates(m) or [0])[-1], "STL_SORT"),
+    ScalarField("source", "VARCHAR", lambda m: m.get("source"),
+                "INVERTED", 'metadata["source"]', max_length=1024, source_keys=("source",)),
+]
+SCALAR_FIELDS_BY_NAME = {field.name: field for field in SCALAR_FIELDS}
+
+# Claves que salen del JSON porque ya tienen columna ('dates' se conserva completa)
+PROMOTED_KEYS = {key for field in SCALAR_FIELDS for key in field.source_keys}
+
+
+def chunk_primary_key(meta: Dict[str, Any]) -> int:
+    """
+    Clave primaria determinista (INT64 positivo) de un fragmento: hash del documento
+    (doc_id o hash de MetadataAgent), índice del fragmento y sus offsets. Volver a indexar
+    el mismo documento produce las mismas claves; si cambia el texto o la fragmentación,
+    cambian las claves y las filas antiguas pasan a ser obsoletas.
+    """
+    doc_hash = meta.get("doc_id") or meta.get("hash")
+    if not doc_hash:
+        # Metadatos sin hash de documento: se usa el contenido completo del dict
+        doc_hash = hashlib.sha256(json.dumps(meta, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    key = f"{doc_hash}:{meta.get('chunk_index', 0)}:{meta.get('char_start', '')}:{meta.get('char_end', '')}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def flatten_metadata(metadata: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copia plana de cada metadato: los dicts anidados 'metadata' (del documento) y
+    'metadatos' (de los agentes de enriquecimiento) se suben al primer nivel.
+    """
+    metadata_limpios = []
+    for idx, meta in enumerate(metadata):
+        if not isinstance(meta, dict):
+            raise ValueError(f"El metadato en la posición {idx} no es un dict.")
+        meta_plano = dict(meta)  # copia
+        for nested in ("metadata", "metadatos"):
+            if nested in meta_plano:
+                inner = meta_plano.pop(nested)
+                if isinstance(inner, dict):
+                    meta_plano.update(inner)
+        metadata_limpios.append(meta_plano)
+    return metadata_limpios
+
+
+def split_metadata(meta: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Separa unos metadatos aplanados en (valores de las columnas escalares, resto para el JSON).
+    """
+    scalars = {field.name: field.value(meta) for field in SCALAR_FIELDS}
+    rest = {k: v for k, v in meta.items() if k not in PROMOTED_KEYS}
+    return scalars, rest
+
+
+def merge_metadata(entity: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Operación inversa para los resultados de búsqueda: el JSON más las columnas escalares.
+    """
+    meta = dict(entity.get("metadata") or {})
+    for field in SCALAR_FIELDS:
+        if field.name in entity and entity[field.name] not in (None, ""):
+            meta.setdefault(field.name, entity[field.name])
+    return meta
+
+
+def field_names(collection: Any) -> List[str]:
+    return [field.name for field in collection.schema.fields]
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _column_target(key: str, columns: set) -> str:
+    if key in columns:
+        return key
+    if key in SCALAR_FIELDS_BY_NAME:
+        target = SCALAR_FIELDS_BY_NAME[key].json_path
+        if target is None:
+            raise ValueError(f"La colección no tiene la columna '{key}' y no se puede filtrar por ella en el JSON.")
+        return target
+    return f'metadata[{_literal(key)}]'
+
+
+def like_escape(value: str) -> str:
+    # Escapa los comodines de LIKE (Milvus y SQLite con ESCAPE '\\')
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _partition_key_clause(key: str, value: Any, columns: set) -> str:
+    """
+    Cláusula de 'year' (año de date_min) o 'source_folder' (carpeta de source, sin
+    subcarpetas): la misma semántica que LocalVectorStore.build_sql_filter. Se aplica
+    también cuando las particiones ya podan la búsqueda, así que el resultado no depende
+    de MILVUS_PARTITION_BY.
+    """
+    if key == "year":
+        target = _column_target("date_min", columns)
+        if isinstance(value, tuple):
+            low, high = value
+            clauses = [f"{target} > 0"]
+            if low is not None:
+                clauses.append(f"{target} >= {int(low) * 10000}")
+            if high is not None:
+                clauses.append(f"{target} <= {int(high) * 10000 + 9999}")
+            return " and ".join(clauses)
+        years = value if isinstance(value, (list, set)) else [value]
+        return "(" + " or ".join(
+            f"({target} >= {int(year) * 10000} and {target} <= {int(year) * 10000 + 9999})" for year in years
+        ) + ")"
+    target = _column_target("source", columns)
+    folders = value if isinstance(value, (list, set)) else [value]
+    parts = []
+    for folder in folders:
+        prefix = like_escape(os.path.join(os.path.normpath(str(folder)), ""))
+        parts.append(f"({target} like {_literal(prefix + '%')} and not "
+                     f"({target} like {_literal(prefix + '%' + like_escape(os.sep) + '%')}))")
+    return "(" + " or ".join(parts) + ")"
+
+
+def build_filter_expr(filters: Optional[Dict[str, Any]], columns: Iterable[str]) -> str:
+    """
+    Expresión de filtrado de Milvus a partir de un dict:
+      {"lang": "es"}                      -> igualdad
+      {"source": ["a.pdf", "b.pdf"]}      -> pertenencia (in)
+      {"date_min": (20200101, 20231231)}  -> rango cerrado (None = sin límite)
+      {"year": 2023}                      -> año de date_min (valor, lista o rango)
+      {"source_folder": "docs/2023"}      -> carpeta de source (prefijo, sin subcarpetas)
+    Los campos que no son columnas de la colección se buscan en el JSON `metadata`.
+    """
+    if not filters:
+        return ""
+    columns = set(columns)
+    clauses = []
+    for key, value in filters.items():
+        if key in DERIVED_FILTER_KEYS:
+            clauses.append(_partition_key_clause(key, value, columns))
+            continue
+        target = _column_target(key, columns)
+        if isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                clauses.append(f"{target} >= {_literal(low)}")
+            if high is not None:
+                clauses.append(f"{target} <= {_literal(high)}")
+        elif isinstance(value, (list, set)):
+            clauses.append(f"{target} in [{', '.join(_literal(v) for v in value)}]")
+        else:
+            clauses.append(f"{target} == {_literal(value)}")
+    return " and ".join(clauses)
+
+
+# --------------------------------------------------------------------
+# Particiones
+# --------------------------------------------------------------------
+
+PARTITION_KEYS = ("lang", "source_folder", "year")
+# Claves de filtro derivadas (no son columnas ni campos del JSON): podan particiones cuando
+# la colección está particionada por ellas y siempre se traducen a una expresión escalar
+DERIVED_FILTER_KEYS = {"source_folder", "year"}
+_PARTITION_UNSAFE = re.compile(r'[^A-Za-z0-9_]+')
+
+
+def _partition_label(prefix: str, value: Any) -> str:
+    label = _PARTITION_UNSAFE.sub("_", str(value)).strip("_")[:64] or "unknown"
+    return f"{prefix}_{label}"
+
+
+def partition_value_name(by: str, value: Any) -> str:
+    """
+    Nombre de la partición que corresponde a un valor de la clave `by`
+    (p. ej. ("lang", "es") -> "lang_es", ("year", 2021) -> "year_2021").
+    """
+    if by == "lang":
+        return _partition_label("lang", value or "unknown")
+    if by == "year":
+        return _partition_label("year", value or "unknown")
+    if by == "source_folder":
+        folder = os.path.normpath(str(value)) if value else ""
+        # La carpeta completa se resume con un hash para distinguir carpetas con el mismo nombre
+        digest = hashlib.blake2b(folder.encode("utf-8"), digest_size=4).hexdigest()
+        return _partition_label("src", f"{os.path.basename(folder) or 'root'}_{digest}")
+    raise ValueError(f"Clave de partición desconocida: '{by}' (usa {list(PARTITION_KEYS)}).")
+
+
+def partition_name(meta: Dict[str, Any], by: str) -> str:
+    """
+    Partición de una fila a partir de sus metadatos aplanados.
+    """
+    if by == "lang":
+        return partition_value_name(by, _language(meta))
+    if by == "year":
+        dates = _dates(meta)
+        return partition_value_name(by, dates[0] // 10000 if dates else None)
+    if by == "source_folder":
+        return partition_value_name(by, os.path.dirname(str(meta.get("source") or "")))
+    raise ValueError(f"Clave de partición desconocida: '{by}' (usa {list(PARTITION_KEYS)}).")
+
+
+def partitions_for_filters(filters: Optional[Dict[str, Any]], by: str) -> Optional[List[str]]:
+    """
+    Particiones a las que se puede restringir una búsqueda con estos filtros
+    (None = no se puede podar y hay que buscar en todas).
+    Admite un valor, una lista o, para 'year', un rango (desde, hasta) cerrado.
+    """
+    if not by or not filters:
+        return None
+    value = filters.get(by)
+    if value is None:
+        return None
+    if by == "year" and isinstance(value, tuple):
+        low, high = value
+        if low is None or high is None:
+            return None
+        value = list(range(int(low), int(high) + 1))
+    values = value if isinstance(value, (list, set, tuple)) else [value]
+    return sorted({partition_value_name(by, v) for v in values})
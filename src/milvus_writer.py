@@ -0,0 +1,188 @@
+"""
+Escritura en streaming de filas en una colección de Milvus.
+
+Las filas se acumulan en un lote que se envía cuando supera `max_rows` filas o
+`max_bytes` bytes (tamaño estimado del mensaje gRPC). Cada lote se inserta en un hilo
+aparte, con como máximo `max_in_flight` lotes en vuelo: cuando se alcanza el límite,
+`write` espera, de modo que la memoria ocupada por lotes pendientes está acotada.
+Cada partición tiene su propio lote abierto. Cada hilo usa su propia conexión (alias de
+pymilvus) del pequeño pool que recibe, y cada lote se reintenta con espera exponencial;
+los lotes que fallan definitivamente se registran en el informe final en lugar de
+abortar el resto de la escritura.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.settings import (
+    MILVUS_INSERT_MAX_ROWS,
+    MILVUS_INSERT_MAX_BYTES,
+    MILVUS_INSERT_IN_FLIGHT,
+    MILVUS_INSERT_RETRIES,
+)
+
+
+def estimate_row_bytes(row: Sequence[Any]) -> int:
+    """
+    Tamaño aproximado de una fila en el mensaje de inserción.
+    """
+    size = 0
+    for value in row:
+        if isinstance(value, (bytes, bytearray)):
+            size += len(value)
+        elif hasattr(value, "nbytes"):
+            size += int(value.nbytes)
+        elif isinstance(value, dict):
+            size += len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        else:
+            size += 8
+    return size
+
+
+class MilvusWriter:
+    """
+    Escritor por lotes para una colección. Uso:
+        with MilvusWriter(collection_name, aliases=["default"]) as writer:
+            writer.write([ids, vectores, metadatos])   # columnas de un lote cualquiera
+        report = writer.report
+    """
+    def __init__(self,
+                 collection_name: str,
+                 aliases: Optional[List[str]] = None,
+                 max_rows: int = MILVUS_INSERT_MAX_ROWS,
+                 max_bytes: int = MILVUS_INSERT_MAX_BYTES,
+                 max_in_flight: int = MILVUS_INSERT_IN_FLIGHT,
+                 retries: int = MILVUS_INSERT_RETRIES,
+                 backoff_s: float = 0.5):
+        self.collection_name = collection_name
+        self.aliases = aliases or ["default"]
+        self.max_rows = max(1, max_rows)
+        self.max_bytes = max(1, max_bytes)
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = max(0, retries)
+        self.backoff_s = backoff_s
+
+        # Un lote abierto por partición (None = partición por defecto): [filas, bytes]
+        self._buffers: Dict[Optional[str], List[Any]] = {}
+        self._batch_index = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="milvus-writer")
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._futures: List[Future] = []
+        self._collections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.report: Dict[str, Any] = {
+            "batches": 0,
+            "inserted": 0,
+            "failed_rows": 0,
+            "retries": 0,
+            "primary_keys": [],
+            "failures": [],
+            "elapsed_s": 0.0,
+        }
+        self._start = time.perf_counter()
+
+    def _collection(self, alias: str) -> Any:
+        from pymilvus import Collection
+        with self._lock:
+            if alias not in self._collections:
+                self._collections[alias] = Collection(self.collection_name, using=alias)
+            return self._collections[alias]
+
+    def write(self, columns: Sequence[Sequence[Any]], partition: Optional[str] = None) -> None:
+        """
+        Añade filas dadas por columnas (en el orden de los campos del esquema), dirigidas
+        a `partition` si se indica. Envía los lotes completos sin esperar a que terminen.
+        """
+        if self._closed:
+            raise RuntimeError("MilvusWriter ya está cerrado.")
+        buffer = self._buffers.setdefault(partition, [[], 0])
+        for row in zip(*columns):
+            row_bytes = estimate_row_bytes(row)
+            if buffer[0] and (len(buffer[0]) >= self.max_rows or buffer[1] + row_bytes > self.max_bytes):
+                self._submit(partition)
+                buffer = self._buffers.setdefault(partition, [[], 0])
+            buffer[0].append(list(row))
+            buffer[1] += row_bytes
+
+    def _submit(self, partition: Optional[str]) -> None:
+        rows = self._buffers.pop(partition, [[], 0])[0]
+        if not rows:
+            return
+        # Espera a que haya hueco: acota la memoria de los lotes pendientes
+        self._slots.acquire()
+        batch_index = self._batch_index
+        self._batch_index += 1
+        alias = self.aliases[batch_index % len(self.aliases)]
+        future = self._executor.submit(self._insert, batch_index, alias, rows, partition)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _insert(self, batch_index: int, alias: str, rows: List[List[Any]], partition: Optional[str]) -> None:
+        columns = [list(column) for column in zip(*rows)]
+        attempt = 0
+        while True:
+            try:
+                result = self._collection(alias).insert(columns, partition_name=partition)
+                with self._lock:
+                    self.report["batches"] += 1
+                    self.report["inserted"] += len(result.primary_keys)
+                    self.report["primary_keys"].extend(result.primary_keys)
+                logging.info(f"[MilvusWriter] Lote {batch_index}: {len(rows)} filas insertadas (conexión '{alias}')")
+                return
+            except Exception as e:
+                if attempt >= self.retries:
+                    logging.error(f"[MilvusWriter] Lote {batch_index} descartado tras {attempt + 1} intentos: {e}")
+                    with self._lock:
+                        self.report["batches"] += 1
+                        self.report["failed_rows"] += len(rows)
+                        self.report["failures"].append({
+                            "batch": batch_index,
+                            "partition": partition,
+                            "rows": len(rows),
+                            "error": str(e),
+                            # Con clave primaria explícita se indican las filas que faltan
+                            "ids": columns[0] if columns and all(isinstance(v, int) for v in columns[0]) else None,
+                        })
+                    return
+                delay = self.backoff_s * (2 ** attempt)
+                attempt += 1
+                with self._lock:
+                    self.report["retries"] += 1
+                logging.warning(f"[MilvusWriter] Lote {batch_index} falló ({e}); reintento {attempt} en {delay:.1f}s")
+                time.sleep(delay)
+
+    def flush(self) -> None:
+        """
+        Envía los lotes parciales y espera a que terminen todos los lotes en vuelo.
+        """
+        for partition in list(self._buffers):
+            self._submit(partition)
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Vacía el escritor, libera los hilos y devuelve el informe de la escritura.
+        """
+        if not self._closed:
+            try:
+                self.flush()
+            finally:
+                self._executor.shutdown(wait=True)
+                self._closed = True
+                self.report["elapsed_s"] = round(time.perf_counter() - self._start, 3)
+                self.report["partial_failure"] = bool(self.report["failures"])
+        return self.report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
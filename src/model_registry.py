@@ -0,0 +1,231 @@
+"""
+Registro de modelos compartido por todos los agentes del proceso.
+
+Cada modelo (embeddings, spaCy, KeyBERT...) se registra con una función de carga y
+solo se instancia la primera vez que se pide. La misma instancia se reutiliza en
+todos los agentes, y se anotan el tiempo de carga y la memoria residente que añade.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from src.settings import (
+    EMBEDDING_MODEL,
+    TOPIC_EMBEDDING_MODEL,
+    SPACY_MODEL,
+    MODEL_WARMUP,
+    EMBEDDING_BACKEND,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZE,
+    ONNX_NUM_THREADS,
+)
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def _rss_bytes() -> int:
+    """
+    Memoria residente actual del proceso en bytes (0 si no se puede medir).
+    """
+    if PSUTIL_AVAILABLE:
+        return psutil.Process(os.getpid()).memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Carga perezosa de modelos, una sola vez por proceso y segura entre hilos.
+    """
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._warmup_thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """
+        Registra (o reemplaza) la función que construye el modelo `name`.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def is_registered(self, name: str) -> bool:
+        return name in self._loaders
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        """
+        Devuelve la instancia compartida del modelo, cargándola si es la primera vez.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Modelo no registrado: '{name}'")
+
+        with self._locks[name]:
+            # Otro hilo puede haberlo cargado mientras esperábamos el lock
+            model = self._models.get(name)
+            if model is not None:
+                return model
+            logging.info(f"[ModelRegistry] Cargando modelo '{name}'...")
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                logging.error(f"[ModelRegistry] Error al cargar el modelo '{name}': {e}")
+                raise RuntimeError(f"No se pudo cargar el modelo '{name}': {e}")
+            load_time_s = time.perf_counter() - start
+            rss_after = _rss_bytes()
+            self._models[name] = model
+            self._stats[name] = {
+                "load_time_s": round(load_time_s, 3),
+                "rss_delta_mb": round(max(rss_after - rss_before, 0) / (1024 * 1024), 1),
+                "rss_after_mb": round(rss_after / (1024 * 1024), 1),
+                "loaded_at": time.time(),
+                "thread": threading.current_thread().name,
+            }
+            logging.info(
+                f"[ModelRegistry] Modelo '{name}' cargado en {load_time_s:.2f}s "
+                f"(+{self._stats[name]['rss_delta_mb']} MB RSS)"
+            )
+            return model
+
+    def unload(self, name: str) -> None:
+        """
+        Libera la instancia compartida; la próxima llamada a `get` la vuelve a cargar.
+        """
+        with self._locks.get(name, self._lock):
+            self._models.pop(name, None)
+            self._stats.pop(name, None)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Precarga los modelos indicados (por defecto MODEL_WARMUP).
+        Con background=True se cargan en un hilo daemon y se devuelve el hilo;
+        si ya hay un calentamiento en curso se devuelve ese mismo hilo.
+        """
+        if names is None:
+            # Los modelos de embeddings se precargan con el backend configurado
+            names = [
+                register_embedding_model(n) if n in (EMBEDDING_MODEL, TOPIC_EMBEDDING_MODEL) else n
+                for n in MODEL_WARMUP
+            ]
+        pending = [n for n in names if not self.is_loaded(n)]
+        if not pending:
+            return None
+
+        def _load_all():
+            for name in pending:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logging.warning(f"[ModelRegistry] Calentamiento fallido para '{name}': {e}")
+
+        if not background:
+            _load_all()
+            return None
+
+        with self._lock:
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return self._warmup_thread
+            self._warmup_thread = threading.Thread(target=_load_all, name="model-warmup", daemon=True)
+            self._warmup_thread.start()
+            return self._warmup_thread
+
+    def wait_warm_up(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que termine el calentamiento en segundo plano. Devuelve True si ha terminado.
+        """
+        thread = self._warmup_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Tiempo de carga y memoria residente por modelo cargado.
+        """
+        return {name: dict(values) for name, values in self._stats.items()}
+
+
+def _load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _load_onnx_embedder(model_name: str, quantize: bool = ONNX_QUANTIZE):
+    from src.onnx_embedder import OnnxEmbedder
+    return OnnxEmbedder(model_name, ONNX_MODEL_DIR, quantize=quantize, num_threads=ONNX_NUM_THREADS)
+
+
+def _load_spacy(model_name: str):
+    import spacy
+    return spacy.load(model_name)
+
+
+def _load_keybert():
+    from keybert import KeyBERT
+    # Reutiliza la instancia de sentence-transformers del registro en lugar de cargar otra copia
+    return KeyBERT(model=registry.get(EMBEDDING_MODEL))
+
+
+# Instancia global compartida por todos los agentes del proceso
+registry = ModelRegistry()
+registry.register(EMBEDDING_MODEL, lambda: _load_sentence_transformer(EMBEDDING_MODEL))
+registry.register(TOPIC_EMBEDDING_MODEL, lambda: _load_sentence_transformer(TOPIC_EMBEDDING_MODEL))
+registry.register(SPACY_MODEL, lambda: _load_spacy(SPACY_MODEL))
+registry.register("keybert", _load_keybert)
+
+
+def embedding_model_key(model_name: str, backend: str = EMBEDDING_BACKEND, quantize: bool = ONNX_QUANTIZE) -> str:
+    """
+    Nombre con el que se registra un modelo de embeddings según el backend
+    ("all-MiniLM-L6-v2" para torch, "onnx-int8:all-MiniLM-L6-v2" u "onnx-fp32:all-MiniLM-L6-v2"
+    para ONNX Runtime). La caché de embeddings en disco usa el mismo nombre, así que los
+    vectores int8 y fp32 nunca se mezclan.
+    """
+    if backend == "torch":
+        return model_name
+    if backend == "onnx":
+        return f"onnx-{'int8' if quantize else 'fp32'}:{model_name}"
+    raise ValueError(f"Backend de embeddings desconocido: '{backend}' (usa 'torch' u 'onnx').")
+
+
+def register_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND, quantize: bool = ONNX_QUANTIZE) -> str:
+    """
+    Registra el modelo de embeddings con el backend indicado (y, en ONNX, cuantizado o no)
+    y devuelve su nombre en el registro.
+    """
+    key = embedding_model_key(model_name, backend, quantize)
+    if not registry.is_registered(key):
+        if backend == "onnx":
+            registry.register(key, lambda: _load_onnx_embedder(model_name, quantize))
+        else:
+            registry.register(key, lambda: _load_sentence_transformer(model_name))
+    return key
+
+
+def get_model(name: str) -> Any:
+    """
+    Atajo para obtener un modelo compartido del registro global.
+    """
+    return registry.get(name)
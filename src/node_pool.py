@@ -0,0 +1,211 @@
+"""
+Pool de procesos para los nodos CPU-bound del grafo de agentes.
+
+BERTopic, el resumen extractivo de sumy, dateparser/langdetect y los escaneos con
+expresiones regulares compiten por el GIL cuando LangGraph ejecuta las ramas en hilos.
+Los nodos de PIPELINE_PROCESS_NODES se envían a un pool persistente de procesos
+("spawn") cuyos trabajadores precargan en su inicializador los modelos de esos nodos.
+
+A cada trabajador solo se le envían los campos del estado que usa el nodo
+(NODE_FIELDS): los documentos viajan como DocumentHandle, que se serializan con su
+texto, y de vuelta llega el delta de metadatos del nodo. MetadataAgent no recibe el
+set de hashes ya vistos (crecería con el corpus en cada llamada): el trabajador solo
+devuelve los hashes de sus documentos y la detección de duplicados se hace en el proceso
+principal, bajo un lock, contra el set compartido (NODE_FINALIZERS).
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.settings import PIPELINE_PROCESS_NODES, PIPELINE_PROCESS_WORKERS
+
+# Campos del estado que necesita cada nodo que puede ejecutarse en otro proceso
+NODE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "MetadataAgent":   ("documents", "source_stats"),
+    "SummarizerAgent": ("documents", "source_stats"),
+    "TopicModelAgent": ("documents", "source_stats", "corpus_topics"),
+    "StructureAgent":  ("documents", "source_stats"),
+}
+
+
+def _register_metadata_hashes(state: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Marca 'is_duplicate' con el set de hashes compartido del proceso principal y añade a él
+    los hashes nuevos; el trabajador solo conocía los de su propia tanda.
+    """
+    from src.agent_metadata import register_hashes
+    known_hashes = state.get("known_hashes")
+    if known_hashes is None:
+        known_hashes = set()
+    delta = result.get("metadatos") or {}
+    positions = [idx for idx in sorted(delta) if delta[idx].get("hash")]
+    duplicates = register_hashes(known_hashes, [delta[idx]["hash"] for idx in positions])
+    merged = dict(delta)
+    for idx, is_duplicate in zip(positions, duplicates):
+        merged[idx] = {**delta[idx], "is_duplicate": is_duplicate}
+    return {**result, "metadatos": merged, "known_hashes": known_hashes}
+
+
+# Post-proceso en el proceso principal del resultado de un nodo ejecutado en el pool
+NODE_FINALIZERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = {
+    "MetadataAgent": _register_metadata_hashes,
+}
+
+
+def _warm_metadata() -> None:
+    from src.agent_metadata import detect, extract_dates
+    # langdetect carga sus perfiles y dateparser sus datos de idioma en la primera llamada
+    detect("Contrato de prestación de servicios")
+    extract_dates("Firmado el 1 de enero de 2024")
+
+
+def _warm_summarizer() -> None:
+    from src.agent_summarizer import SUMY_AVAILABLE
+    if SUMY_AVAILABLE:
+        from sumy.nlp.tokenizers import Tokenizer
+        from sumy.summarizers.lsa import LsaSummarizer  # noqa: F401
+        Tokenizer("spanish")
+
+
+def _warm_topics() -> None:
+    from src.agent_topics import BERTOPIC_AVAILABLE
+    if BERTOPIC_AVAILABLE:
+        import bertopic  # noqa: F401
+        from src.model_registry import get_model, register_embedding_model
+        from src.settings import TOPIC_EMBEDDING_MODEL
+        get_model(register_embedding_model(TOPIC_EMBEDDING_MODEL))
+
+
+def _warm_structure() -> None:
+    import src.agent_structure  # noqa: F401  (solo expresiones regulares)
+
+
+_WARMUPS: Dict[str, Callable[[], None]] = {
+    "MetadataAgent": _warm_metadata,
+    "SummarizerAgent": _warm_summarizer,
+    "TopicModelAgent": _warm_topics,
+    "StructureAgent": _warm_structure,
+}
+
+
+def _init_worker(nodes: Sequence[str], threads: int) -> None:
+    if threads > 0:
+        # Evita que cada trabajador intente usar todos los núcleos (sobre-suscripción)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(threads)
+        os.environ["ONNX_NUM_THREADS"] = str(threads)
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    for node in nodes:
+        try:
+            _WARMUPS[node]()
+        except Exception as e:
+            # Sin precarga el nodo sigue funcionando: el modelo se cargará en su primera llamada
+            logging.warning(f"[NodePool] No se pudo precargar {node} en el proceso {os.getpid()}: {e}")
+
+
+def validate_nodes(nodes: Sequence[str]) -> List[str]:
+    unknown = [node for node in nodes if node not in NODE_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Nodos sin ejecución en proceso: {unknown} (disponibles: {', '.join(NODE_FIELDS)})"
+        )
+    return list(nodes)
+
+
+class NodePool:
+    """
+    Pool persistente de `workers` procesos con los modelos de `nodes` precargados.
+    Se arranca en el primer uso y se cierra con close() (o al salir del intérprete).
+    """
+    def __init__(self, nodes: Sequence[str], workers: int, threads_per_worker: int = 0):
+        self.nodes = validate_nodes(nodes)
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # "spawn": los trabajadores no heredan hilos, locks ni canales gRPC del padre
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(tuple(self.nodes), self.threads_per_worker),
+                )
+                atexit.register(self.close)
+                logging.info(
+                    f"[NodePool] Arrancados {self.workers} procesos para {', '.join(self.nodes)} "
+                    f"({self.threads_per_worker} hilos por proceso)"
+                )
+            return self._executor
+
+    def run(self, fn: Callable[[Dict[str, Any]], Dict[str, Any]], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ejecuta fn(payload) en un trabajador y devuelve su resultado. `fn` debe ser una
+        función de módulo (se serializa por referencia). Si el pool se rompe (un
+        trabajador muere), se reinicia y el nodo se ejecuta en el propio proceso.
+        """
+        executor = self._ensure_started()
+        try:
+            return executor.submit(fn, payload).result()
+        except BrokenProcessPool as e:
+            logging.error(f"[NodePool] Pool roto ejecutando {fn.__name__}: {e}; se ejecuta en el proceso principal")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            return fn(payload)
+
+    def close(self) -> None:
+        """
+        Detiene los procesos trabajadores esperando a que terminen los nodos en curso.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+                logging.info("[NodePool] Pool de nodos cerrado")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_pool: Optional[NodePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_node_pool() -> NodePool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = NodePool(PIPELINE_PROCESS_NODES, PIPELINE_PROCESS_WORKERS)
+        return _pool
+
+
+def process_node(name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 pool: Optional[NodePool] = None) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Envuelve el nodo `name` para que se ejecute en el pool: solo se serializan sus
+    campos de NODE_FIELDS y el resultado (delta) vuelve al grafo, pasando antes por su
+    NODE_FINALIZERS si lo tiene.
+    """
+    fields = NODE_FIELDS[name]
+    finalize = NODE_FINALIZERS.get(name)
+
+    def run_in_process(state: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {key: state[key] for key in fields if key in state}
+        result = (pool or get_node_pool()).run(fn, payload)
+        return finalize(state, result) if finalize else result
+
+    run_in_process.__name__ = f"{fn.__name__}_in_process"
+    return run_in_process
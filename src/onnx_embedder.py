@@ -0,0 +1,166 @@
+"""
+Backend de embeddings con ONNX Runtime para CPU.
+
+Exporta la parte transformer de un modelo de sentence-transformers a ONNX, lo cuantiza a
+int8 (cuantización dinámica de pesos) y lo ejecuta con ONNX Runtime. `OnnxEmbedder`
+implementa el subconjunto de la API de SentenceTransformer que usan los agentes
+(`encode`, `tokenizer`, `max_seq_length`, `get_sentence_embedding_dimension`), así que
+puede registrarse en el registro de modelos en lugar del modelo de PyTorch.
+
+La exportación requiere torch y sentence-transformers y se hace una sola vez; después
+solo se necesitan onnxruntime y transformers (para el tokenizador).
+"""
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedder_config.json"
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """
+    Exporta `model_name` a ONNX en `output_dir` (junto con su tokenizador y una
+    configuración de pooling) y, si quantize=True, genera también la versión int8.
+    Si ya existe, no se vuelve a exportar. Devuelve la ruta del modelo a usar.
+    """
+    target = os.path.join(output_dir, INT8_FILE if quantize else FP32_FILE)
+    if os.path.exists(target) and os.path.exists(os.path.join(output_dir, CONFIG_FILE)):
+        return target
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    pooling = st_model[1] if len(st_model) > 1 else None
+    config = {
+        "model_name": model_name,
+        "max_seq_length": st_model.max_seq_length,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "pooling": "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean",
+    }
+
+    if not os.path.exists(fp32_path):
+        sample = tokenizer(["exportación del modelo"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Wrapper(torch.nn.Module):
+            # Devuelve solo last_hidden_state y acepta los argumentos por posición
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *args):
+                return self.model(**dict(zip(input_names, args)))[0]
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Wrapper(transformer),
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+        logging.info(f"[OnnxEmbedder] Modelo '{model_name}' exportado a {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QInt8)
+        logging.info(f"[OnnxEmbedder] Modelo '{model_name}' cuantizado a int8 en {target}")
+
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return target
+
+
+class OnnxEmbedder:
+    """
+    Sustituto de SentenceTransformer para inferencia en CPU con ONNX Runtime.
+    """
+    def __init__(self,
+                 model_name: str,
+                 model_dir: str,
+                 quantize: bool = True,
+                 num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.model_dir = os.path.join(model_dir, _UNSAFE_CHARS.sub("_", model_name))
+        model_path = export_onnx(model_name, self.model_dir, quantize=quantize)
+        with open(os.path.join(self.model_dir, CONFIG_FILE), encoding="utf-8") as f:
+            self.config: Dict[str, Any] = json.load(f)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self.max_seq_length: int = self.config["max_seq_length"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        logging.info(f"[OnnxEmbedder] Sesión ONNX Runtime lista para '{model_name}' ({os.path.basename(model_path)})")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.config.get("pooling") == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self,
+               sentences: Union[str, List[str]],
+               batch_size: int = 32,
+               convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False,
+               show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        """
+        Misma semántica que SentenceTransformer.encode: ordena por longitud para
+        minimizar el padding, codifica por lotes y devuelve los vectores en el orden original.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        output = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+            if "token_type_ids" in self._input_names and "token_type_ids" not in feeds:
+                feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+            hidden = self.session.run(None, feeds)[0]
+            output[idx] = self._pool(hidden, encoded["attention_mask"])
+
+        if normalize_embeddings:
+            output /= np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output[0] if single else output
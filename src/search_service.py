@@ -0,0 +1,423 @@
+"""
+Búsqueda semántica sobre la colección indexada.
+
+El texto de la consulta se codifica con el mismo modelo que los documentos (el
+VectorizerAgent) y se busca en el almacén de vectores configurado (VECTOR_STORE_BACKEND)
+con filtros por metadatos (ver milvus_schema.build_filter_expr) y top_k, nprobe y ef
+configurables. Dos cachés en memoria evitan trabajo repetido:
+  - embeddings de consultas: LRU por texto (SEARCH_QUERY_CACHE_SIZE)
+  - resultados: LRU con caducidad (SEARCH_RESULT_TTL_S) que se invalida en cuanto el almacén
+    recibe inserciones o borrados (VectorStore.generation)
+`search_many` resuelve varias consultas con una sola llamada al modelo y una sola búsqueda.
+Con `facets` (palabras clave, temas, autores... ver src/analytics_store.py) la búsqueda se
+restringe primero a los documentos que devuelve el índice analítico.
+
+Búsqueda híbrida (SEARCH_HYBRID): mientras se codifica la consulta y se hace la búsqueda
+densa, un hilo consulta el índice BM25 del TextStore (src/sparse_index.py); los dos
+rankings se fusionan con RRF. Los términos exactos (artículos, partes, códigos) los aporta
+el ranking léxico, así que no hace falta subir top_k ni nprobe para encontrarlos.
+
+Uso:
+    python -m src.search_service "plazo de preaviso" [--top-k 5] [--filter lang=es]
+        [--filter date_min=20200101:20231231] [--nprobe 32] [--ef 128] [--text] [--repeat 20]
+        [--dense-only]
+"""
+import argparse
+import copy
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.settings import (
+    SEARCH_TOP_K,
+    SEARCH_NPROBE,
+    SEARCH_EF,
+    SEARCH_QUERY_CACHE_SIZE,
+    SEARCH_RESULT_CACHE_SIZE,
+    SEARCH_RESULT_TTL_S,
+    SEARCH_HYBRID,
+    SEARCH_HYBRID_DEPTH,
+    SEARCH_RRF_K,
+)
+from src.sparse_index import reciprocal_rank_fusion
+
+_LATENCY_WINDOW = 1000
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None}
+    array = np.asarray(values)
+    return {
+        "p50_ms": round(float(np.percentile(array, 50)), 3),
+        "p95_ms": round(float(np.percentile(array, 95)), 3),
+    }
+
+
+class SearchService:
+    """
+    Servicio de búsqueda por texto. Uso:
+        service = get_search_service()
+        hits = service.search("plazo de preaviso", top_k=5, filters={"lang": "es"})
+        batch = service.search_many(["consulta 1", "consulta 2"])
+        service.stats()   # latencias p50/p95 y aciertos de las cachés
+    Cada resultado es {"id", "distance", "score", "metadata"} como en VectorStore.search;
+    en modo híbrido "score" es la puntuación RRF y se añaden "dense_score", "dense_rank" y
+    "sparse_rank" (None si el fragmento no salió en ese ranking).
+    """
+    def __init__(self,
+                 store: Optional[Any] = None,
+                 vectorizer: Optional[Any] = None,
+                 top_k: int = SEARCH_TOP_K,
+                 nprobe: int = SEARCH_NPROBE,
+                 ef: int = SEARCH_EF,
+                 query_cache_size: int = SEARCH_QUERY_CACHE_SIZE,
+                 result_cache_size: int = SEARCH_RESULT_CACHE_SIZE,
+                 result_ttl_s: float = SEARCH_RESULT_TTL_S,
+                 hybrid: bool = SEARCH_HYBRID,
+                 hybrid_depth: int = SEARCH_HYBRID_DEPTH,
+                 rrf_k: int = SEARCH_RRF_K):
+        self._store = store
+        self._vectorizer = vectorizer
+        self.top_k = top_k
+        self.nprobe = nprobe
+        self.ef = ef
+        self.query_cache_size = max(0, query_cache_size)
+        self.result_cache_size = max(0, result_cache_size)
+        self.result_ttl_s = result_ttl_s
+        self.hybrid = hybrid
+        self.hybrid_depth = hybrid_depth
+        self.rrf_k = rrf_k
+        self._sparse_executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # texto -> embedding normalizado
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # clave de la búsqueda -> (caduca en, generación del almacén, resultados)
+        self._results: "OrderedDict[Tuple, Tuple[float, int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+        self.counters = {"queries": 0, "embedding_hits": 0, "result_hits": 0, "round_trips": 0}
+
+    @property
+    def store(self) -> Any:
+        if self._store is None:
+            from src.vector_store import get_vector_store
+            self._store = get_vector_store()
+        return self._store
+
+    @property
+    def vectorizer(self) -> Any:
+        if self._vectorizer is None:
+            # Mismo modelo (y backend) con el que se vectorizaron los documentos
+            from src.vectorizer_agent import vectorizer
+            self._vectorizer = vectorizer
+        return self._vectorizer
+
+    # ------------------------------------------------------------------ Embeddings
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeddings de las consultas: los que no están en la caché se codifican en una sola llamada.
+        """
+        vectors: Dict[int, np.ndarray] = {}
+        missing: List[int] = []
+        with self._lock:
+            for pos, query in enumerate(queries):
+                vector = self._embeddings.get(query)
+                if vector is None:
+                    missing.append(pos)
+                else:
+                    self._embeddings.move_to_end(query)
+                    vectors[pos] = vector
+            self.counters["embedding_hits"] += len(vectors)
+        unique = list(dict.fromkeys(queries[pos] for pos in missing))
+        if unique:
+            encoded = dict(zip(unique, self.vectorizer.embed_batch(unique)))
+            with self._lock:
+                for query, vector in encoded.items():
+                    if self.query_cache_size:
+                        self._embeddings[query] = vector
+                        self._embeddings.move_to_end(query)
+                while len(self._embeddings) > self.query_cache_size:
+                    self._embeddings.popitem(last=False)
+            for pos in missing:
+                vectors[pos] = encoded[queries[pos]]
+        return np.stack([vectors[pos] for pos in range(len(queries))]).astype(np.float32, copy=False)
+
+    # ------------------------------------------------------------------ Resultados
+    def _search_params(self, nprobe: Optional[int], ef: Optional[int]) -> Dict[str, Any]:
+        params = {"nprobe": nprobe if nprobe is not None else self.nprobe,
+                  "ef": ef if ef is not None else self.ef}
+        return {key: value for key, value in params.items() if value}
+
+    @staticmethod
+    def _cache_key(query: str, top_k: int, filters: Optional[Dict[str, Any]], facets: Optional[Dict[str, Any]],
+                   params: Dict[str, Any], with_text: bool, hybrid: bool) -> Tuple:
+        return (query, top_k, json.dumps([filters or {}, facets or {}], sort_keys=True, default=str),
+                tuple(sorted(params.items())), with_text, hybrid)
+
+    @staticmethod
+    def _facet_filters(store: Any, facets: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        from src.analytics_store import get_analytics_store
+        analytics = get_analytics_store(store.collection_name)
+        if analytics is None:
+            raise RuntimeError("El índice analítico está desactivado (ANALYTICS_ENABLED=false); no se puede filtrar por facetas.")
+        return analytics.search_filters(facets, base=filters)
+
+    def _timed_sparse(self, store: Any, queries: List[str], depth: int) -> Tuple[List[List[Tuple[int, float]]], float]:
+        start = time.perf_counter()
+        ranking = store.sparse_search(queries, depth)
+        return ranking, (time.perf_counter() - start) * 1000
+
+    def _fuse(self,
+              store: Any,
+              dense: List[List[Dict[str, Any]]],
+              sparse: List[List[Tuple[int, float]]],
+              top_k: int,
+              filters: Optional[Dict[str, Any]],
+              with_text: bool) -> List[List[Dict[str, Any]]]:
+        """
+        Fusión RRF del ranking denso y el léxico de cada consulta. Los fragmentos que solo
+        encuentra BM25 se validan contra los filtros (y se completan con sus metadatos) con
+        una única consulta al almacén para todo el lote.
+        """
+        dense_ids = {hit["id"] for hits in dense for hit in hits}
+        extra = sorted({pk for ranking in sparse for pk, _ in ranking} - dense_ids)
+        metadata = store.fetch_metadata(extra, filters) if extra else {}
+        texts = store.fetch_texts(list(metadata)) if with_text and metadata else {}
+        fused_results = []
+        for hits, ranking in zip(dense, sparse):
+            by_id = {hit["id"]: hit for hit in hits}
+            lexical = [pk for pk, _ in ranking if pk in by_id or pk in metadata]
+            dense_rank = {hit["id"]: rank for rank, hit in enumerate(hits, start=1)}
+            sparse_rank = {pk: rank for rank, pk in enumerate(lexical, start=1)}
+            fused = []
+            for pk, score in reciprocal_rank_fusion([[hit["id"] for hit in hits], lexical], k=self.rrf_k)[:top_k]:
+                if pk in by_id:
+                    hit = dict(by_id[pk], dense_score=by_id[pk]["score"])
+                else:
+                    meta = dict(metadata[pk])
+                    if pk in texts:
+                        meta["text"] = texts[pk]
+                    hit = {"id": pk, "distance": None, "dense_score": None, "metadata": meta}
+                hit.update(score=score, dense_rank=dense_rank.get(pk), sparse_rank=sparse_rank.get(pk))
+                fused.append(hit)
+            fused_results.append(fused)
+        return fused_results
+
+    def _cached(self, key: Tuple, generation: int) -> Optional[List[Dict[str, Any]]]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires, entry_generation, hits = entry
+        if entry_generation != generation or time.monotonic() > expires:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return hits
+
+    def search_many(self,
+                    queries: List[str],
+                    top_k: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None,
+                    nprobe: Optional[int] = None,
+                    ef: Optional[int] = None,
+                    with_text: bool = False,
+                    hybrid: Optional[bool] = None,
+                    facets: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Resultados de varias consultas con los mismos filtros: las que no están en la caché
+        de resultados se buscan juntas en una única llamada al almacén (y, en modo híbrido,
+        en el índice BM25 a la vez). `hybrid=None` usa el valor del servicio.
+        `facets` son filtros del índice analítico ({"keyword": "cláusula penal", "year": 2023})
+        que se traducen a la lista de documentos que los cumplen.
+        """
+        if not queries:
+            return []
+        start = time.perf_counter()
+        top_k = top_k or self.top_k
+        params = self._search_params(nprobe, ef)
+        store = self.store
+        hybrid = (self.hybrid if hybrid is None else hybrid) and store.has_sparse
+        generation = store.generation
+        keys = [self._cache_key(q, top_k, filters, facets, params, with_text, hybrid) for q in queries]
+
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for pos, key in enumerate(keys):
+                hits = self._cached(key, generation) if self.result_cache_size else None
+                if hits is not None:
+                    results[pos] = hits
+            self.counters["queries"] += len(queries)
+            self.counters["result_hits"] += len(results)
+
+        cached = len(results)
+        # Una consulta repetida en el lote se busca una sola vez
+        pending: List[int] = []
+        pending_keys: set = set()
+        for pos, key in enumerate(keys):
+            if pos not in results and key not in pending_keys:
+                pending_keys.add(key)
+                pending.append(pos)
+        embed_ms = search_ms = sparse_ms = 0.0
+        found_by_key: Dict[Tuple, List[Dict[str, Any]]] = {}
+        if pending and facets:
+            filters = self._facet_filters(store, facets, filters)
+            if filters is None:
+                # Ningún documento cumple las facetas: no hace falta buscar
+                found_by_key = {keys[pos]: [] for pos in pending}
+                pending = []
+        if pending:
+            texts = [queries[pos] for pos in pending]
+            depth = max(top_k, self.hybrid_depth or 2 * top_k) if hybrid else top_k
+            sparse_future = None
+            if hybrid:
+                if self._sparse_executor is None:
+                    self._sparse_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sparse-search")
+                sparse_future = self._sparse_executor.submit(self._timed_sparse, store, texts, depth)
+            embed_start = time.perf_counter()
+            vectors = self.embed_queries(texts)
+            search_start = time.perf_counter()
+            found = store.search(vectors, top_k=depth, filters=filters, with_text=with_text,
+                                 search_params=params or None)
+            done = time.perf_counter()
+            embed_ms = (search_start - embed_start) * 1000
+            search_ms = (done - search_start) * 1000
+            if sparse_future is not None:
+                ranking, sparse_ms = sparse_future.result()
+                found = self._fuse(store, found, ranking, top_k, filters, with_text)
+            found_by_key = {keys[pos]: hits for pos, hits in zip(pending, found)}
+            with self._lock:
+                self.counters["round_trips"] += 1
+                # Si hubo escrituras durante la búsqueda los resultados no se guardan
+                if self.result_cache_size and store.generation == generation:
+                    for key, hits in found_by_key.items():
+                        self._results[key] = (time.monotonic() + self.result_ttl_s, generation, hits)
+                        self._results.move_to_end(key)
+                while len(self._results) > self.result_cache_size:
+                    self._results.popitem(last=False)
+        for pos, key in enumerate(keys):
+            results.setdefault(pos, found_by_key.get(key))
+
+        total_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._latencies.append({"total_ms": total_ms, "embed_ms": embed_ms, "search_ms": search_ms,
+                                    "sparse_ms": sparse_ms, "queries": len(queries), "cached": cached})
+        # Copias: quien llama puede modificar los resultados sin alterar la caché
+        return [copy.deepcopy(results[pos]) for pos in range(len(queries))]
+
+    def search(self, query: str, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Resultados de una consulta (mismos argumentos que search_many).
+        """
+        return self.search_many([query], **kwargs)[0]
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._embeddings.clear()
+            self._results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Latencias recientes (p50/p95 por llamada, en total y por fase) y uso de las cachés.
+        """
+        with self._lock:
+            calls = list(self._latencies)
+            counters = dict(self.counters)
+            cached = {"embeddings": len(self._embeddings), "results": len(self._results)}
+        queries = max(counters["queries"], 1)
+        searched = [c for c in calls if c["queries"] > c["cached"]]
+        return {
+            "calls": len(calls),
+            **counters,
+            "result_hit_rate": round(counters["result_hits"] / queries, 3),
+            "cache_entries": cached,
+            "latency": _percentiles([c["total_ms"] for c in calls]),
+            "embed_latency": _percentiles([c["embed_ms"] for c in searched]),
+            "search_latency": _percentiles([c["search_ms"] for c in searched]),
+            "sparse_latency": _percentiles([c["sparse_ms"] for c in searched if c["sparse_ms"]]),
+        }
+
+
+_service: Optional[SearchService] = None
+_service_lock = threading.Lock()
+
+
+def get_search_service() -> SearchService:
+    """
+    Servicio de búsqueda compartido del proceso (mismas cachés para todas las sesiones).
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SearchService()
+        return _service
+
+
+def _filter_value(raw: str) -> Any:
+    def scalar(text: str) -> Any:
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            return int(text)
+        except ValueError:
+            return text
+    if ":" in raw:
+        low, high = raw.split(":", 1)
+        return scalar(low), scalar(high)
+    if "," in raw:
+        return [scalar(part) for part in raw.split(",") if part.strip()]
+    return scalar(raw)
+
+
+def parse_filters(items: List[str]) -> Dict[str, Any]:
+    """
+    Filtros de la línea de comandos: "lang=es", "source=a.pdf,b.pdf" (lista) o
+    "date_min=20200101:20231231" (rango; un extremo vacío = sin límite).
+    """
+    filters: Dict[str, Any] = {}
+    for item in items:
+        key, sep, raw = item.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"Filtro no válido: '{item}' (usa clave=valor).")
+        filters[key.strip()] = _filter_value(raw)
+    return filters
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Búsqueda semántica en la colección indexada")
+    parser.add_argument("queries", nargs="+", help="Texto de las consultas (varias se buscan en un solo lote)")
+    parser.add_argument("--top-k", type=int, default=SEARCH_TOP_K)
+    parser.add_argument("--filter", action="append", default=[], dest="filters",
+                        help="clave=valor, clave=v1,v2 o clave=desde:hasta (repetible)")
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef", type=int, default=None)
+    parser.add_argument("--text", action="store_true", help="Incluir el texto de cada fragmento")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones para medir la latencia")
+    parser.add_argument("--dense-only", action="store_true", help="Solo búsqueda densa (sin BM25 ni RRF)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    service = SearchService()
+    filters = parse_filters(args.filters)
+    results: List[List[Dict[str, Any]]] = []
+    for _ in range(max(1, args.repeat)):
+        results = service.search_many(args.queries, top_k=args.top_k, filters=filters or None,
+                                      nprobe=args.nprobe, ef=args.ef, with_text=args.text,
+                                      hybrid=False if args.dense_only else None)
+    report = {
+        "results": [{"query": q, "hits": hits} for q, hits in zip(args.queries, results)],
+        "stats": service.stats(),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
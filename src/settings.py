@@ -0,0 +1,167 @@
+"""
+Configuración del sistema leída de variables de entorno.
+Cada valor tiene un valor por defecto que reproduce el comportamiento habitual del pipeline.
+"""
+import os
+from typing import List
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.getenv(name)
+    return value.strip() if value and value.strip() else default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "si", "sí", "on")
+
+
+def _env_list(name: str, default: List[str]) -> List[str]:
+    value = os.getenv(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# Modelos de embeddings / NLP
+EMBEDDING_MODEL = _env_str("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+TOPIC_EMBEDDING_MODEL = _env_str("TOPIC_EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+SPACY_MODEL = _env_str("SPACY_MODEL", "en_core_web_sm")
+
+# Backend de inferencia de los modelos de embeddings: "torch" (sentence-transformers)
+# u "onnx" (ONNX Runtime en CPU, exportado y cuantizado a int8 la primera vez)
+EMBEDDING_BACKEND = _env_str("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = _env_str("ONNX_MODEL_DIR", os.path.join(".cache", "onnx"))
+ONNX_QUANTIZE = _env_bool("ONNX_QUANTIZE", True)
+ONNX_NUM_THREADS = _env_int("ONNX_NUM_THREADS", 0)  # 0 = lo decide ONNX Runtime
+
+# Modelos a precargar en segundo plano al arrancar la aplicación (separados por comas)
+MODEL_WARMUP = _env_list("MODEL_WARMUP", [EMBEDDING_MODEL])
+
+# Milvus
+MILVUS_HOST = _env_str("MILVUS_HOST", "localhost")
+MILVUS_PORT = _env_str("MILVUS_PORT", "19530")
+MILVUS_COLLECTION = _env_str("MILVUS_COLLECTION", "documentos_legales_v2")
+# Inserción en streaming (ver src/milvus_writer.py)
+MILVUS_INSERT_MAX_ROWS = _env_int("MILVUS_INSERT_MAX_ROWS", 2000)  # filas por lote de inserción
+MILVUS_INSERT_MAX_BYTES = _env_int("MILVUS_INSERT_MAX_BYTES", 16 * 1024 * 1024)  # muy por debajo del límite gRPC
+MILVUS_INSERT_IN_FLIGHT = _env_int("MILVUS_INSERT_IN_FLIGHT", 2)  # lotes enviándose a la vez
+MILVUS_INSERT_RETRIES = _env_int("MILVUS_INSERT_RETRIES", 3)
+MILVUS_WRITER_CONNECTIONS = _env_int("MILVUS_WRITER_CONNECTIONS", 2)
+# Conexiones (ver src/milvus_connection.py): alias en el pool, reintentos y comprobación periódica
+MILVUS_POOL_SIZE = _env_int("MILVUS_POOL_SIZE", MILVUS_WRITER_CONNECTIONS)
+MILVUS_CONNECT_RETRIES = _env_int("MILVUS_CONNECT_RETRIES", 3)
+MILVUS_CONNECT_TIMEOUT_S = _env_float("MILVUS_CONNECT_TIMEOUT_S", 10.0)
+MILVUS_HEALTH_INTERVAL_S = _env_float("MILVUS_HEALTH_INTERVAL_S", 30.0)
+# Particiones de la colección: "" (ninguna), "lang", "source_folder" o "year"
+MILVUS_PARTITION_BY = _env_str("MILVUS_PARTITION_BY", "")
+MILVUS_MAX_LOADED_PARTITIONS = _env_int("MILVUS_MAX_LOADED_PARTITIONS", 8)  # 0 = sin límite
+# Backend del almacén de vectores: "milvus" (servidor) o "local" (ficheros, sin servidor)
+VECTOR_STORE_BACKEND = _env_str("VECTOR_STORE_BACKEND", "milvus")
+LOCAL_STORE_DIR = _env_str("LOCAL_STORE_DIR", os.path.join(".cache", "vector_store"))
+LOCAL_STORE_IVF_MIN_ROWS = _env_int("LOCAL_STORE_IVF_MIN_ROWS", 100_000)  # por debajo, fuerza bruta
+LOCAL_STORE_NPROBE = _env_int("LOCAL_STORE_NPROBE", 0)  # listas IVF recorridas por consulta (0 = automático)
+# Texto de los fragmentos y detalles de los documentos fuera del JSON de Milvus, comprimidos
+TEXT_STORE_ENABLED = _env_bool("TEXT_STORE_ENABLED", True)
+TEXT_STORE_DIR = _env_str("TEXT_STORE_DIR", os.path.join(".cache", "text_store"))
+TEXT_STORE_CODEC = _env_str("TEXT_STORE_CODEC", "zstd")  # "zstd" (zlib si no está instalado) o "zlib"
+SPARSE_INDEX_ENABLED = _env_bool("SPARSE_INDEX_ENABLED", True)  # índice BM25 en el TextStore (búsqueda híbrida)
+INDEX_STREAMING = _env_bool("INDEX_STREAMING", False)  # vectorizar e indexar en un solo nodo, por tandas
+# Representación de los vectores en la colección (solo se aplica al crearla):
+# "float32", "float16", "bfloat16", "binary" (1 bit/dim + re-ranking en float) o "pca"
+VECTOR_STORAGE = _env_str("VECTOR_STORAGE", "float32")
+VECTOR_PCA_DIM = _env_int("VECTOR_PCA_DIM", 128)
+VECTOR_PCA_MIN_ROWS = _env_int("VECTOR_PCA_MIN_ROWS", 5000)  # vectores con los que se ajusta la PCA
+VECTOR_PCA_DIR = _env_str("VECTOR_PCA_DIR", os.path.join(".cache", "pca"))
+# Índice vectorial: tipo y parámetros según el tamaño de la colección (ver src/index_manager.py)
+INDEX_METRIC = _env_str("INDEX_METRIC", "COSINE")  # los vectores están normalizados
+INDEX_FLAT_MAX_ROWS = _env_int("INDEX_FLAT_MAX_ROWS", 10_000)  # hasta aquí FLAT (búsqueda exacta)
+INDEX_HNSW_MAX_ROWS = _env_int("INDEX_HNSW_MAX_ROWS", 2_000_000)  # hasta aquí HNSW; por encima IVF_FLAT
+INDEX_BACKGROUND_REBUILD = _env_bool("INDEX_BACKGROUND_REBUILD", True)
+INDEX_REBUILD_WAIT_S = _env_float("INDEX_REBUILD_WAIT_S", 1800.0)  # espera máxima de una búsqueda durante la reconstrucción
+VECTOR_RERANK_FACTOR = _env_int("VECTOR_RERANK_FACTOR", 4)  # candidatos binarios por resultado final
+
+# Vectorización
+EMBEDDING_BATCH_SIZE = _env_int("EMBEDDING_BATCH_SIZE", 32)
+# Tipo de la matriz de embeddings en el estado: "float32" o "float16" (la mitad de memoria)
+EMBEDDING_DTYPE = _env_str("EMBEDDING_DTYPE", "float32")
+# A partir de estas filas la matriz se vuelca a un fichero temporal mapeado en memoria (0 = nunca)
+EMBEDDING_MEMMAP_ROWS = _env_int("EMBEDDING_MEMMAP_ROWS", 200_000)
+EMBEDDING_MEMMAP_DIR = _env_str("EMBEDDING_MEMMAP_DIR", "")  # vacío = directorio temporal del sistema
+
+# Fragmentación (chunking) de documentos antes de vectorizar
+CHUNKING_ENABLED = _env_bool("CHUNKING_ENABLED", True)
+CHUNK_MAX_TOKENS = _env_int("CHUNK_MAX_TOKENS", 0)  # 0 = máximo del modelo menos tokens especiales
+CHUNK_OVERLAP_TOKENS = _env_int("CHUNK_OVERLAP_TOKENS", 32)
+if CHUNK_OVERLAP_TOKENS < 0 or (CHUNK_MAX_TOKENS and CHUNK_OVERLAP_TOKENS >= CHUNK_MAX_TOKENS):
+    # Con un solape igual o mayor que el fragmento la ventana avanzaría de token en token
+    raise ValueError(
+        f"CHUNK_OVERLAP_TOKENS ({CHUNK_OVERLAP_TOKENS}) debe estar entre 0 y CHUNK_MAX_TOKENS - 1 "
+        f"(CHUNK_MAX_TOKENS={CHUNK_MAX_TOKENS})."
+    )
+EMBEDDING_STREAM_BATCH = _env_int("EMBEDDING_STREAM_BATCH", 256)  # fragmentos en memoria por tanda
+
+# Caché persistente de embeddings
+EMBEDDING_CACHE_ENABLED = _env_bool("EMBEDDING_CACHE_ENABLED", True)
+EMBEDDING_CACHE_DIR = _env_str("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+EMBEDDING_CACHE_MAX_ROWS = _env_int("EMBEDDING_CACHE_MAX_ROWS", 1_000_000)
+
+# Pool de procesos para vectorizar corpus grandes (0 o 1 = codificar en el propio proceso)
+EMBEDDING_WORKERS = _env_int("EMBEDDING_WORKERS", 0)
+EMBEDDING_POOL_CHUNK = _env_int("EMBEDDING_POOL_CHUNK", 256)  # textos por trozo enviado a un trabajador
+EMBEDDING_POOL_MIN_TEXTS = _env_int("EMBEDDING_POOL_MIN_TEXTS", 2048)  # por debajo no compensa el pool
+
+# Ejecución del grafo de agentes (ver src/graph_builder.py): "batch" (cada etapa con todos los
+# documentos) o "document" (cada documento recorre el pipeline por su cuenta, con Send)
+PIPELINE_MODE = _env_str("PIPELINE_MODE", "batch")
+PIPELINE_MAX_CONCURRENCY = _env_int("PIPELINE_MAX_CONCURRENCY", 4)  # documentos en curso a la vez
+# Nodos CPU-bound que se ejecutan en procesos trabajadores en lugar de hilos (ver src/node_pool.py),
+# p. ej. "MetadataAgent,SummarizerAgent,TopicModelAgent,StructureAgent"; vacío = todos en hilos
+PIPELINE_PROCESS_NODES = _env_list("PIPELINE_PROCESS_NODES", [])
+PIPELINE_PROCESS_WORKERS = _env_int("PIPELINE_PROCESS_WORKERS", 4)
+
+# Índice analítico del corpus: palabras clave, temas y autores por documento (ver src/analytics_store.py)
+ANALYTICS_ENABLED = _env_bool("ANALYTICS_ENABLED", True)
+ANALYTICS_DIR = _env_str("ANALYTICS_DIR", os.path.join(".cache", "analytics"))
+ANALYTICS_MAX_FILTER_DOCS = _env_int("ANALYTICS_MAX_FILTER_DOCS", 1000)  # doc_hash por filtro de búsqueda
+
+# Exportación del corpus a Parquet e importación masiva (ver src/corpus_export.py)
+EXPORT_DIR = _env_str("EXPORT_DIR", os.path.join(".cache", "export"))
+EXPORT_PARTITION_BY = _env_str("EXPORT_PARTITION_BY", "lang")  # "", "lang", "source_folder" o "year"
+EXPORT_ROWS_PER_FILE = _env_int("EXPORT_ROWS_PER_FILE", 200_000)
+EXPORT_BATCH_ROWS = _env_int("EXPORT_BATCH_ROWS", 10_000)  # filas por lote al leer o importar
+EXPORT_ON_INGEST = _env_bool("EXPORT_ON_INGEST", False)  # exportar también cada ingesta a EXPORT_DIR
+# Bulk insert de Milvus: los ficheros se suben al almacén de objetos del servidor (MinIO/S3)
+MILVUS_BULK_ENDPOINT = _env_str("MILVUS_BULK_ENDPOINT", "")  # p. ej. "localhost:9000"; vacío = desactivado
+MILVUS_BULK_ACCESS_KEY = _env_str("MILVUS_BULK_ACCESS_KEY", "minioadmin")
+MILVUS_BULK_SECRET_KEY = _env_str("MILVUS_BULK_SECRET_KEY", "minioadmin")
+MILVUS_BULK_BUCKET = _env_str("MILVUS_BULK_BUCKET", "a-bucket")  # bucket por defecto de Milvus standalone
+MILVUS_BULK_SECURE = _env_bool("MILVUS_BULK_SECURE", False)
+
+# Búsqueda semántica (ver src/search_service.py)
+SEARCH_TOP_K = _env_int("SEARCH_TOP_K", 10)
+SEARCH_NPROBE = _env_int("SEARCH_NPROBE", 0)  # listas IVF por consulta (0 = automático)
+SEARCH_EF = _env_int("SEARCH_EF", 0)  # ef de HNSW (0 = automático)
+SEARCH_QUERY_CACHE_SIZE = _env_int("SEARCH_QUERY_CACHE_SIZE", 1024)  # embeddings de consultas en memoria
+SEARCH_RESULT_CACHE_SIZE = _env_int("SEARCH_RESULT_CACHE_SIZE", 256)  # resultados en memoria (0 = sin caché)
+SEARCH_RESULT_TTL_S = _env_float("SEARCH_RESULT_TTL_S", 300.0)
+# Búsqueda híbrida: ranking denso + BM25 fusionados con RRF
+SEARCH_HYBRID = _env_bool("SEARCH_HYBRID", True)
+SEARCH_HYBRID_DEPTH = _env_int("SEARCH_HYBRID_DEPTH", 0)  # candidatos de cada ranking (0 = 2·top_k)
+SEARCH_RRF_K = _env_int("SEARCH_RRF_K", 60)
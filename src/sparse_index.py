@@ -0,0 +1,116 @@
+"""
+Índice léxico (BM25) de los fragmentos indexados, para la búsqueda híbrida.
+
+Los embeddings densos recuperan bien por significado pero fallan con términos exactos
+(números de artículo, nombres de las partes, códigos de cláusula). El TextStore mantiene,
+junto al texto comprimido de cada fragmento, un índice invertido FTS5 de SQLite sin
+contenido (content=''): solo guarda los términos, no una segunda copia del texto, y
+ordena con BM25. Se actualiza en la ingesta, con las mismas claves primarias que Milvus.
+
+`reciprocal_rank_fusion` combina el ranking denso y el léxico (RRF: cada lista aporta
+1 / (k + posición)), así que no hace falta calibrar las puntuaciones de uno frente al otro.
+"""
+import logging
+import re
+import sqlite3
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_TABLE = "chunks_fts"
+
+
+def fts5_available() -> bool:
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(body)")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def match_query(text: str, max_terms: int = 32) -> str:
+    """
+    Consulta FTS5 a partir de texto libre: cada palabra es un término y las palabras con
+    puntuación interna ("1.544", "art.3-bis") se buscan como frase; los términos se unen
+    con OR y BM25 pondera los más raros.
+    """
+    clauses: List[str] = []
+    for token in text.split():
+        words = _WORD.findall(token)
+        if not words:
+            continue
+        clause = '"' + " ".join(words) + '"'
+        if clause not in clauses:
+            clauses.append(clause)
+    return " OR ".join(clauses[:max_terms])
+
+
+class SparseIndex:
+    """
+    Índice BM25 sobre una conexión SQLite (la del TextStore), por clave primaria.
+    - add / remove: dentro de la transacción de quien llama; remove necesita el texto
+      que se indexó (así funcionan las tablas FTS5 sin contenido)
+    - search: ids y puntuación BM25 (mayor = mejor) de cada consulta
+    """
+    def __init__(self, conn: Callable[[], sqlite3.Connection]):
+        self._conn = conn
+
+    def create(self) -> bool:
+        """
+        Crea la tabla si no existe; devuelve True si se acaba de crear (hay que rellenarla).
+        """
+        conn = self._conn()
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (_TABLE,)).fetchone()
+        if exists:
+            return False
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {_TABLE} USING fts5("
+            f"body, content='', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.commit()
+        return True
+
+    @staticmethod
+    def add(conn: sqlite3.Connection, rows: Iterable[Tuple[int, str]]) -> None:
+        conn.executemany(f"INSERT INTO {_TABLE}(rowid, body) VALUES (?, ?)", rows)
+
+    @staticmethod
+    def remove(conn: sqlite3.Connection, rows: Iterable[Tuple[int, str]]) -> None:
+        conn.executemany(f"INSERT INTO {_TABLE}({_TABLE}, rowid, body) VALUES ('delete', ?, ?)", rows)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        expr = match_query(query)
+        if not expr:
+            return []
+        try:
+            rows = self._conn().execute(
+                f"SELECT rowid, bm25({_TABLE}) FROM {_TABLE} WHERE {_TABLE} MATCH ? ORDER BY rank LIMIT ?",
+                (expr, top_k),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logging.warning(f"[SparseIndex] Consulta léxica no válida ({expr!r}): {e}")
+            return []
+        # bm25() de SQLite es negativo: cuanto menor, más relevante
+        return [(int(pk), -float(score)) for pk, score in rows]
+
+    def search_many(self, queries: Sequence[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        return [self.search(query, top_k) for query in queries]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]],
+                           k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[int, float]]:
+    """
+    Fusión RRF de varios rankings de ids (el primero de cada lista es el mejor):
+    score(id) = sum(peso / (k + posición)). Devuelve (id, score) de mayor a menor;
+    a igualdad de score se respeta el orden de aparición.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for position, pk in enumerate(ranking, start=1):
+            scores[pk] = scores.get(pk, 0.0) + weight / (k + position)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -1,6 +1,8 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Union
 from typing_extensions import TypedDict, Annotated, Literal
+import copy
 import operator
+import numpy as np
 
 # Funciones de merge para campos del estado:
 
@@ -69,35 +71,116 @@ def update_source_stats(
     return updates
 
 
+# Delta de un agente: posición del documento en state['documents'] -> campos nuevos
+DocumentDelta = Dict[int, Dict[str, Any]]
+
+# Campos de `metadatos` que devuelve cada agente de enriquecimiento, con su valor por
+# defecto. Son iguales en todos los fragmentos de un documento: el TextStore los guarda
+# una vez por documento en lugar de en el JSON de cada fragmento (text_store.DOCUMENT_DETAIL_KEYS).
+ENRICHMENT_FIELDS: Dict[str, Dict[str, Any]] = {
+    "SummarizerAgent": {"summary_abstract": None, "summary_extractive": None,
+                        "key_points": [], "recommended_actions": []},
+    "KeywordAgent":    {"keywords": []},
+    "TopicModelAgent": {"topics": [], "subtopics": []},
+    "StructureAgent":  {"structure": None, "auto_index": None, "structural_patterns": None, "references": None},
+    "InsightAgent":    {"insights": []},
+}
+
+
+def metadata_delta(
+    documents: List[Dict[str, Any]],
+    fields: Dict[str, Any],
+) -> DocumentDelta:
+    """
+    Delta de `metadatos` a partir de los documentos enriquecidos por un agente: para cada
+    documento, solo los campos de `fields` (con su valor por defecto si faltan), sin textos.
+    """
+    delta: DocumentDelta = {}
+    for idx, doc in enumerate(documents):
+        meta = doc.get("metadata", {})
+        # Los valores por defecto se copian: `fields` es compartido (ENRICHMENT_FIELDS)
+        delta[idx] = {key: meta[key] if key in meta else copy.copy(default) for key, default in fields.items()}
+    return delta
+
+
 def update_metadatos(
     existing: Optional[List[Dict[str, Any]]] = None,
-    updates: Optional[List[Dict[str, Any]]] = None,
+    updates: Optional[Union[DocumentDelta, List[Dict[str, Any]]]] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Actualiza los metadatos de los documentos.
-    Si no hay metadatos existentes, crea una nueva lista.
-    Si hay actualizaciones, las aplica a los metadatos existentes.
+    Fusiona los metadatos de enriquecimiento de los documentos (uno por documento).
+    - `updates` es normalmente un delta {posición: {campo: valor}} devuelto por un agente;
+      también se acepta una lista completa (posición i -> campos del documento i).
+    - Solo se tocan los documentos del delta (O(cambios)); el dict de cada documento
+      cambiado se sustituye por una copia con los campos nuevos en lugar de modificarse,
+      así que ningún agente ve cambiar un dict que ya había leído.
+    - Cada fusión devuelve una lista nueva (copia de punteros, O(n)) que crece con {} hasta
+      la posición más alta: `existing` no se modifica, así que las instantáneas ya
+      entregadas (stream_mode="values", la lista de entrada, el resultado de un subgrafo)
+      no cambian después.
     """
-    if existing is None:
-        existing = []
-    
     if updates is None:
-        return existing
-    
-    # Asegurar que la longitud de los metadatos coincida con el número de documentos
-    while len(existing) < len(updates):
-        existing.append({})
-    
-    # Actualizar los metadatos existentes con las actualizaciones
-    for i, update in enumerate(updates):
-        if i < len(existing):
-            # Si el documento ya tiene metadatos, actualizarlos
-            if existing[i]:
-                existing[i].update(update)
-            else:
-                # Si no tiene metadatos, asignar los nuevos directamente
-                existing[i] = update
-    
+        return existing if existing is not None else []
+    merged = list(existing or [])
+    items = updates.items() if isinstance(updates, dict) else enumerate(updates)
+    for idx, fields in items:
+        if not fields:
+            continue
+        while len(merged) <= idx:
+            merged.append({})
+        merged[idx] = {**merged[idx], **fields} if merged[idx] else dict(fields)
+    return merged
+
+
+def document_views(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Documentos con los metadatos de enriquecimiento fusionados en 'metadata' (para mostrar
+    resultados). Son dicts nuevos que comparten el texto con state['documents'].
+    """
+    metadatos = state.get("metadatos") or []
+    views = []
+    for idx, doc in enumerate(state.get("documents") or []):
+        extra = metadatos[idx] if idx < len(metadatos) else {}
+        views.append({**doc, "metadata": {**doc.get("metadata", {}), **extra}})
+    return views
+
+
+def update_embeddings(
+    existing: Optional[np.ndarray] = None,
+    updates: Optional[Union[np.ndarray, List[List[float]]]] = None,
+) -> np.ndarray:
+    """
+    Controla cómo se fusiona el campo `embeddings` (matriz NumPy de forma (n, dim)).
+    - Si `updates` es None o está vacío, devuelve `existing`.
+    - Si `existing` está vacío, devuelve `updates` sin copiarlo.
+    - Si ambos tienen filas, las concatena (una sola copia, sin pasar por listas de floats).
+    También acepta listas de vectores y las convierte a float32.
+    """
+    from src.vector_utils import as_embedding_matrix
+    if updates is None or len(updates) == 0:
+        return existing if existing is not None else np.zeros((0, 0), dtype=np.float32)
+    updates = as_embedding_matrix(updates)
+    if existing is None or len(existing) == 0:
+        return updates
+    return np.concatenate([as_embedding_matrix(existing), updates])
+
+
+def update_known_hashes(
+    existing: Optional[Set[str]] = None,
+    updates: Optional[Set[str]] = None,
+) -> Set[str]:
+    """
+    Controla cómo se fusiona el campo `known_hashes` (hashes de los documentos ya vistos).
+    - La primera escritura se guarda tal cual, sin copiarla: en el modo por documento todos
+      los subgrafos reciben el mismo conjunto y así detectan duplicados entre ellos.
+    - Las siguientes se añaden al conjunto existente (si no son el mismo objeto).
+    """
+    if updates is None:
+        return existing if existing is not None else set()
+    if existing is None:
+        return updates
+    if updates is not existing:
+        existing.update(updates)
     return existing
 
 
@@ -107,8 +190,16 @@ class DocState(TypedDict, total=False):
     # 2) Tras LoaderAgent y MetadataAgent:
     documents: Annotated[List[Dict[str, Any]], update_documents]
     source_stats: Annotated[Dict[str, Any], update_source_stats]
-    # 3) Paralelismo: Summaries, Keywords, Topics, Structure, Insights (merge operator.add)
+    # 3) Paralelismo: Summaries, Keywords, Topics, Structure, Insights (deltas por documento)
     metadatos: Annotated[List[Dict[str, Any]], update_metadatos]
-    embeddings: Annotated[List[List[float]], operator.add]
+    embeddings: Annotated[np.ndarray, update_embeddings]
+    # 3b) Tras VectorizerAgent: un dict de metadatos por embedding (fragmento)
+    chunk_metadatos: Annotated[List[Dict[str, Any]], operator.add]
+    # Hashes de los documentos ya vistos (MetadataAgent, detección de duplicados)
+    known_hashes: Annotated[Set[str], update_known_hashes]
+    # Modo por documento: temas de BERTopic ajustados una vez sobre todo el corpus, por documento
+    corpus_topics: List[Dict[str, Any]]
     # 4) Resultado final:
-    index_result: Annotated[Dict[str, Any], operator.or_]
\ No newline at end of file
+    index_result: Annotated[Dict[str, Any], operator.or_]
+    # 4b) Modo por documento (PIPELINE_MODE=document): un resumen por documento terminado
+    document_results: Annotated[List[Dict[str, Any]], operator.add]
\ No newline at end of file
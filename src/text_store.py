@@ -0,0 +1,279 @@
+"""
+Almacén comprimido de los textos de los fragmentos indexados.
+
+Milvus solo guarda en cada fila los campos que se usan para filtrar y mostrar resultados;
+el texto del fragmento y los resultados de enriquecimiento del documento (resumen,
+palabras clave, temas, estructura, insights), que antes se repetían en el JSON de cada
+fragmento, se guardan aquí una sola vez y comprimidos:
+  - chunks:    clave primaria de Milvus -> texto del fragmento (con sus offsets)
+  - documents: hash del documento -> detalles de enriquecimiento (JSON)
+Los textos se leen bajo demanda a partir de los ids que devuelve la búsqueda, y el texto
+completo de un documento se recompone uniendo sus fragmentos por offsets.
+
+Se comprime con zstd si está instalado el paquete `zstandard` y con zlib si no; cada fila
+guarda su códec, así que un mismo fichero puede tener filas de ambos.
+
+Con `sparse=True` el mismo fichero guarda además el índice BM25 de los fragmentos
+(src/sparse_index.py), que se mantiene al insertar y borrar textos.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.sparse_index import SparseIndex, fts5_available
+from src.state import ENRICHMENT_FIELDS
+
+try:
+    import zstandard
+    _HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    _HAS_ZSTD = False
+
+# Claves de los metadatos que no viajan a Milvus: el texto del fragmento y los
+# resultados de los agentes de enriquecimiento (iguales en todos los fragmentos del documento)
+TEXT_KEYS = ("text", "content")
+DOCUMENT_DETAIL_KEYS = tuple(key for fields in ENRICHMENT_FIELDS.values() for key in fields)
+_IN_BATCH = 500
+
+
+def split_payload(meta: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str], Dict[str, Any]]:
+    """
+    Separa unos metadatos aplanados en (metadatos para Milvus, texto del fragmento,
+    detalles del documento).
+    """
+    text = next((meta[key] for key in TEXT_KEYS if meta.get(key)), None)
+    details = {key: meta[key] for key in DOCUMENT_DETAIL_KEYS if key in meta}
+    lean = {k: v for k, v in meta.items() if k not in TEXT_KEYS and k not in DOCUMENT_DETAIL_KEYS}
+    return lean, text, details
+
+
+def _in_batches(values: Sequence[Any]) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(values), _IN_BATCH):
+        yield values[start:start + _IN_BATCH]
+
+
+class TextStore:
+    """
+    Textos de fragmentos y detalles de documentos en un fichero SQLite, comprimidos.
+    - put_chunks / get_chunks / delete_chunks: por clave primaria de Milvus
+    - put_details / get_details: por hash de documento
+    - document_text(doc_hash): texto del documento recompuesto desde sus fragmentos
+    - sparse_search(queries): ids y puntuación BM25 de cada consulta (con `sparse=True`)
+    - stats(): filas y ratio de compresión
+    """
+    def __init__(self, path: str, codec: str = "zstd", level: int = 3, sparse: bool = False):
+        if codec not in ("zstd", "zlib"):
+            raise ValueError(f"Códec no soportado: '{codec}' (usa 'zstd' o 'zlib').")
+        if codec == "zstd" and not _HAS_ZSTD:
+            logging.warning("[TextStore] El paquete 'zstandard' no está instalado; se comprime con zlib")
+            codec = "zlib"
+        self.path = path
+        self.codec = codec
+        self.level = level
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self.sparse: Optional[SparseIndex] = None
+        self._init_db()
+        self._init_sparse(sparse)
+
+    # ------------------------------------------------------------------ SQLite
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY, doc_hash TEXT, char_start INTEGER, char_end INTEGER,"
+            " codec TEXT NOT NULL, raw_bytes INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_hash, char_start)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_hash TEXT PRIMARY KEY, codec TEXT NOT NULL, raw_bytes INTEGER NOT NULL, details BLOB NOT NULL)"
+        )
+        conn.commit()
+
+    def _init_sparse(self, enabled: bool) -> None:
+        # Si el fichero ya tiene índice léxico se mantiene siempre, para que no se desincronice
+        exists = self._conn().execute("SELECT 1 FROM sqlite_master WHERE name='chunks_fts'").fetchone()
+        if not enabled and not exists:
+            return
+        if not fts5_available():
+            logging.warning("[TextStore] SQLite no incluye FTS5; no hay índice léxico para la búsqueda híbrida")
+            return
+        self.sparse = SparseIndex(self._conn)
+        if self.sparse.create():
+            self._backfill_sparse()
+
+    def _backfill_sparse(self) -> None:
+        # Almacenes creados antes del índice léxico: se indexan sus textos una vez
+        conn = self._conn()
+        total = 0
+        last_id = -(2 ** 63)
+        while True:
+            rows = conn.execute(
+                "SELECT id, codec, data FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, _IN_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            with conn:
+                self.sparse.add(conn, [(pk, self._decompress(codec, data)) for pk, codec, data in rows])
+            total += len(rows)
+            last_id = rows[-1][0]
+        if total:
+            logging.info(f"[TextStore] Índice léxico construido con {total} fragmentos existentes")
+
+    # ------------------------------------------------------------------ Compresión
+    def _compress(self, text: str) -> Tuple[bytes, int]:
+        raw = text.encode("utf-8")
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(raw), len(raw)
+        return zlib.compress(raw, min(max(self.level, 1), 9)), len(raw)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> str:
+        if codec == "zstd":
+            if not _HAS_ZSTD:
+                raise RuntimeError("Hay textos comprimidos con zstd y el paquete 'zstandard' no está instalado.")
+            return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+        return zlib.decompress(data).decode("utf-8")
+
+    # ------------------------------------------------------------------ Fragmentos
+    def put_chunks(self, ids: Sequence[int], texts: Sequence[str], metadata: Sequence[Dict[str, Any]]) -> None:
+        """
+        Guarda (o reemplaza) el texto de cada fragmento bajo su clave primaria de Milvus.
+        """
+        rows = []
+        indexed = []
+        for pk, text, meta in zip(ids, texts, metadata):
+            if text is None:
+                continue
+            data, raw_bytes = self._compress(text)
+            rows.append((int(pk), meta.get("doc_id") or meta.get("hash"),
+                         meta.get("char_start"), meta.get("char_end"), self.codec, raw_bytes, data))
+            indexed.append((int(pk), text))
+        if rows:
+            # Los textos reemplazados salen antes del índice léxico
+            previous = self.get_chunks([pk for pk, _ in indexed]) if self.sparse is not None else {}
+            with self._conn() as conn:
+                conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                if self.sparse is not None:
+                    self.sparse.remove(conn, previous.items())
+                    self.sparse.add(conn, indexed)
+
+    def get_chunks(self, ids: Sequence[int]) -> Dict[int, str]:
+        """
+        Textos de los fragmentos pedidos ({id: texto}; los que no estén se omiten).
+        """
+        found: Dict[int, str] = {}
+        conn = self._conn()
+        for batch in _in_batches([int(pk) for pk in ids]):
+            placeholders = ",".join("?" * len(batch))
+            for pk, codec, data in conn.execute(
+                f"SELECT id, codec, data FROM chunks WHERE id IN ({placeholders})", batch
+            ):
+                found[pk] = self._decompress(codec, data)
+        return found
+
+    def delete_chunks(self, ids: Sequence[int]) -> None:
+        previous = self.get_chunks(ids) if self.sparse is not None else {}
+        with self._conn() as conn:
+            if self.sparse is not None:
+                self.sparse.remove(conn, previous.items())
+            for batch in _in_batches([int(pk) for pk in ids]):
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def document_text(self, doc_hash: str) -> Optional[str]:
+        """
+        Texto del documento recompuesto con sus fragmentos ordenados por offset: los
+        solapes se recortan y los huecos entre fragmentos se rellenan con un espacio.
+        """
+        rows = self._conn().execute(
+            "SELECT char_start, codec, data FROM chunks WHERE doc_hash=? ORDER BY char_start, id", (doc_hash,)
+        ).fetchall()
+        if not rows:
+            return None
+        parts: List[str] = []
+        length = 0
+        for start, codec, data in rows:
+            text = self._decompress(codec, data)
+            start = length if start is None else int(start)
+            if start > length:
+                parts.append(" ")
+                length = start
+            overlap = length - start
+            if overlap < len(text):
+                parts.append(text[overlap:])
+                length = start + len(text)
+        return "".join(parts)
+
+    def sparse_search(self, queries: Sequence[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        Fragmentos más relevantes por BM25 para cada consulta ([(id, puntuación)], mayor = mejor).
+        """
+        if self.sparse is None:
+            return [[] for _ in queries]
+        return self.sparse.search_many(queries, top_k)
+
+    # ------------------------------------------------------------------ Documentos
+    def put_details(self, details_by_doc: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Guarda (o reemplaza) los detalles de enriquecimiento de cada documento.
+        """
+        rows = []
+        for doc_hash, details in details_by_doc.items():
+            if not doc_hash or not details:
+                continue
+            data, raw_bytes = self._compress(json.dumps(details, ensure_ascii=False, default=str))
+            rows.append((doc_hash, self.codec, raw_bytes, data))
+        if rows:
+            with self._conn() as conn:
+                conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", rows)
+
+    def get_details(self, doc_hash: str) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT codec, details FROM documents WHERE doc_hash=?", (doc_hash,)).fetchone()
+        return json.loads(self._decompress(*row)) if row else {}
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        stats: Dict[str, Any] = {"path": self.path, "codec": self.codec, "sparse_index": self.sparse is not None}
+        for table, column in (("chunks", "data"), ("documents", "details")):
+            rows, raw, stored = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH({column})), 0) FROM {table}"
+            ).fetchone()
+            stats[table] = {
+                "rows": rows,
+                "raw_mb": round(raw / 1e6, 3),
+                "stored_mb": round(stored / 1e6, 3),
+                "ratio": round(raw / stored, 2) if stored else None,
+            }
+        return stats
+
+    def copy_to(self, path: str) -> None:
+        """
+        Copia coherente del almacén en `path` (API de copia de SQLite, válida con WAL).
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        target = sqlite3.connect(path, timeout=30)
+        try:
+            self._conn().backup(target)
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,801 @@
+"""
+Almacén de vectores con dos implementaciones intercambiables (VECTOR_STORE_BACKEND):
+  - "milvus": la colección de Milvus del IndexerAgent (requiere un servidor)
+  - "local":  almacén embebido en ficheros, sin servidor ni pymilvus: los vectores en una
+    matriz float32 mapeada en memoria y sus metadatos en SQLite, con las mismas columnas
+    escalares que la colección de Milvus (src/milvus_schema.py)
+Las dos tienen la misma API (insert, upsert, search con filtros, delete, count) y las
+mismas claves deterministas, así que el resto del pipeline no depende del backend.
+
+El almacén local busca por fuerza bruta entre las filas que pasan los filtros. A partir de
+LOCAL_STORE_IVF_MIN_ROWS vectores (nunca menos de IVF_MIN_TRAIN_ROWS) entrena un índice IVF
+(k-means esférico con nlist ~ 4·sqrt(n)): cada fila guarda el número de su lista y una
+búsqueda solo recorre las LOCAL_STORE_NPROBE listas más cercanas a la consulta
+(0 = automático: nlist/6 con menos de 1024 listas, nlist/8 a partir de ahí).
+"""
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.state import DocState
+from src.milvus_schema import (
+    SCALAR_FIELDS,
+    SCALAR_FIELDS_BY_NAME,
+    chunk_primary_key,
+    flatten_metadata,
+    like_escape,
+    merge_metadata,
+    split_metadata,
+)
+from src.settings import (
+    LOCAL_STORE_DIR,
+    LOCAL_STORE_IVF_MIN_ROWS,
+    LOCAL_STORE_NPROBE,
+    MILVUS_COLLECTION,
+    TEXT_STORE_CODEC,
+    SPARSE_INDEX_ENABLED,
+    TEXT_STORE_ENABLED,
+    VECTOR_STORE_BACKEND,
+)
+from src.text_store import TextStore, split_payload
+from src.corpus_export import open_ingest_writer
+from src.vector_utils import as_embedding_matrix, nearest_centroids, spherical_kmeans, validate_embeddings
+
+Batches = Iterable[Tuple[Any, List[Dict[str, Any]]]]
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+_IN_BATCH = 500
+_BLOCK_ROWS = 65536
+# Por debajo de estas filas el IVF no compensa: con nlist ~ 4·sqrt(n) las listas son cortas
+# y para llegar a recall 0.9 hay que recorrer casi tanto como la búsqueda exacta
+IVF_MIN_TRAIN_ROWS = 50_000
+
+
+class VectorStore(ABC):
+    """
+    Interfaz común de los almacenes de vectores.
+    - insert / insert_stream: añade filas (las que ya existen se omiten y, al terminar, se
+      borran las filas obsoletas de las mismas fuentes)
+    - upsert: igual, pero reescribiendo las filas que ya existen
+    - search: vecinos por consulta como {"id", "distance", "score", "metadata"}, con los
+      filtros de milvus_schema.build_filter_expr y
+      `search_params` opcionales ({"nprobe": ...}, {"ef": ...})
+    - sparse_search: ranking léxico (BM25) de consultas de texto, del TextStore
+    - fetch_metadata: metadatos de unas filas concretas que cumplen unos filtros
+    - iter_batches: todas las filas como (matriz float32, metadatos con su texto), por lotes
+      (exportación y copias de seguridad)
+    - delete, count, fetch_texts
+    `generation` aumenta con cada escritura o borrado hecho a través del almacén (las cachés
+    de resultados lo usan para invalidarse).
+    """
+    backend = ""
+    generation = 0
+
+    def _changed(self) -> None:
+        self.generation += 1
+
+    def insert(self, embeddings: Union[np.ndarray, List[List[float]]], metadata: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self.insert_stream([(embeddings, metadata)])
+
+    def upsert(self, embeddings: Union[np.ndarray, List[List[float]]], metadata: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self.insert_stream([(embeddings, metadata)], replace=True)
+
+    @abstractmethod
+    def insert_stream(self, batches: Batches, replace: bool = False) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def search(self,
+               query_vectors: Union[np.ndarray, List[List[float]]],
+               top_k: int = 10,
+               filters: Optional[Dict[str, Any]] = None,
+               with_text: bool = False,
+               search_params: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[int]) -> int:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def fetch_texts(self, ids: Sequence[int]) -> Dict[int, str]:
+        ...
+
+    @abstractmethod
+    def fetch_metadata(self, ids: Sequence[int], filters: Optional[Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        ...
+
+    def _text_store(self) -> Optional[TextStore]:
+        return None
+
+    @property
+    def has_sparse(self) -> bool:
+        store = self._text_store()
+        return store is not None and store.sparse is not None
+
+    def sparse_search(self, queries: Sequence[str], top_k: int = 10) -> List[List[Tuple[int, float]]]:
+        store = self._text_store()
+        return store.sparse_search(queries, top_k) if store is not None else [[] for _ in queries]
+
+
+class MilvusVectorStore(VectorStore):
+    """
+    Adaptador del IndexerAgent (la colección de Milvus) a la interfaz VectorStore.
+    """
+    backend = "milvus"
+
+    def __init__(self, collection_name: str = MILVUS_COLLECTION, agent: Optional[Any] = None, **agent_kwargs):
+        if agent is None:
+            from src.indexer_agent import IndexerAgent
+            agent = IndexerAgent(collection_name=collection_name, **agent_kwargs)
+        self.agent = agent
+        self.collection_name = agent.collection_name
+
+    def insert(self, embeddings, metadata) -> Dict[str, Any]:
+        try:
+            return self.agent.run(embeddings, metadata)
+        finally:
+            self._changed()
+
+    def upsert(self, embeddings, metadata) -> Dict[str, Any]:
+        try:
+            return self.agent.run(embeddings, metadata, replace=True)
+        finally:
+            self._changed()
+
+    def insert_stream(self, batches: Batches, replace: bool = False) -> Dict[str, Any]:
+        try:
+            return self.agent.run_stream(batches, replace=replace)
+        finally:
+            self._changed()
+
+    def search(self, query_vectors, top_k: int = 10, filters=None, with_text: bool = False, search_params=None):
+        return self.agent.search(query_vectors, top_k=top_k, filters=filters, with_text=with_text,
+                                 search_params=search_params)
+
+    def delete(self, ids: Sequence[int]) -> int:
+        self.agent.open_collection()
+        try:
+            return self.agent.delete_ids(list(ids))
+        finally:
+            self._changed()
+
+    def count(self) -> int:
+        return self.agent.open_collection().num_entities
+
+    def fetch_texts(self, ids: Sequence[int]) -> Dict[int, str]:
+        return self.agent.fetch_texts(list(ids))
+
+    def fetch_metadata(self, ids: Sequence[int], filters=None) -> Dict[int, Dict[str, Any]]:
+        return self.agent.fetch_metadata(list(ids), filters)
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        from src.milvus_migration import iter_collection
+        if self.agent.storage != "float32":
+            raise ValueError(
+                f"Solo se pueden leer los vectores originales de colecciones float32 "
+                f"('{self.collection_name}' usa {self.agent.storage})."
+            )
+        return iter_collection(self.agent.open_collection(), batch_size, self.agent.text_store)
+
+    def _text_store(self) -> Optional[TextStore]:
+        return self.agent.text_store
+
+
+def build_sql_filter(filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """
+    Traduce los filtros de IndexerAgent.search a cláusulas SQL con parámetros:
+      escalar -> igualdad, lista -> IN, tupla (desde, hasta) -> rango cerrado (None = abierto).
+    "year" filtra por el año de date_min (como las particiones por año) y "source_folder"
+    por la carpeta de `source`; las claves sin columna se buscan en el JSON de metadatos.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for key, value in (filters or {}).items():
+        if key == "year":
+            if isinstance(value, tuple):
+                low, high = value
+                clauses.append("date_min > 0")
+                if low is not None:
+                    clauses.append("date_min >= ?")
+                    params.append(int(low) * 10000)
+                if high is not None:
+                    clauses.append("date_min <= ?")
+                    params.append(int(high) * 10000 + 9999)
+                continue
+            years = value if isinstance(value, (list, set)) else [value]
+            clauses.append("(" + " OR ".join("date_min BETWEEN ? AND ?" for _ in years) + ")")
+            for year in years:
+                params.extend([int(year) * 10000, int(year) * 10000 + 9999])
+            continue
+        if key == "source_folder":
+            folders = value if isinstance(value, (list, set)) else [value]
+            parts = []
+            for folder in folders:
+                prefix = like_escape(os.path.join(os.path.normpath(str(folder)), ""))
+                parts.append("(source LIKE ? ESCAPE '\\' AND source NOT LIKE ? ESCAPE '\\')")
+                params.extend([f"{prefix}%", f"{prefix}%{like_escape(os.sep)}%"])
+            clauses.append("(" + " OR ".join(parts) + ")")
+            continue
+
+        if key in SCALAR_FIELDS_BY_NAME:
+            target, target_params = key, []
+        else:
+            target, target_params = "json_extract(metadata, ?)", [f'$."{key}"']
+        if isinstance(value, tuple):
+            low, high = value
+            if low is not None:
+                clauses.append(f"{target} >= ?")
+                params.extend(target_params + [low])
+            if high is not None:
+                clauses.append(f"{target} <= ?")
+                params.extend(target_params + [high])
+        elif isinstance(value, (list, set)):
+            clauses.append(f"{target} IN ({','.join('?' * len(value))})")
+            params.extend(target_params + list(value))
+        else:
+            clauses.append(f"{target} = ?")
+            params.extend(target_params + [value])
+    return clauses, params
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Almacén embebido en un directorio por colección:
+      - vectors.f32:  matriz float32 (filas normalizadas) que solo crece; se lee mapeada
+      - store.sqlite: una fila por id con su fila de la matriz, su lista IVF, las columnas
+                      escalares y el JSON de metadatos
+      - centroids.npy: centroides del IVF (si se ha entrenado)
+      - texts.sqlite: TextStore con el texto de los fragmentos
+    Las filas reemplazadas o borradas dejan huecos en vectors.f32 que compact() elimina.
+    """
+    backend = "local"
+
+    def __init__(self,
+                 collection_name: str = MILVUS_COLLECTION,
+                 root: str = LOCAL_STORE_DIR,
+                 ivf_min_rows: int = LOCAL_STORE_IVF_MIN_ROWS,
+                 nprobe: int = LOCAL_STORE_NPROBE,
+                 text_store: bool = TEXT_STORE_ENABLED):
+        self.collection_name = collection_name
+        self.path = os.path.join(root, _UNSAFE_CHARS.sub("_", collection_name))
+        os.makedirs(self.path, exist_ok=True)
+        self._db_path = os.path.join(self.path, "store.sqlite")
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._centroids_path = os.path.join(self.path, "centroids.npy")
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.memmap] = None
+        self._centroids: Optional[np.ndarray] = None
+        # (ids, filas) de todas las filas vivas, para las búsquedas sin filtros ni IVF
+        self._all_rows: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.text_store = TextStore(os.path.join(self.path, "texts.sqlite"), codec=TEXT_STORE_CODEC,
+                                    sparse=SPARSE_INDEX_ENABLED) if text_store else None
+        self._init_db()
+        if os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+
+    # ------------------------------------------------------------------ SQLite
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        conn = self._conn()
+        columns = ", ".join(
+            f"{field.name} {'TEXT' if field.dtype == 'VARCHAR' else 'INTEGER'}" for field in SCALAR_FIELDS
+        )
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS rows ("
+            f" id INTEGER PRIMARY KEY, row INTEGER NOT NULL, list_id INTEGER, {columns}, metadata TEXT NOT NULL)"
+        )
+        for name in ["list_id"] + [field.name for field in SCALAR_FIELDS]:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_rows_{name} ON rows({name})")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        conn.commit()
+
+    def _meta(self) -> Dict[str, int]:
+        values = dict(self._conn().execute("SELECT name, value FROM meta").fetchall())
+        return {
+            "dim": int(values.get("dim", 0)),
+            "vector_rows": int(values.get("vector_rows", 0)),
+            "ivf_rows": int(values.get("ivf_rows", 0)),
+        }
+
+    def _set_meta(self, conn: sqlite3.Connection, **values: int) -> None:
+        conn.executemany(
+            "INSERT INTO meta(name, value) VALUES(?, ?) ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+            [(k, str(v)) for k, v in values.items()],
+        )
+
+    # ------------------------------------------------------------------ Matriz
+    def _reader(self) -> np.memmap:
+        """
+        Mapeo de solo lectura de vectors.f32, reabierto si el fichero ha crecido.
+        """
+        meta = self._meta()
+        if self._matrix is None or self._matrix.shape[0] < meta["vector_rows"]:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(meta["vector_rows"], meta["dim"]))
+        return self._matrix
+
+    def _append_vectors(self, matrix: np.ndarray) -> int:
+        # Devuelve la fila de la matriz en la que empieza el lote
+        meta = self._meta()
+        if meta["dim"] and meta["dim"] != matrix.shape[1]:
+            raise ValueError(
+                f"La colección local '{self.collection_name}' tiene dimensión {meta['dim']} y "
+                f"los embeddings {matrix.shape[1]}."
+            )
+        with open(self._vectors_path, "ab") as fh:
+            fh.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            fh.flush()
+            os.fsync(fh.fileno())
+        with self._conn() as conn:
+            self._set_meta(conn, dim=matrix.shape[1], vector_rows=meta["vector_rows"] + matrix.shape[0])
+        return meta["vector_rows"]
+
+    # ------------------------------------------------------------------ Escritura
+    def _existing(self, ids: Sequence[int]) -> set:
+        conn = self._conn()
+        found: set = set()
+        for start in range(0, len(ids), _IN_BATCH):
+            batch = list(ids[start:start + _IN_BATCH])
+            found.update(pk for (pk,) in conn.execute(
+                f"SELECT id FROM rows WHERE id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return found
+
+    def _write_rows(self, ids: List[int], matrix: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        matrix = matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+        first = self._append_vectors(matrix)
+        lists = nearest_centroids(matrix, self._centroids) if self._centroids is not None else None
+        rows = []
+        for pos, (pk, meta) in enumerate(zip(ids, metadata)):
+            scalars, rest = split_metadata(meta)
+            rows.append((
+                pk, first + pos, int(lists[pos]) if lists is not None else None,
+                *[scalars[field.name] for field in SCALAR_FIELDS],
+                json.dumps(rest, ensure_ascii=False, default=str),
+            ))
+        placeholders = ",".join("?" * (len(SCALAR_FIELDS) + 4))
+        with self._conn() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO rows VALUES ({placeholders})", rows)
+        self._all_rows = None
+
+    def insert_stream(self, batches: Batches, replace: bool = False) -> Dict[str, Any]:
+        start = time.perf_counter()
+        seen: set = set()
+        sources: set = set()
+        total = inserted = skipped = 0
+        with self._lock:
+            for embeddings, metadata in batches:
+                matrix = as_embedding_matrix(embeddings, dtype="float32")
+                validate_embeddings(matrix, expected_rows=len(metadata))
+                metas = flatten_metadata(metadata)
+                ids = [chunk_primary_key(meta) for meta in metas]
+                total += len(ids)
+                sources.update(str(meta["source"]) for meta in metas if meta.get("source"))
+
+                unique = []
+                for pos, pk in enumerate(ids):
+                    if pk not in seen:
+                        seen.add(pk)
+                        unique.append(pos)
+                existing = set() if replace else self._existing([ids[pos] for pos in unique])
+                keep = [pos for pos in unique if ids[pos] not in existing]
+                skipped += len(ids) - len(keep)
+                if not keep:
+                    continue
+
+                metas = [metas[pos] for pos in keep]
+                if self.text_store is not None:
+                    split = [split_payload(meta) for meta in metas]
+                    metas = [lean for lean, _, _ in split]
+                    self.text_store.put_details({
+                        lean.get("doc_id") or lean.get("hash"): details
+                        for lean, _, details in split if details
+                    })
+                    self.text_store.put_chunks([ids[pos] for pos in keep], [text for _, text, _ in split], metas)
+                self._write_rows([ids[pos] for pos in keep], matrix[keep], metas)
+                inserted += len(keep)
+
+            if not total:
+                raise ValueError("Se esperaba una lista no vacía de embeddings.")
+            # Un upsert actualiza filas sueltas: no implica que el resto de la fuente esté obsoleto
+            deleted = self._delete_stale(sources, seen) if not replace else 0
+            ivf = self._maybe_train_ivf()
+            self._changed()
+
+        elapsed = time.perf_counter() - start
+        logging.info(
+            f"[LocalVectorStore] Insertados {inserted} de {total} vectores en '{self.collection_name}' "
+            f"({skipped} ya indexados, {deleted} obsoletos borrados) en {elapsed:.2f}s"
+        )
+        return {
+            "insert_count": inserted,
+            "skipped_count": skipped,
+            "deleted_count": deleted,
+            "failed_count": 0,
+            "elapsed_s": round(elapsed, 3),
+            "backend": self.backend,
+            "rows": self.count(),
+            "index": ivf,
+        }
+
+    def _delete_stale(self, sources: set, seen: set) -> int:
+        ordered = sorted(sources)
+        stale: List[int] = []
+        conn = self._conn()
+        for start in range(0, len(ordered), _IN_BATCH):
+            batch = ordered[start:start + _IN_BATCH]
+            stale.extend(pk for (pk,) in conn.execute(
+                f"SELECT id FROM rows WHERE source IN ({','.join('?' * len(batch))})", batch
+            ) if pk not in seen)
+        return self.delete(stale) if stale else 0
+
+    def delete(self, ids: Sequence[int]) -> int:
+        ids = [int(pk) for pk in ids]
+        deleted = 0
+        with self._lock, self._conn() as conn:
+            for start in range(0, len(ids), _IN_BATCH):
+                batch = ids[start:start + _IN_BATCH]
+                deleted += conn.execute(f"DELETE FROM rows WHERE id IN ({','.join('?' * len(batch))})", batch).rowcount
+        if self.text_store is not None:
+            self.text_store.delete_chunks(ids)
+        self._all_rows = None
+        self._changed()
+        return deleted
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    # ------------------------------------------------------------------ IVF
+    def _maybe_train_ivf(self) -> Dict[str, Any]:
+        rows = self.count()
+        trained = self._meta()["ivf_rows"]
+        if rows >= max(self.ivf_min_rows, IVF_MIN_TRAIN_ROWS) and (not trained or rows >= 4 * trained):
+            return self.train_ivf()
+        return {"index_type": "IVF_FLAT" if self._centroids is not None else "FLAT", "rows": rows}
+
+    def train_ivf(self, nlist: Optional[int] = None, max_train_rows: int = 50_000) -> Dict[str, Any]:
+        """
+        Entrena los centroides del IVF con una muestra de las filas y asigna su lista a todas.
+        Con menos de IVF_MIN_TRAIN_ROWS filas lanza ValueError (la fuerza bruta es mejor).
+        """
+        start = time.perf_counter()
+        with self._lock:
+            pairs = np.asarray(self._conn().execute("SELECT id, row FROM rows ORDER BY row").fetchall(), dtype=np.int64)
+            n_rows = len(pairs)
+            if n_rows < IVF_MIN_TRAIN_ROWS:
+                raise ValueError(
+                    f"El IVF necesita al menos {IVF_MIN_TRAIN_ROWS} vectores (hay {n_rows}); "
+                    f"por debajo la búsqueda exacta es igual de rápida y no pierde recall."
+                )
+            nlist = nlist or int(min(4096, max(16, 4 * math.sqrt(max(n_rows, 1)))))
+            if n_rows < nlist:
+                raise ValueError(f"Se necesitan al menos {nlist} vectores para entrenar el IVF (hay {n_rows}).")
+            matrix = self._reader()
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(pairs[:, 1], min(n_rows, max_train_rows), replace=False))
+            centroids = spherical_kmeans(matrix[sample], nlist)
+            lists = np.empty(n_rows, dtype=np.int64)
+            for block in range(0, n_rows, _BLOCK_ROWS):
+                rows = pairs[block:block + _BLOCK_ROWS, 1]
+                lists[block:block + _BLOCK_ROWS] = nearest_centroids(matrix[rows], centroids)
+            with self._conn() as conn:
+                conn.executemany("UPDATE rows SET list_id=? WHERE id=?",
+                                 zip(lists.tolist(), pairs[:, 0].tolist()))
+                self._set_meta(conn, ivf_rows=n_rows)
+            tmp_path = f"{self._centroids_path}.tmp.npy"
+            np.save(tmp_path, centroids)
+            os.replace(tmp_path, self._centroids_path)
+            self._centroids = centroids
+            self._changed()
+        elapsed = time.perf_counter() - start
+        logging.info(f"[LocalVectorStore] IVF de {nlist} listas entrenado en {elapsed:.2f}s sobre {n_rows} vectores")
+        return {"index_type": "IVF_FLAT", "nlist": nlist, "rows": n_rows, "build_time_s": round(elapsed, 3)}
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Reescribe vectors.f32 solo con las filas vivas (elimina los huecos de borrados y reemplazos).
+        """
+        with self._lock:
+            pairs = np.asarray(self._conn().execute("SELECT id, row FROM rows ORDER BY row").fetchall(), dtype=np.int64)
+            meta = self._meta()
+            matrix = self._reader()
+            tmp_path = f"{self._vectors_path}.tmp"
+            with open(tmp_path, "wb") as fh:
+                for block in range(0, len(pairs), _BLOCK_ROWS):
+                    fh.write(np.ascontiguousarray(matrix[pairs[block:block + _BLOCK_ROWS, 1]]).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._matrix = None
+            del matrix
+            os.replace(tmp_path, self._vectors_path)
+            with self._conn() as conn:
+                conn.executemany("UPDATE rows SET row=? WHERE id=?",
+                                 zip(range(len(pairs)), pairs[:, 0].tolist()))
+                self._set_meta(conn, vector_rows=len(pairs))
+            self._all_rows = None
+        return {"rows": len(pairs), "freed_rows": meta["vector_rows"] - len(pairs)}
+
+    # ------------------------------------------------------------------ Búsqueda
+    def _candidates(self, clauses: List[str], params: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        if not clauses and self._all_rows is not None:
+            return self._all_rows
+        sql = "SELECT id, row FROM rows" + (f" WHERE {' AND '.join(clauses)}" if clauses else "") + " ORDER BY row"
+        pairs = np.asarray(self._conn().execute(sql, params).fetchall(), dtype=np.int64).reshape(-1, 2)
+        candidates = (pairs[:, 0], pairs[:, 1])
+        if not clauses:
+            self._all_rows = candidates
+        return candidates
+
+    @staticmethod
+    def _scores(matrix: np.ndarray, rows: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        # (n_candidatos, n_consultas), leyendo la matriz mapeada por bloques de filas
+        scores = np.empty((len(rows), len(queries)), dtype=np.float32)
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = matrix[block] @ queries.T
+        return scores
+
+    def _entities(self, ids: List[int], clauses: Sequence[str] = (), params: Sequence[Any] = ()) -> Dict[int, Dict[str, Any]]:
+        # Columnas escalares y JSON de las filas `ids` que cumplen las cláusulas
+        names = [field.name for field in SCALAR_FIELDS]
+        entities: Dict[int, Dict[str, Any]] = {}
+        for start in range(0, len(ids), _IN_BATCH):
+            batch = ids[start:start + _IN_BATCH]
+            where = " AND ".join([f"id IN ({','.join('?' * len(batch))})", *clauses])
+            for row in self._conn().execute(
+                f"SELECT id, {', '.join(names)}, metadata FROM rows WHERE {where}", [*batch, *params]
+            ):
+                entities[row[0]] = dict(zip(names, row[1:-1]), metadata=json.loads(row[-1]))
+        return entities
+
+    def _hits(self, ids: np.ndarray, scores: np.ndarray, with_text: bool) -> List[Dict[str, Any]]:
+        id_list = ids.tolist()
+        entities = self._entities(id_list)
+        texts = self.fetch_texts(id_list) if with_text else {}
+        hits = []
+        for pk, score in zip(id_list, scores.tolist()):
+            metadata = merge_metadata(entities.get(pk, {}))
+            if pk in texts:
+                metadata["text"] = texts[pk]
+            # Métrica COSINE, como la colección de Milvus: distancia y similitud coinciden
+            hits.append({"id": pk, "distance": score, "score": score, "metadata": metadata})
+        return hits
+
+    def _top(self, ids: np.ndarray, scores: np.ndarray, top_k: int, with_text: bool) -> List[Dict[str, Any]]:
+        if len(ids) == 0:
+            return []
+        k = min(top_k, len(ids))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return self._hits(ids[best], scores[best], with_text)
+
+    def search(self, query_vectors, top_k: int = 10, filters=None, with_text: bool = False, search_params=None):
+        """
+        Busca los `top_k` vecinos (coseno) de cada consulta entre las filas que cumplen
+        `filters`. Sin IVF todas las consultas se resuelven con un único producto de matrices;
+        con IVF, `search_params={"nprobe": n}` fija cuántas listas se recorren.
+        """
+        queries = as_embedding_matrix(query_vectors, dtype="float32")
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        if self.count() == 0:
+            return [[] for _ in range(len(queries))]
+        clauses, params = build_sql_filter(filters)
+        matrix = self._reader()
+
+        if self._centroids is None:
+            ids, rows = self._candidates(clauses, params)
+            scores = self._scores(matrix, rows, queries)
+            return [self._top(ids, scores[:, q], top_k, with_text) for q in range(len(queries))]
+
+        results = []
+        nprobe = self._nprobe((search_params or {}).get("nprobe"))
+        probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :nprobe]
+        for query, lists in zip(queries, probes):
+            list_clause = f"list_id IN ({','.join('?' * len(lists))})"
+            ids, rows = self._candidates(clauses + [list_clause], params + lists.tolist())
+            results.append(self._top(ids, self._scores(matrix, rows, query[None, :])[:, 0], top_k, with_text))
+        return results
+
+    def _nprobe(self, override: Optional[int] = None) -> int:
+        nlist = int(self._centroids.shape[0])
+        if override:
+            return min(nlist, int(override))
+        if self.nprobe > 0:
+            return self.nprobe
+        # Automático, para recall@10 >= 0.9 con embeddings de 384 dimensiones: las listas
+        # tienen ~sqrt(n)/4 vectores, así que con pocas listas hay que recorrer una fracción
+        # mayor (medido: nlist/8 da 0.90 con 565 listas y 0.93-0.97 con 1264-1788)
+        fraction = 6 if nlist < 1024 else 8
+        return min(nlist, max(8, nlist // fraction))
+
+    def fetch_texts(self, ids: Sequence[int]) -> Dict[int, str]:
+        return self.text_store.get_chunks(ids) if self.text_store is not None else {}
+
+    def fetch_metadata(self, ids: Sequence[int], filters=None) -> Dict[int, Dict[str, Any]]:
+        clauses, params = build_sql_filter(filters)
+        entities = self._entities([int(pk) for pk in ids], clauses, params)
+        return {pk: merge_metadata(entity) for pk, entity in entities.items()}
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Recorre las filas por orden de id; los vectores salen normalizados, como se guardaron.
+        """
+        from src.milvus_migration import attach_stored_payload, restore_metadata
+        names = [field.name for field in SCALAR_FIELDS]
+        details_cache: Dict[str, Dict[str, Any]] = {}
+        if self.count() == 0:
+            return
+        matrix = self._reader()
+        last = -(2 ** 63)
+        while True:
+            batch = self._conn().execute(
+                f"SELECT id, row, {', '.join(names)}, metadata FROM rows WHERE id > ? ORDER BY id LIMIT ?",
+                (last, batch_size),
+            ).fetchall()
+            if not batch:
+                break
+            last = batch[-1][0]
+            ids = [row[0] for row in batch]
+            metadata = [
+                restore_metadata(merge_metadata(dict(zip(names, row[2:-1]), metadata=json.loads(row[-1]))))
+                for row in batch
+            ]
+            if self.text_store is not None:
+                attach_stored_payload(self.text_store, ids, metadata, details_cache)
+            yield np.asarray(matrix[[row[1] for row in batch]], dtype=np.float32), metadata
+
+    def _text_store(self) -> Optional[TextStore]:
+        return self.text_store
+
+    def stats(self) -> Dict[str, Any]:
+        meta = self._meta()
+        rows = self.count()
+        return {
+            "collection": self.collection_name,
+            "path": self.path,
+            "rows": rows,
+            "dim": meta["dim"],
+            "vector_rows": meta["vector_rows"],
+            "dead_rows": meta["vector_rows"] - rows,
+            "ivf_lists": int(self._centroids.shape[0]) if self._centroids is not None else 0,
+            "vectors_mb": round(os.path.getsize(self._vectors_path) / 1e6, 2) if os.path.exists(self._vectors_path) else 0.0,
+        }
+
+
+_stores: Dict[Tuple[str, str], VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(backend: str = VECTOR_STORE_BACKEND, collection_name: str = MILVUS_COLLECTION) -> VectorStore:
+    """
+    Almacén de vectores configurado (una instancia por backend y colección).
+    """
+    with _stores_lock:
+        key = (backend, collection_name)
+        if key not in _stores:
+            if backend == "milvus":
+                from src.indexer_agent import indexer
+                # La instancia global del IndexerAgent se reutiliza para su colección
+                agent = indexer if indexer.collection_name == collection_name else None
+                _stores[key] = MilvusVectorStore(collection_name, agent=agent)
+            elif backend == "local":
+                _stores[key] = LocalVectorStore(collection_name)
+            else:
+                raise ValueError(f"Backend de vectores desconocido: '{backend}' (usa 'milvus' o 'local').")
+        return _stores[key]
+
+
+def _record_analytics(store: VectorStore, metadata: List[Dict[str, Any]]) -> None:
+    # El índice analítico es auxiliar: un fallo no debe interrumpir la ingesta
+    from src.analytics_store import get_analytics_store
+    try:
+        analytics = get_analytics_store(store.collection_name)
+        if analytics is not None:
+            analytics.put_documents(metadata)
+    except Exception as e:
+        logging.warning(f"[AnalyticsStore] No se pudo actualizar el índice analítico: {e}")
+
+
+def _record_export(writer: Optional[Any], embeddings: Any, metadata: List[Dict[str, Any]]) -> None:
+    # La exportación a Parquet (EXPORT_ON_INGEST) tampoco debe interrumpir la ingesta
+    if writer is None:
+        return
+    try:
+        writer.write(embeddings, metadata)
+    except Exception as e:
+        logging.warning(f"[CorpusExport] No se pudo exportar la tanda: {e}")
+
+
+def _close_export(writer: Optional[Any]) -> None:
+    if writer is None:
+        return
+    try:
+        writer.close()
+    except Exception as e:
+        logging.warning(f"[CorpusExport] No se pudo cerrar la exportación: {e}")
+
+
+def run_indexer(state: DocState) -> Dict[str, Any]:
+    """
+    Toma state['embeddings'] y sus metadatos y los inserta en el almacén de vectores
+    configurado (VECTOR_STORE_BACKEND).
+    Los metadatos son state['chunk_metadatos'] (uno por fragmento, generados por el
+    VectorizerAgent); si no existen se usa state['metadatos'] (uno por documento).
+    """
+    embeddings = state.get("embeddings")
+    metadata = state.get("chunk_metadatos") or state.get("metadatos", [])
+
+    if embeddings is None or len(embeddings) == 0 or not metadata:
+        raise ValueError("Faltan embeddings o metadatos en el estado para indexar.")
+
+    store = get_vector_store()
+    result = store.insert(embeddings, metadata)
+    _record_analytics(store, metadata)
+    exporter = open_ingest_writer(store.collection_name)
+    _record_export(exporter, embeddings, metadata)
+    _close_export(exporter)
+    # Solo se devuelve el campo nuevo: devolver el estado completo haría que el reducer
+    # de 'embeddings' volviera a concatenar la matriz consigo misma
+    return {"index_result": result}
+
+
+def run_vectorize_and_index(state: DocState) -> Dict[str, Any]:
+    """
+    Alternativa a VectorizerAgent + IndexerAgent (INDEX_STREAMING=true): vectoriza
+    state['documents'] por tandas y envía cada tanda al almacén en cuanto está lista, así
+    que la inserción se solapa con la codificación y ni los embeddings ni los metadatos
+    por fragmento se acumulan en el estado.
+    """
+    from src.vectorizer_agent import vectorizer, attach_document_metadata
+
+    docs = state.get("documents", [])
+    if not docs:
+        logging.warning("[IndexerAgent] No hay documentos en el estado para vectorizar e indexar")
+        return {}
+    metadatos_docs = state.get("metadatos", [])
+
+    store = get_vector_store()
+    exporter = open_ingest_writer(store.collection_name)
+
+    def batches():
+        for matriz, metadatos in vectorizer.iter_embeddings(docs):
+            attach_document_metadata(metadatos, metadatos_docs)
+            yield matriz, metadatos
+            # Cuando el almacén pide la siguiente tanda, la anterior ya está enviada
+            _record_analytics(store, metadatos)
+            _record_export(exporter, matriz, metadatos)
+
+    try:
+        result = store.insert_stream(batches())
+    finally:
+        _close_export(exporter)
+    return {"index_result": result}
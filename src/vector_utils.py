@@ -0,0 +1,271 @@
+"""
+Utilidades para manejar los embeddings como matrices NumPy contiguas.
+
+El pipeline transporta los vectores como una única matriz (n, dim) de float32 (o float16)
+en lugar de List[List[float]], y los lotes muy grandes se vuelcan a un fichero mapeado en
+memoria para no tenerlos enteros en RAM.
+"""
+import os
+import tempfile
+from typing import Any, List, Optional, Union
+
+import numpy as np
+
+SUPPORTED_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def resolve_dtype(name: Union[str, np.dtype, type]) -> np.dtype:
+    if isinstance(name, str):
+        if name not in SUPPORTED_DTYPES:
+            raise ValueError(f"Tipo de embedding no soportado: '{name}' (usa {list(SUPPORTED_DTYPES)}).")
+        return np.dtype(SUPPORTED_DTYPES[name])
+    return np.dtype(name)
+
+
+def as_embedding_matrix(data: Any, dtype: Optional[Union[str, np.dtype]] = None) -> np.ndarray:
+    """
+    Convierte `data` (matriz NumPy, memmap o lista de vectores) en una matriz 2D contigua.
+    Si ya es una matriz del tipo pedido no se copia.
+    """
+    if isinstance(data, np.ndarray):
+        matrix = data
+    elif data is None or len(data) == 0:
+        return np.zeros((0, 0), dtype=resolve_dtype(dtype or "float32"))
+    else:
+        matrix = np.asarray(data, dtype=resolve_dtype(dtype or "float32"))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    if dtype is not None and matrix.dtype != resolve_dtype(dtype):
+        matrix = matrix.astype(resolve_dtype(dtype))
+    if not matrix.flags["C_CONTIGUOUS"]:
+        matrix = np.ascontiguousarray(matrix)
+    return matrix
+
+
+def validate_embeddings(matrix: np.ndarray, expected_rows: Optional[int] = None) -> int:
+    """
+    Validación vectorizada: matriz 2D no vacía, sin NaN/inf y con las filas esperadas.
+    Devuelve la dimensión de los vectores.
+    """
+    if not isinstance(matrix, np.ndarray) or matrix.ndim != 2:
+        raise ValueError("Se esperaba una matriz 2D de embeddings (n_vectores, dimensión).")
+    if matrix.shape[0] == 0 or matrix.shape[1] == 0:
+        raise ValueError("Se esperaba una matriz de embeddings no vacía.")
+    if expected_rows is not None and matrix.shape[0] != expected_rows:
+        raise ValueError(
+            f"La matriz tiene {matrix.shape[0]} embeddings pero se esperaban {expected_rows}."
+        )
+    finite = np.isfinite(matrix).all(axis=1)
+    if not finite.all():
+        bad = int(np.flatnonzero(~finite)[0])
+        raise ValueError(f"El embedding en índice {bad} contiene valores NaN o infinitos.")
+    return int(matrix.shape[1])
+
+
+class MatrixAccumulator:
+    """
+    Acumula lotes de filas y devuelve una única matriz al final.
+    Mientras el total no supera `memmap_rows` los lotes se guardan en memoria y se
+    concatenan una sola vez; por encima, se escriben en un fichero temporal y el
+    resultado es un np.memmap de solo lectura sobre él.
+    """
+    def __init__(self, dtype: Union[str, np.dtype] = "float32", memmap_rows: int = 0, tmp_dir: Optional[str] = None):
+        self.dtype = resolve_dtype(dtype)
+        self.memmap_rows = memmap_rows
+        self.tmp_dir = tmp_dir
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self._parts: List[np.ndarray] = []
+        self._file = None
+        self.path: Optional[str] = None
+
+    def append(self, batch: np.ndarray) -> None:
+        batch = np.ascontiguousarray(batch, dtype=self.dtype)
+        if batch.shape[0] == 0:
+            return
+        if self.dim is None:
+            self.dim = int(batch.shape[1])
+        elif batch.shape[1] != self.dim:
+            raise ValueError(f"Dimensión {batch.shape[1]} no coincide con la de los lotes anteriores ({self.dim}).")
+        self.rows += batch.shape[0]
+        if self._file is None and self.memmap_rows and self.rows > self.memmap_rows:
+            self._spill()
+        if self._file is not None:
+            self._file.write(batch.tobytes())
+        else:
+            self._parts.append(batch)
+
+    def _spill(self) -> None:
+        if self.tmp_dir:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="embeddings-", suffix=".bin", dir=self.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        for part in self._parts:
+            self._file.write(part.tobytes())
+        self._parts = []
+
+    def finish(self) -> np.ndarray:
+        if self.dim is None:
+            return np.zeros((0, 0), dtype=self.dtype)
+        if self._file is None:
+            return self._parts[0] if len(self._parts) == 1 else np.concatenate(self._parts)
+        self._file.close()
+        self._file = None
+        matrix = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+        try:
+            # En POSIX el mapeo sigue siendo válido y el espacio se libera al soltar la matriz
+            os.remove(self.path)
+        except OSError:
+            pass
+        return matrix
+
+
+# --------------------------------------------------------------------
+# Representaciones reducidas para almacenar los vectores en Milvus
+# --------------------------------------------------------------------
+
+def to_float16(matrix: np.ndarray) -> np.ndarray:
+    """
+    Matriz float16 (FLOAT16_VECTOR de Milvus).
+    """
+    return np.ascontiguousarray(matrix, dtype=np.float16)
+
+
+def to_bfloat16_bits(matrix: np.ndarray) -> np.ndarray:
+    """
+    Convierte a bfloat16 con redondeo al par más cercano y devuelve los 16 bits
+    de cada valor como uint16 (NumPy no tiene un dtype bfloat16 nativo).
+    bfloat16 conserva el rango de float32 y reduce la mantisa a 7 bits.
+    """
+    bits = np.ascontiguousarray(matrix, dtype=np.float32).view(np.uint32)
+    rounding = ((bits >> 16) & 1) + np.uint32(0x7FFF)
+    return ((bits + rounding) >> 16).astype(np.uint16)
+
+
+def to_bfloat16_array(matrix: np.ndarray) -> np.ndarray:
+    """
+    Matriz con dtype bfloat16 de ml_dtypes (el tipo que pymilvus reconoce como
+    BFLOAT16_VECTOR en las consultas). Los bits son los de to_bfloat16_bits.
+    """
+    try:
+        import ml_dtypes
+    except ImportError as e:
+        raise ImportError("Buscar en colecciones bfloat16 requiere ml_dtypes (pip install ml_dtypes).") from e
+    return to_bfloat16_bits(matrix).view(ml_dtypes.bfloat16)
+
+
+def from_bfloat16_bits(bits: np.ndarray) -> np.ndarray:
+    """
+    Operación inversa de to_bfloat16_bits: de uint16 a float32.
+    """
+    return (np.asarray(bits, dtype=np.uint16).astype(np.uint32) << 16).view(np.float32)
+
+
+def binarize(matrix: np.ndarray) -> np.ndarray:
+    """
+    Cuantización binaria: un bit por dimensión (1 si el valor es positivo), empaquetado
+    en bytes (BINARY_VECTOR de Milvus, dim/8 bytes por vector). La distancia de Hamming
+    entre códigos aproxima el ángulo entre los vectores originales.
+    """
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+def hamming_distances(queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Distancias de Hamming (n_consultas, n_códigos) entre códigos empaquetados con binarize.
+    """
+    xor = np.bitwise_xor(queries[:, None, :], codes[None, :, :])
+    return np.unpackbits(xor, axis=2).sum(axis=2)
+
+
+class PCAProjector:
+    """
+    Reducción de dimensión por PCA ajustada sobre el propio corpus.
+    Los vectores proyectados se vuelven a normalizar, así que la distancia L2 entre ellos
+    sigue ordenando como el coseno. Se guarda en un .npz para proyectar con la misma base
+    los lotes posteriores y las consultas.
+    """
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance_ratio: float = 0.0):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained_variance_ratio = float(explained_variance_ratio)
+
+    @property
+    def input_dim(self) -> int:
+        return int(self.components.shape[1])
+
+    @property
+    def output_dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, n_components: int, max_rows: int = 50_000, seed: int = 0) -> "PCAProjector":
+        """
+        Ajusta la PCA con (como máximo) `max_rows` filas elegidas al azar.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape[0] < n_components:
+            raise ValueError(
+                f"Se necesitan al menos {n_components} vectores para ajustar una PCA de {n_components} "
+                f"dimensiones (hay {matrix.shape[0]})."
+            )
+        if n_components >= matrix.shape[1]:
+            raise ValueError(f"La dimensión reducida ({n_components}) debe ser menor que la original ({matrix.shape[1]}).")
+        if matrix.shape[0] > max_rows:
+            rows = np.random.default_rng(seed).choice(matrix.shape[0], max_rows, replace=False)
+            matrix = matrix[rows]
+        mean = matrix.mean(axis=0)
+        _, singular, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        variance = singular ** 2
+        ratio = variance[:n_components].sum() / max(variance.sum(), 1e-12)
+        return cls(mean, vt[:n_components], ratio)
+
+    def transform(self, matrix: np.ndarray) -> np.ndarray:
+        projected = (np.asarray(matrix, dtype=np.float32) - self.mean) @ self.components.T
+        projected /= np.clip(np.linalg.norm(projected, axis=1, keepdims=True), 1e-12, None)
+        return np.ascontiguousarray(projected, dtype=np.float32)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, mean=self.mean, components=self.components,
+                 explained_variance_ratio=np.float32(self.explained_variance_ratio))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAProjector":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], float(data["explained_variance_ratio"]))
+
+
+def spherical_kmeans(matrix: np.ndarray, k: int, iterations: int = 10, seed: int = 0,
+                     block_rows: int = 65536) -> np.ndarray:
+    """
+    K-means sobre vectores normalizados con similitud coseno: devuelve `k` centroides
+    normalizados (k, dim). Los grupos que se quedan vacíos se reinician con un vector al azar.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.shape[0] < k:
+        raise ValueError(f"Se necesitan al menos {k} vectores para {k} centroides (hay {matrix.shape[0]}).")
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(matrix.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(matrix, centroids, block_rows=block_rows)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, matrix)
+        empty = np.flatnonzero(np.bincount(assignment, minlength=k) == 0)
+        if len(empty):
+            sums[empty] = matrix[rng.choice(matrix.shape[0], len(empty), replace=False)]
+        centroids = sums / np.clip(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12, None)
+    return centroids.astype(np.float32)
+
+
+def nearest_centroids(matrix: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """
+    Índice del centroide más parecido (producto escalar) a cada fila, por bloques de filas.
+    """
+    assignment = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        assignment[start:start + block_rows] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
@@ -1,8 +1,33 @@
+import hashlib
 import logging
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
+import time
+from collections.abc import Mapping
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
 from src.state import DocState
-from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, connections, utility
+from src.chunker import iter_chunks, validate_chunking
+from src.embedding_cache import EmbeddingCache
+from src.embedding_pool import EmbeddingPool
+from src.model_registry import registry, register_embedding_model
+from src.vector_utils import MatrixAccumulator
+from src.settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    CHUNKING_ENABLED,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    EMBEDDING_STREAM_BATCH,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_ROWS,
+    EMBEDDING_WORKERS,
+    EMBEDDING_POOL_CHUNK,
+    EMBEDDING_POOL_MIN_TEXTS,
+    EMBEDDING_DTYPE,
+    EMBEDDING_MEMMAP_ROWS,
+    EMBEDDING_MEMMAP_DIR,
+)
 import json
 
 # --------------------------------------------------------------------
@@ -13,10 +38,50 @@ class VectorizerAgent:
     """
     Agente para generar embeddings usando SentenceTransformer("all-MiniLM-L6-v2").
     Ahora extrae solo el campo 'text' de cada documento y conserva doc['metadata'] aparte.
+    El modelo se obtiene del registro compartido y solo se carga al generar el primer embedding;
+    según EMBEDDING_BACKEND es el SentenceTransformer de PyTorch o su versión ONNX int8.
+    Cada documento se divide en fragmentos solapados (ver src/chunker.py) y se genera
+    un vector por fragmento, enlazado con su documento padre mediante 'doc_id'.
     """
-    def __init__(self):
+    def __init__(self,
+                 model_name: str = EMBEDDING_MODEL,
+                 backend: str = EMBEDDING_BACKEND,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 chunking: bool = CHUNKING_ENABLED,
+                 chunk_max_tokens: int = CHUNK_MAX_TOKENS,
+                 chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+                 stream_batch: int = EMBEDDING_STREAM_BATCH,
+                 use_cache: bool = EMBEDDING_CACHE_ENABLED,
+                 workers: int = EMBEDDING_WORKERS,
+                 dtype: str = EMBEDDING_DTYPE):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.chunking = chunking
+        if chunking and chunk_max_tokens:
+            validate_chunking(chunk_max_tokens, chunk_overlap)
+        self.chunk_max_tokens = chunk_max_tokens
+        self.chunk_overlap = chunk_overlap
+        self.stream_batch = stream_batch
+        self.use_cache = use_cache
+        self.dtype = dtype
+        self._cache: Optional[EmbeddingCache] = None
+        self.last_stats: Dict[str, Any] = {}
+        # Pool de procesos para corpus grandes; con menos de EMBEDDING_POOL_MIN_TEXTS textos
+        # se sigue codificando en el propio proceso
+        self.pool: Optional[EmbeddingPool] = None
+        if workers > 1:
+            self.pool = EmbeddingPool(model_name, backend, workers,
+                                      chunk_size=EMBEDDING_POOL_CHUNK, min_texts=EMBEDDING_POOL_MIN_TEXTS)
+            # Las tandas deben ser lo bastante grandes para que el pool llegue a usarse
+            self.stream_batch = max(self.stream_batch, EMBEDDING_POOL_MIN_TEXTS)
+        # Nombre en el registro según el backend ("onnx-int8:<modelo>" con ONNX Runtime cuantizado)
+        self.model_key = register_embedding_model(model_name, backend)
+
+    @property
+    def _model(self):
         try:
-            self._model = SentenceTransformer("all-MiniLM-L6-v2")
+            return registry.get(self.model_key)
         except Exception as e:
             logging.error(f"Error al cargar SentenceTransformer: {e}")
             raise RuntimeError(f"No se pudo cargar el modelo de embeddings: {e}")
@@ -25,73 +90,289 @@ class VectorizerAgent:
         # Devuelve un vector normalizado en forma de lista de floats
         return self._model.encode(text, convert_to_numpy=True, normalize_embeddings=True).tolist()
 
-    def run(self, docs: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    @property
+    def cache(self) -> Optional[EmbeddingCache]:
+        """
+        Caché de embeddings en disco del modelo (se abre en el primer uso).
+        """
+        if self.use_cache and self._cache is None:
+            # Se separa por backend y cuantización: los vectores int8 de ONNX no son idénticos
+            # a los fp32 (ni a los de torch)
+            self._cache = EmbeddingCache(EMBEDDING_CACHE_DIR, self.model_key, max_rows=EMBEDDING_CACHE_MAX_ROWS)
+        return self._cache
+
+    def _count_tokens(self, texts: List[str]) -> int:
+        """
+        Número de word pieces que procesa realmente el modelo (tras truncar a max_seq_length).
+        Si el modelo no expone tokenizador, aproxima con el número de palabras.
+        """
+        model = self._model
+        tokenizer = getattr(model, "tokenizer", None)
+        if tokenizer is None:
+            return sum(len(t.split()) for t in texts)
+        max_length = getattr(model, "max_seq_length", None)
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=max_length is not None, max_length=max_length)
+        return sum(len(ids) for ids in encoded["input_ids"])
+
+    def embed_batch(self,
+                    texts: List[str],
+                    batch_size: Optional[int] = None,
+                    doc_indices: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Codifica todos los textos en una sola llamada al modelo, que los agrupa en lotes
+        de `batch_size` y los ordena por longitud internamente. Si hay pool de procesos y la
+        entrada es grande, los textos se reparten entre los trabajadores.
+        Devuelve una matriz float32 contigua de forma (len(texts), dim) con vectores normalizados.
+        Si el lote falla, vuelve a codificar texto a texto para indicar qué documento lo provoca
+        (`doc_indices` traduce la posición de cada texto al índice de su documento).
+        """
+        batch_size = batch_size or self.batch_size
+        if not texts:
+            return np.zeros((0, self._model.get_sentence_embedding_dimension()), dtype=np.float32)
+        start = time.perf_counter()
+        try:
+            if self.pool is not None and self.pool.should_use(len(texts)):
+                matrix = self.pool.encode(texts, batch_size=batch_size)
+            else:
+                matrix = self._model.encode(
+                    texts,
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+        except Exception as e:
+            logging.warning(f"[VectorizerAgent] Falló la codificación por lotes ({e}); reintentando documento a documento")
+            rows = []
+            for pos, text in enumerate(texts):
+                try:
+                    rows.append(self._embed_text(text))
+                except Exception as doc_error:
+                    idx = doc_indices[pos] if doc_indices is not None else pos
+                    logging.error(f"[VectorizerAgent] Error al generar embedding para el documento {idx}: {doc_error}")
+                    raise RuntimeError(f"Error al generar embedding para el documento {idx}: {doc_error}")
+            matrix = np.asarray(rows)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+
+        n_tokens = self._count_tokens(texts)
+        self.last_stats = {
+            "texts": len(texts),
+            "tokens": n_tokens,
+            "batch_size": batch_size,
+            "workers": self.pool.workers if self.pool is not None and self.pool.should_use(len(texts)) else 1,
+            "elapsed_s": round(elapsed, 4),
+            "texts_per_s": round(len(texts) / elapsed, 2),
+            "tokens_per_s": round(n_tokens / elapsed, 2),
+        }
+        logging.info(
+            f"[VectorizerAgent] {len(texts)} textos codificados en {elapsed:.2f}s "
+            f"({self.last_stats['texts_per_s']} textos/s, {self.last_stats['tokens_per_s']} tokens/s)"
+        )
+        return matrix
+
+    def embed_texts(self, texts: List[str], doc_indices: Optional[List[int]] = None) -> np.ndarray:
+        """
+        Igual que embed_batch, pero consultando antes la caché en disco: solo los textos
+        que no están en caché se envían al modelo, y sus vectores se guardan después.
+        """
+        cache = self.cache
+        if cache is None or not texts:
+            return self.embed_batch(texts, doc_indices=doc_indices)
+
+        hits, missing = cache.get_many(texts)
+        if not missing:
+            dim = len(next(iter(hits.values())))
+            matrix = np.empty((len(texts), dim), dtype=np.float32)
+            for pos, vec in hits.items():
+                matrix[pos] = vec
+            self.last_stats = {"texts": 0, "tokens": 0, "elapsed_s": 0.0, "cache_hits": len(hits)}
+            logging.info(f"[VectorizerAgent] {len(texts)} textos servidos desde la caché de embeddings")
+            return matrix
+
+        missing_texts = [texts[pos] for pos in missing]
+        missing_owners = [doc_indices[pos] for pos in missing] if doc_indices is not None else missing
+        encoded = self.embed_batch(missing_texts, doc_indices=missing_owners)
+        cache.put_many(missing_texts, encoded)
+
+        matrix = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        matrix[missing] = encoded
+        for pos, vec in hits.items():
+            matrix[pos] = vec
+        self.last_stats["cache_hits"] = len(hits)
+        if hits:
+            logging.info(f"[VectorizerAgent] Caché de embeddings: {len(hits)} aciertos, {len(missing)} codificados")
+        return matrix
+
+    def _chunk_token_limit(self) -> int:
+        """
+        Tokens por fragmento: el valor configurado o el máximo del modelo menos [CLS]/[SEP].
+        """
+        if self.chunk_max_tokens:
+            return self.chunk_max_tokens
+        return max(getattr(self._model, "max_seq_length", 256) - 2, 16)
+
+    @staticmethod
+    def _extract_text(idx: int, entry: Any) -> str:
+        if not isinstance(entry, Mapping):
+            logging.error(f"[VectorizerAgent] Elemento no es dict (índice {idx}): {entry}")
+            raise TypeError(f"Elemento {idx} de la lista no es un dict con 'text' y 'metadata'.")
+
+        # Intentar obtener el texto del documento
+        texto = ""
+        if "text" in entry:
+            texto = entry["text"]
+        elif "content" in entry:
+            texto = entry["content"]
+        elif "summary" in entry:
+            texto = entry["summary"]
+
+        if not texto:
+            logging.error(f"[VectorizerAgent] No se encontró texto para procesar en el documento {idx}")
+            raise ValueError(f"Documento {idx} no tiene texto para procesar")
+        return texto
+
+    @staticmethod
+    def _doc_id(entry: Dict[str, Any], texto: str) -> str:
+        # Mismo hash SHA256 que calcula MetadataAgent
+        doc_hash = (entry.get("metadata") or {}).get("hash") or entry.get("doc_id")
+        return doc_hash or hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+    def iter_embeddings(self, docs: List[Dict[str, Any]]) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Genera (matriz, metadatos) por tandas de como máximo `stream_batch` fragmentos.
+        Los fragmentos se crean y codifican sobre la marcha, así que en memoria solo hay
+        una tanda de textos de fragmento a la vez.
+        Cada metadato lleva los campos del documento (sin su texto completo) más:
+          doc_id, chunk_index, char_start, char_end, section, chunk_token_count y el
+          'text' del propio fragmento.
+        """
+        textos = [self._extract_text(idx, entry) for idx, entry in enumerate(docs)]
+        doc_ids = [self._doc_id(entry, texto) for entry, texto in zip(docs, textos)]
+        for idx, (entry, texto) in enumerate(zip(docs, textos)):
+            logging.info(f"[VectorizerAgent] Documento {idx} - Longitud del texto: {len(texto)}")
+            logging.info(f"[VectorizerAgent] Documento {idx} - Campos disponibles: {list(entry.keys())}")
+
+        tokenizer = getattr(self._model, "tokenizer", None) if self.chunking else None
+        chunks = iter_chunks(
+            textos,
+            tokenizer=tokenizer,
+            max_tokens=self._chunk_token_limit() if self.chunking else 0,
+            overlap=self.chunk_overlap,
+            chunking=self.chunking,
+        )
+
+        buffer: List[Dict[str, Any]] = []
+        for chunk in chunks:
+            buffer.append(chunk)
+            if len(buffer) >= self.stream_batch:
+                yield self._embed_chunks(buffer, docs, doc_ids)
+                buffer = []
+        if buffer:
+            yield self._embed_chunks(buffer, docs, doc_ids)
+
+    def _embed_chunks(self,
+                      chunks: List[Dict[str, Any]],
+                      docs: List[Dict[str, Any]],
+                      doc_ids: List[str]) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        doc_indices = [c["doc_index"] for c in chunks]
+        matriz = self.embed_texts([c["text"] for c in chunks], doc_indices=doc_indices)
+        metadatos = []
+        for chunk in chunks:
+            entry = docs[chunk["doc_index"]]
+            meta = {k: v for k, v in entry.items() if k not in ("text", "content")}
+            meta.update({
+                "doc_id": doc_ids[chunk["doc_index"]],
+                "doc_index": chunk["doc_index"],
+                "chunk_index": chunk["chunk_index"],
+                "char_start": chunk["char_start"],
+                "char_end": chunk["char_end"],
+                "section": chunk["section"],
+                "chunk_token_count": chunk["token_count"],
+                "text": chunk["text"],
+            })
+            metadatos.append(meta)
+        return matriz, metadatos
+
+    def run(self, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         docs: lista de diccionarios, cada uno con al menos:
             { "text": <string>, "metadata": <dict con todos sus campos> }
-        Retorna un dict con dos listas paralelas:
+        Retorna un dict con un elemento por fragmento:
             {
-              "embeddings": [[...], [...], ...],
+              "embeddings": np.ndarray de forma (n_fragmentos, dim) en EMBEDDING_DTYPE,
               "metadatos":  [{...}, {...}, ...]
             }
+        junto con "stats" (rendimiento de la codificación por lotes).
+        Con más de EMBEDDING_MEMMAP_ROWS fragmentos la matriz es un np.memmap de solo lectura.
         """
         if not isinstance(docs, list):
             logging.error(f"Se esperaba una lista de documentos, se recibió: {type(docs)}")
             raise TypeError(f"Se esperaba una lista de documentos, se recibió: {type(docs)}")
         if not docs:
             logging.warning("Lista de documentos vacía, no hay vectores que generar.")
-            return {"embeddings": [], "metadatos": []}
+            return {"embeddings": np.zeros((0, 0), dtype=np.float32), "metadatos": [], "stats": {}}
 
         logging.info(f"[VectorizerAgent] Procesando {len(docs)} documentos")
-        lista_embeddings: List[List[float]] = []
-        lista_metadatos:  List[Dict[str, Any]] = []
-
-        for idx, entry in enumerate(docs):
-            logging.info(f"[VectorizerAgent] Procesando documento {idx}")
-            if not isinstance(entry, dict):
-                logging.error(f"[VectorizerAgent] Elemento no es dict (índice {idx}): {entry}")
-                raise TypeError(f"Elemento {idx} de la lista no es un dict con 'text' y 'metadata'.")
-            
-            # Intentar obtener el texto del documento
-            texto = ""
-            if "text" in entry:
-                texto = entry["text"]
-            elif "content" in entry:
-                texto = entry["content"]
-            elif "summary" in entry:
-                texto = entry["summary"]
-            
-            if not texto:
-                logging.error(f"[VectorizerAgent] No se encontró texto para procesar en el documento {idx}")
-                raise ValueError(f"Documento {idx} no tiene texto para procesar")
-            
-            metadato_completo = entry
+        # Las tandas se copian una sola vez en la matriz final (o en el fichero mapeado)
+        acumulador = MatrixAccumulator(self.dtype, EMBEDDING_MEMMAP_ROWS, EMBEDDING_MEMMAP_DIR or None)
+        lista_metadatos: List[Dict[str, Any]] = []
+        totals = {"texts": 0, "tokens": 0, "elapsed_s": 0.0, "cache_hits": 0}
 
-            logging.info(f"[VectorizerAgent] Documento {idx} - Longitud del texto: {len(texto)}")
-            logging.info(f"[VectorizerAgent] Documento {idx} - Campos disponibles: {list(entry.keys())}")
+        for matriz, metadatos in self.iter_embeddings(docs):
+            acumulador.append(matriz)
+            lista_metadatos.extend(metadatos)
+            for key in totals:
+                totals[key] += self.last_stats.get(key, 0)
 
-            try:
-                vec = self._embed_text(texto)
-                lista_embeddings.append(vec)
-                lista_metadatos.append(metadato_completo)
-                logging.info(f"[VectorizerAgent] Documento {idx} procesado exitosamente")
-            except Exception as e:
-                logging.error(f"[VectorizerAgent] Error al generar embedding para el documento {idx}: {e}")
-                raise RuntimeError(f"Error al generar embedding para el documento {idx}: {e}")
+        matriz_embeddings = acumulador.finish()
+        elapsed = max(totals["elapsed_s"], 1e-9)
+        chunks_total = len(lista_metadatos)
+        stats = {
+            "documents": len(docs),
+            "chunks": chunks_total,
+            "encoded": totals["texts"],
+            "cache_hits": totals["cache_hits"],
+            "tokens": totals["tokens"],
+            "batch_size": self.batch_size,
+            "elapsed_s": round(elapsed, 4),
+            "texts_per_s": round(totals["texts"] / elapsed, 2),
+            "tokens_per_s": round(totals["tokens"] / elapsed, 2),
+            "dtype": str(matriz_embeddings.dtype),
+            "matrix_mb": round(matriz_embeddings.nbytes / 1e6, 2),
+            "memmap": isinstance(matriz_embeddings, np.memmap),
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
 
-        logging.info(f"[VectorizerAgent] Procesamiento completado. Generados {len(lista_embeddings)} vectores")
-        return {"embeddings": lista_embeddings, "metadatos": lista_metadatos}
+        logging.info(f"[VectorizerAgent] Procesamiento completado. Generados {len(matriz_embeddings)} vectores "
+                     f"para {len(docs)} documentos")
+        return {"embeddings": matriz_embeddings, "metadatos": lista_metadatos, "stats": stats}
 
 
-# Instancia global para no recargar el modelo en cada llamada
+# Instancia global; el modelo vive en el registro compartido y se carga en el primer uso
 vectorizer = VectorizerAgent()
 
-def run_vectorizer(state: DocState) -> DocState:
+def attach_document_metadata(chunk_metadatos: List[Dict[str, Any]],
+                             metadatos_docs: List[Dict[str, Any]]) -> None:
+    """
+    Enlaza cada fragmento con los metadatos de enriquecimiento de su documento
+    (state['metadatos'][doc_index]) bajo la clave 'metadatos'.
+    """
+    for meta in chunk_metadatos:
+        doc_index = meta["doc_index"]
+        if doc_index < len(metadatos_docs) and metadatos_docs[doc_index]:
+            meta["metadatos"] = metadatos_docs[doc_index]
+
+
+def run_vectorizer(state: DocState) -> Dict[str, Any]:
     """
     Lee state['documents'] (lista de dicts con el texto y metadatos), 
-    genera embeddings y guarda en el estado:
-      - 'embeddings': lista de vectores
-      - 'metadatos': lista de dicts con todos los metadatos originales
+    genera embeddings (uno por fragmento) y guarda en el estado:
+      - 'embeddings': matriz NumPy (n_fragmentos, dim), sin convertir a listas de floats
+      - 'chunk_metadatos': un dict por vector con los metadatos del documento padre
+        (incluidos los de state['metadatos'] de los agentes de enriquecimiento) y los
+        datos del fragmento (doc_id, chunk_index, offsets, sección y texto)
     """
     # Obtener los documentos del estado
     docs = state.get("documents", [])
@@ -101,7 +382,7 @@ def run_vectorizer(state: DocState) -> DocState:
     
     if not docs:
         logging.warning("[VectorizerAgent] No hay documentos en el estado para procesar")
-        return state
+        return {}
     
     # Log del primer documento para verificar su estructura
     if docs:
@@ -114,33 +395,14 @@ def run_vectorizer(state: DocState) -> DocState:
             logging.info(f"[VectorizerAgent] Longitud del resumen del primer documento: {len(docs[0]['summary'])}")
         
     resultado = vectorizer.run(docs)
-    state["embeddings"] = resultado["embeddings"]
-    state["metadatos"] = resultado["metadatos"]
+    attach_document_metadata(resultado["metadatos"], state.get("metadatos", []))
     
     logging.info(f"[VectorizerAgent] Procesamiento completado:")
     logging.info(f"[VectorizerAgent] - Número de embeddings generados: {len(resultado['embeddings'])}")
-    logging.info(f"[VectorizerAgent] - Número de metadatos procesados: {len(resultado['metadatos'])}")
+    logging.info(f"[VectorizerAgent] - Número de fragmentos procesados: {len(resultado['metadatos'])}")
+    logging.info(f"[VectorizerAgent] - Rendimiento: {resultado['stats']}")
     
     logging.info(f"Ejemplo de metadato a insertar: {json.dumps(resultado['metadatos'][0], indent=2, ensure_ascii=False)}")
     
-    return state
-
-connections.connect(alias="default", host="localhost", port="19530")
-
-collection_name = "documentos_legales_v2"
-
-if collection_name not in utility.list_collections():
-    fields = [
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=384),
-        FieldSchema(name="metadata", dtype=DataType.JSON)
-    ]
-    schema = CollectionSchema(fields, description="Colección de embeddings y metadatos")
-    c = Collection(name=collection_name, schema=schema)
-    print("Colección creada")
-else:
-    c = Collection(collection_name)
-    print("Colección ya existe")
-
-print("Número de entidades:", c.num_entities)
-
+    # Solo los campos nuevos (el reducer de 'embeddings' concatena lo que se devuelve)
+    return {"embeddings": resultado["embeddings"], "chunk_metadatos": resultado["metadatos"]}
@@ -1,7 +1,8 @@
 import os
 import streamlit as st
-from src.state import DocState
+from src.state import DocState, document_views
 from src.graph_builder import build_graph
+from src.model_registry import registry
 from typing import Dict, Any
 import numpy as np
 import json
@@ -13,6 +14,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Precarga de modelos en segundo plano (una sola vez por proceso de Streamlit)
+registry.warm_up()
+
 # Título y descripción
 st.title("🤖 Sistema de Análisis de Documentos con Agentes Inteligentes")
 st.markdown("""
@@ -33,6 +37,14 @@ with st.sidebar:
     show_structure = st.checkbox("Estructura", value=True)
     show_insights = st.checkbox("Insights", value=True)
 
+    st.markdown("---")
+    with st.expander("🧠 Modelos cargados"):
+        model_stats = registry.stats()
+        if model_stats:
+            st.json(model_stats)
+        else:
+            st.write("Ningún modelo cargado todavía.")
+
 # Área principal
 uploaded_file = st.file_uploader(
     "Selecciona un documento (PDF, DOCX, TXT)", 
@@ -68,6 +80,9 @@ if uploaded_file:
                 pipeline = build_graph()
                 status_text.text("Procesando documento...")
                 state = pipeline.invoke(state)
+                # Los agentes devuelven sus resultados en state['metadatos']; para mostrarlos
+                # se fusionan con los metadatos de carga de cada documento
+                state["documents"] = document_views(state)
                 progress_bar.progress(100)
                 
                 # Mostrar resultados
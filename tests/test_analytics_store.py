@@ -0,0 +1,42 @@
+from src.analytics_store import AnalyticsStore
+
+
+def _meta(index: int) -> dict:
+    return {
+        "doc_id": f"{index:064x}",
+        "source": f"docs/2023/doc{index}.pdf",
+        "title": f"Documento {index}",
+        "author": "María Pérez" if index % 2 else "Juan López",
+        "keywords": ["contrato"] + (["penalización"] if index < 3 else []),
+    }
+
+
+def _store(tmp_path, docs: int = 10) -> AnalyticsStore:
+    store = AnalyticsStore(str(tmp_path / "analytics.sqlite"))
+    store.put_documents([_meta(i) for i in range(docs)])
+    return store
+
+
+def test_column_facets_stay_scalar_filters(tmp_path):
+    store = _store(tmp_path)
+    filters = store.search_filters({"source_folder": "docs/2023", "author": "maria perez"}, base={"lang": "es"})
+    assert filters == {"lang": "es", "source_folder": "docs/2023", "author": ["María Pérez"]}
+
+
+def test_term_facets_expand_to_documents(tmp_path):
+    store = _store(tmp_path)
+    filters = store.search_filters({"keyword": "Penalización"})
+    assert sorted(filters["doc_hash"]) == [f"{i:064x}" for i in range(3)]
+
+
+def test_broad_facet_is_capped(tmp_path, caplog):
+    store = _store(tmp_path)
+    filters = store.search_filters({"keyword": "contrato"}, max_docs=4)
+    assert len(filters["doc_hash"]) == 4
+    assert "ANALYTICS_MAX_FILTER_DOCS" in caplog.text
+
+
+def test_no_match_skips_search(tmp_path):
+    store = _store(tmp_path)
+    assert store.search_filters({"keyword": "inexistente"}) is None
+    assert store.search_filters({"source_folder": "otra"}) is None
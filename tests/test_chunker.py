@@ -0,0 +1,24 @@
+import pytest
+
+from src.chunker import chunk_text, split_sections
+
+TEXT = "CLÁUSULA PRIMERA. Objeto del contrato. " + "palabra " * 400 + "CLÁUSULA SEGUNDA. Precio. " + "importe " * 50
+
+
+def test_heading_at_offset_zero_is_kept():
+    assert split_sections(TEXT)[0] == (0, "CLÁUSULA PRIMERA")
+    assert next(chunk_text(TEXT, max_tokens=64, overlap=8))["section"] == "CLÁUSULA PRIMERA"
+
+
+def test_chunks_cover_text_with_bounded_count():
+    chunks = list(chunk_text(TEXT, max_tokens=64, overlap=8))
+    assert chunks[0]["char_start"] == 0
+    assert chunks[-1]["char_end"] == len(TEXT.rstrip())
+    # ~500 palabras * 1.3 word pieces / (64 - 8) tokens de avance por fragmento
+    assert len(chunks) < 20
+
+
+@pytest.mark.parametrize("overlap", [64, 100, -1])
+def test_overlap_must_be_smaller_than_window(overlap):
+    with pytest.raises(ValueError):
+        chunk_text(TEXT, max_tokens=64, overlap=overlap)
@@ -0,0 +1,18 @@
+import numpy as np
+
+import src.embedding_cache as embedding_cache
+from src.embedding_cache import EmbeddingCache
+
+
+def test_compact_copies_kept_rows_in_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_BLOCK_ROWS", 3)
+    cache = EmbeddingCache(str(tmp_path), "modelo", max_rows=1000)
+    texts = [f"texto {i}" for i in range(10)]
+    matrix = np.arange(10 * 4, dtype=np.float32).reshape(10, 4)
+    cache.put_many(texts, matrix)
+
+    assert cache.compact() == {"kept": 10, "evicted": 0}
+    found, missing = cache.get_many(texts)
+    assert missing == []
+    for pos in range(10):
+        np.testing.assert_array_equal(found[pos], matrix[pos])
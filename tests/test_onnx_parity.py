@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from src.model_registry import embedding_model_key
+
+PARITY_THRESHOLD = 0.95
+
+
+def test_cache_key_depends_on_backend_and_quantization():
+    keys = {
+        embedding_model_key("all-MiniLM-L6-v2", "torch"),
+        embedding_model_key("all-MiniLM-L6-v2", "onnx", quantize=True),
+        embedding_model_key("all-MiniLM-L6-v2", "onnx", quantize=False),
+    }
+    assert len(keys) == 3
+
+
+@pytest.mark.parametrize("quantize", [True, False], ids=["int8", "fp32"])
+def test_onnx_embeddings_match_torch(quantize):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    from src.benchmarks import fixed_corpus
+    from src.model_registry import get_model, register_embedding_model
+    from src.settings import EMBEDDING_MODEL
+
+    corpus = fixed_corpus(64)
+    vectors = []
+    for backend in ("torch", "onnx"):
+        model = get_model(register_embedding_model(EMBEDDING_MODEL, backend, quantize=quantize))
+        vectors.append(np.asarray(model.encode(corpus, batch_size=16, convert_to_numpy=True,
+                                               normalize_embeddings=True, show_progress_bar=False)))
+    cosine = np.sum(vectors[0] * vectors[1], axis=1)
+    assert cosine.min() >= PARITY_THRESHOLD
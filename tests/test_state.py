@@ -0,0 +1,84 @@
+import copy
+import pickle
+import random
+
+import pytest
+
+from src.state import ENRICHMENT_FIELDS, metadata_delta, update_metadatos
+
+N_DOCS = 50
+
+
+@pytest.fixture(scope="module")
+def documents():
+    rng = random.Random(7)
+    return [
+        {"title": f"doc-{i}", "text": "".join(rng.choice("abcdefghij ") for _ in range(200)) * 50,
+         "metadata": {"source": f"tests/doc-{i}.pdf", "total_pages": 3}}
+        for i in range(N_DOCS)
+    ]
+
+
+@pytest.fixture(scope="module")
+def deltas(documents):
+    # Lo que devuelve cada agente de enriquecimiento: sus campos de cada documento
+    enriched = {
+        agent: [{"title": doc["title"], "text": doc["text"],
+                 "metadata": {**doc["metadata"], **{key: f"{agent}:{key}:{i}" for key in fields}}}
+                for i, doc in enumerate(documents)]
+        for agent, fields in ENRICHMENT_FIELDS.items()
+    }
+    return {agent: metadata_delta(docs, ENRICHMENT_FIELDS[agent]) for agent, docs in enriched.items()}
+
+
+def _base():
+    return [{"hash": f"h{i}", "token_count": 10} for i in range(N_DOCS)]
+
+
+def _merge(deltas, order):
+    merged = update_metadatos(None, _base())
+    for agent in order:
+        merged = update_metadatos(merged, deltas[agent])
+    return merged
+
+
+def test_merge_is_order_independent(deltas):
+    expected = [{**base, **{k: v for agent in ENRICHMENT_FIELDS for k, v in deltas[agent][i].items()}}
+                for i, base in enumerate(_base())]
+    rng = random.Random(3)
+    for _ in range(10):
+        order = list(ENRICHMENT_FIELDS)
+        rng.shuffle(order)
+        assert _merge(deltas, order) == expected
+
+
+def test_merge_does_not_mutate_inputs(deltas):
+    snapshot = copy.deepcopy(deltas)
+    merged = _merge(deltas, list(ENRICHMENT_FIELDS))
+    before = copy.deepcopy(merged)
+    first_doc = merged[0]
+
+    # Una rama posterior (incluida una posición nueva) no cambia lo que otra ya había leído
+    result = update_metadatos(merged, {0: {"keywords": ["otro"]}, N_DOCS: {"keywords": ["nuevo"]}})
+
+    assert merged == before
+    assert len(merged) == N_DOCS
+    assert merged[0] is first_doc
+    assert result is not merged
+    assert result[0]["keywords"] == ["otro"] and result[N_DOCS] == {"keywords": ["nuevo"]}
+    assert deltas == snapshot
+
+
+def test_delta_defaults_are_not_shared():
+    delta = metadata_delta([{"metadata": {}}, {"metadata": {}}], ENRICHMENT_FIELDS["KeywordAgent"])
+    delta[0]["keywords"].append("x")
+    assert delta[1]["keywords"] == []
+    assert ENRICHMENT_FIELDS["KeywordAgent"]["keywords"] == []
+
+
+def test_deltas_are_much_smaller_than_the_full_state(documents, deltas):
+    full_state = {"documents": documents, "source_stats": {"documents": N_DOCS},
+                  "metadatos": _merge(deltas, list(ENRICHMENT_FIELDS))}
+    full_bytes = len(pickle.dumps(full_state))
+    for delta in deltas.values():
+        assert len(pickle.dumps({"metadatos": delta})) * 10 < full_bytes
@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.state import ENRICHMENT_FIELDS
+from src.text_store import DOCUMENT_DETAIL_KEYS, split_payload
+from src.vector_store import LocalVectorStore
+
+ENRICHMENT = {
+    "summary_abstract": "Resumen abstractivo " * 50,
+    "summary_extractive": "Resumen extractivo " * 50,
+    "key_points": ["punto 1", "punto 2"],
+    "recommended_actions": ["revisar la cláusula 3"],
+    "keywords": ["contrato", "servicios"],
+    "topics": ["contratación"],
+    "subtopics": ["plazos"],
+    "structure": {"sections": 3},
+    "auto_index": ["CLÁUSULA PRIMERA"],
+    "structural_patterns": ["numeración"],
+    "references": ["art. 1"],
+    "insights": ["penalización por retraso"],
+}
+
+
+def _chunk(index: int) -> dict:
+    return {
+        "doc_id": "a" * 64,
+        "source": "uploaded_docs/contrato.pdf",
+        "chunk_index": index,
+        "char_start": index * 100,
+        "char_end": index * 100 + 100,
+        "text": f"Texto del fragmento {index}",
+        "metadata": {"title": "Contrato", "language": "es"},
+        "metadatos": dict(ENRICHMENT),
+    }
+
+
+def test_detail_keys_cover_every_agent_field():
+    for fields in ENRICHMENT_FIELDS.values():
+        assert set(fields) <= set(DOCUMENT_DETAIL_KEYS)
+
+
+def test_split_payload_keeps_enrichment_out_of_the_row():
+    meta = {**_chunk(0)["metadata"], **ENRICHMENT, "text": "hola", "doc_id": "a" * 64}
+    lean, text, details = split_payload(meta)
+    assert text == "hola"
+    assert details == ENRICHMENT
+    assert not set(lean) & (set(ENRICHMENT) | {"text"})
+
+
+def test_local_store_rows_are_lean(tmp_path):
+    store = LocalVectorStore("lean", root=str(tmp_path), text_store=True)
+    vectors = np.random.default_rng(0).standard_normal((3, 8)).astype(np.float32)
+    store.insert(vectors, [_chunk(i) for i in range(3)])
+
+    hit = store.search(vectors[:1], top_k=1)[0][0]
+    assert not set(hit["metadata"]) & set(ENRICHMENT)
+    assert "text" not in hit["metadata"]
+    assert hit["metadata"]["title"] == "Contrato"
+
+    # Los detalles se guardan una vez por documento y el texto se lee bajo demanda
+    assert store.text_store.get_details("a" * 64) == ENRICHMENT
+    assert store.fetch_texts([hit["id"]]) == {hit["id"]: "Texto del fragmento 0"}